@@ -1,66 +1,67 @@
-import json
+import sys
 
-with open('public_cases.json', 'r') as f:
-    data = json.load(f)
+import numpy as np
 
-print("=== ANALYZING 1000 PUBLIC CASES FOR PATTERNS ===")
+from case_store import format_segments, load_cases, segment
+
+# Columns from the case store (converted from JSON once), ratios computed once for all passes
+path = sys.argv[1] if len(sys.argv) > 1 else 'public_cases.json'
+cases = load_cases(path)
+days, miles, receipts = (np.asarray(column) for column in (cases.days, cases.miles, cases.receipts))
+miles_per_day = miles / days
+receipt_to_mile = np.divide(receipts, miles, out=np.zeros_like(receipts), where=miles > 0)
+# Unlabelled files (private_cases.json) have no expected outputs: show the inputs only
+labelled = cases.expected is not None
+if labelled:
+    expected = np.asarray(cases.expected)
+    rate_per_mile = np.divide(expected, miles, out=np.zeros_like(expected), where=miles > 0)
+
+
+def outcome(i):
+    return f" → ${expected[i]:7.2f}" if labelled else ''
+
+
+def rate(i):
+    return f", ${rate_per_mile[i]:.2f}/mi" if labelled else ''
+
+
+print(f"=== ANALYZING {len(cases)} CASES FROM {path} FOR PATTERNS ===")
 print()
 
 # High-intensity cases (>500 miles/day)
 print("🚗 HIGH-INTENSITY CASES (>500 miles/day):")
-high_intensity = []
-for i, case in enumerate(data):
-    days = case['input']['trip_duration_days']
-    miles = case['input']['miles_traveled'] 
-    receipts = case['input']['total_receipts_amount']
-    expected = case['expected_output']
-    miles_per_day = miles / days
-    if miles_per_day > 500:
-        high_intensity.append((i, days, miles, receipts, expected, miles_per_day))
+high_intensity = np.flatnonzero(miles_per_day > 500)
 
 print(f"Found {len(high_intensity)} high-intensity cases")
-for case in high_intensity[:8]:
-    i, days, miles, receipts, expected, mpd = case
-    rate = expected / miles if miles > 0 else 0
-    print(f"Case {i:3d}: {days}d, {miles:4d}mi, ${receipts:6.0f} → ${expected:7.2f} ({mpd:3.0f} mi/day, ${rate:.2f}/mi)")
+for i in high_intensity[:8]:
+    print(f"Case {i:3d}: {days[i]:g}d, {miles[i]:4g}mi, ${receipts[i]:6.0f}{outcome(i)} "
+          f"({miles_per_day[i]:3.0f} mi/day{rate(i)})")
 
 print()
 
 # Low-mileage, high-receipt cases
 print("💰 LOW-MILEAGE, HIGH-RECEIPT CASES:")
-low_mile_high_receipt = []
-for i, case in enumerate(data):
-    days = case['input']['trip_duration_days']
-    miles = case['input']['miles_traveled'] 
-    receipts = case['input']['total_receipts_amount']
-    expected = case['expected_output']
-    miles_per_day = miles / days
-    receipt_to_mile = receipts / miles if miles > 0 else 0
-    if miles_per_day < 100 and receipt_to_mile > 5 and receipts > 500:
-        low_mile_high_receipt.append((i, days, miles, receipts, expected, miles_per_day, receipt_to_mile))
+low_mile_high_receipt = np.flatnonzero((miles_per_day < 100) & (receipt_to_mile > 5) & (receipts > 500))
 
 print(f"Found {len(low_mile_high_receipt)} low-mileage, high-receipt cases")
-for case in low_mile_high_receipt[:8]:
-    i, days, miles, receipts, expected, mpd, rtm = case
-    print(f"Case {i:3d}: {days}d, {miles:3d}mi, ${receipts:6.0f} → ${expected:7.2f} ({int(mpd):2d} mi/day, ${rtm:.1f} $/mi)")
+for i in low_mile_high_receipt[:8]:
+    print(f"Case {i:3d}: {days[i]:g}d, {miles[i]:3g}mi, ${receipts[i]:6.0f}{outcome(i)} "
+          f"({int(miles_per_day[i]):2d} mi/day, ${receipt_to_mile[i]:.1f} $/mi)")
 
 print()
 
 # Normal cases for comparison
 print("📊 NORMAL CASES (100-300 mi/day, 1-5 $/mi):")
-normal = []
-for i, case in enumerate(data):
-    days = case['input']['trip_duration_days']
-    miles = case['input']['miles_traveled'] 
-    receipts = case['input']['total_receipts_amount']
-    expected = case['expected_output']
-    miles_per_day = miles / days
-    receipt_to_mile = receipts / miles if miles > 0 else 0
-    if 100 <= miles_per_day <= 300 and 1 <= receipt_to_mile <= 5:
-        normal.append((i, days, miles, receipts, expected, miles_per_day, receipt_to_mile))
+normal = np.flatnonzero((miles_per_day >= 100) & (miles_per_day <= 300)
+                        & (receipt_to_mile >= 1) & (receipt_to_mile <= 5))
 
 print(f"Found {len(normal)} normal cases")
-for case in normal[:8]:
-    i, days, miles, receipts, expected, mpd, rtm = case
-    rate = expected / miles if miles > 0 else 0
-    print(f"Case {i:3d}: {days}d, {miles:3d}mi, ${receipts:6.0f} → ${expected:7.2f} ({int(mpd):3d} mi/day, ${rate:.2f}/mi)") 
\ No newline at end of file
+for i in normal[:8]:
+    print(f"Case {i:3d}: {days[i]:g}d, {miles[i]:3g}mi, ${receipts[i]:6.0f}{outcome(i)} "
+          f"({int(miles_per_day[i]):3d} mi/day{rate(i)})")
+
+print()
+
+# Every case at once: route x miles/day band x receipts/mile band
+print("🧭 SEGMENTS BY ROUTE AND RATIO BANDS:")
+print(format_segments(segment(cases)))
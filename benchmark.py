@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Performance benchmarks with a JSON history and regression check.
+
+Measures:
+  * cold start of the run.sh one-shot path (fresh interpreter, one ML case)
+  * warm single-case latency of each EnsemblePredictor route
+  * engineer_features / engineer_features_array and each model's predict
+  * predict_batch throughput on 1k, 100k and 1M synthetic cases
+
+    python benchmark.py                       # run, append to benchmark_history.json, compare to baseline
+    python benchmark.py --sizes 1000 100000   # skip the 1M batch
+    python benchmark.py --save-baseline       # make this run the new baseline
+    python benchmark.py --via-run-sh          # time ./run.sh itself for the cold start (needs uv)
+
+A metric is flagged when it is worse than the baseline by more than
+--threshold (default 25%); the exit status is then 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from startup_report import ROUTE_CASES
+
+HISTORY_FILE = 'benchmark_history.json'
+BASELINE_FILE = 'benchmark_baseline.json'
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_THRESHOLD = 0.25
+
+# The one-shot body of run.sh (REIMBURSE_WORKER=0)
+_ONE_SHOT = """
+import sys
+from ensemble import EnsemblePredictor
+print(f'{EnsemblePredictor().predict(float(sys.argv[1]), float(sys.argv[2]), float(sys.argv[3])):.2f}')
+"""
+_COLD_CASE = ('3', '150', '100')  # routed to the ML ensemble
+
+
+def _median_ms(fn, repeat, number=1):
+    """Median wall time of `number` calls to fn, in ms per call"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    return statistics.median(samples)
+
+
+def _metric(value, unit='ms', better='lower'):
+    return {'value': round(value, 6), 'unit': unit, 'better': better}
+
+
+def synthetic_cases(n, seed=0):
+    """Random cases spanning the ranges seen in public_cases.json"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    days = rng.integers(1, 15, n).astype(float)
+    miles = np.round(rng.uniform(5, 1300, n))
+    receipts = np.round(rng.uniform(1, 2500, n), 2)
+    return days, miles, receipts
+
+
+def bench_cold_start(repeat, via_run_sh=False):
+    if via_run_sh:
+        command = ['./run.sh', *_COLD_CASE]
+        env = dict(os.environ, REIMBURSE_WORKER='0')
+    else:
+        command = [sys.executable, '-W', 'ignore', '-c', _ONE_SHOT, *_COLD_CASE]
+        env = None
+    run = lambda: subprocess.run(command, env=env, capture_output=True, check=True)
+    return {'cold_start.one_shot': _metric(_median_ms(run, repeat))}
+
+
+def bench_routes(predictor, repeat, number):
+    results = {}
+    for route, case in ROUTE_CASES:
+        predictor.predict(*case)  # warm up: load models, fill caches
+        results[f'route.{route}'] = _metric(_median_ms(lambda: predictor.predict(*case), repeat, number))
+    return results
+
+
+def bench_stages(predictor, repeat, number):
+    import pandas as pd
+    from feature_eng import engineer_features, engineer_features_array
+
+    days, miles, receipts = ROUTE_CASES[-1][1]
+    frame = pd.DataFrame({'trip_duration_days': [days], 'miles_traveled': [miles],
+                          'total_receipts_amount': [receipts]})
+    results = {
+        'features.engineer_features': _metric(_median_ms(lambda: engineer_features(frame), repeat, number)),
+        'features.engineer_features_array': _metric(
+            _median_ms(lambda: engineer_features_array(days, miles, receipts), repeat, number)),
+    }
+    X = predictor._model_frame(engineer_features_array(days, miles, receipts))
+    X_batch = predictor._model_frame(engineer_features_array(*synthetic_cases(1000)))
+    for name, model in predictor.models.items():
+        results[f'model.{name}.predict_1'] = _metric(_median_ms(lambda: model.predict(X), repeat, number))
+        results[f'model.{name}.predict_1k'] = _metric(_median_ms(lambda: model.predict(X_batch), repeat))
+    return results
+
+
+def bench_throughput(predictor, sizes, repeat):
+    results = {}
+    for n in sizes:
+        cases = synthetic_cases(n)
+        predictor.predict_batch(*(column[:1000] for column in cases))  # warm up
+        # Large batches run once; small ones are cheap enough to repeat
+        ms = _median_ms(lambda: predictor.predict_batch(*cases), repeat if n <= 100_000 else 1)
+        results[f'batch.{n}'] = _metric(n / (ms / 1000), unit='cases/s', better='higher')
+    return results
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=5, number=200, via_run_sh=False):
+    from ensemble import EnsemblePredictor
+
+    predictor = EnsemblePredictor()
+    results = {}
+    results.update(bench_cold_start(repeat, via_run_sh))
+    results.update(bench_routes(predictor, repeat, number))
+    results.update(bench_stages(predictor, repeat, number))
+    results.update(bench_throughput(predictor, sizes, repeat))
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Metrics worse than the baseline by more than `threshold`: [(name, baseline, current, change)]"""
+    regressions = []
+    for name, metric in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['value'], metric['value']
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = change > threshold if metric['better'] == 'lower' else change < -threshold
+        if worse:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=200, help='calls per single-case timing sample')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--via-run-sh', action='store_true', help='time ./run.sh for the cold start')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.repeat, args.number, args.via_run_sh)
+    record = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+    history = _load_json(args.history, [])
+    history.append(record)
+    _write_json(args.history, history)
+
+    baseline = _load_json(args.baseline, None)
+    for name, metric in results.items():
+        line = f"{name:40} {metric['value']:>14,.4f} {metric['unit']}"
+        if baseline and name in baseline['results']:
+            old = baseline['results'][name]['value']
+            line += f"   (baseline {old:,.4f})"
+        print(line)
+
+    if args.save_baseline:
+        _write_json(args.baseline, record)
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"\nNo baseline yet; run with --save-baseline to create {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline['results'], args.threshold)
+    if not regressions:
+        print(f"\nNo regressions against baseline {baseline['commit']} ({baseline['timestamp']})")
+        return 0
+    print(f"\nRegressions against baseline {baseline['commit']} (threshold {args.threshold:.0%}):")
+    for name, old, new, change in regressions:
+        print(f"  {name}: {old:,.4f} -> {new:,.4f} ({change:+.0%})")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
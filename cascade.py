@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""Cascade inference: answer ML-route cases from cheap estimates when they are good enough.
+
+Every ML-route case goes through up to three tiers, stopping at the first
+that can answer it:
+
+  caps     LinearRegression is exact and costs microseconds; with LightGBM and
+           RandomForest bounded by their smallest and largest leaves, the blend
+           lies in a known interval. When the post-ML caps map the whole
+           interval to one value (a cap binds wherever the models land), that
+           value is the prediction and no tree is evaluated.
+  partial  LightGBM in full plus the first `rf_trees` RandomForest trees. The
+           unseen trees are bounded by their leaf ranges; if the capped
+           interval still collapses the answer is exact. With a `tolerance`,
+           the spread of the evaluated trees also estimates the standard
+           error of the forest mean, and the case is answered when z standard
+           errors, scaled by the forest's blend weight, fit within it.
+  full     the remaining RandomForest trees, accumulated in the same order as
+           CompiledTrees.predict: bit-identical to the plain ensemble.
+
+By default (tolerance None) only exact answers are taken, so predictions equal
+the plain ensemble's. A tolerance is a statistical setting, not a bound: some
+estimates land further off. On first use z is raised from `z` until, on the
+ML-route inputs of CALIBRATION_FILES, the CALIBRATION_QUANTILE (99th
+percentile) deviation of the estimates the partial tier would take is within
+the tolerance. Without those files only exact answers are taken.
+
+Batches of fewer than PARTIAL_MIN_ROWS undecided rows, and single cases,
+skip the partial tier: on a few rows two tree walks cost more than one.
+LightGBM is not estimated from a prefix: boosted trees are corrections, and the
+trees left out change the sum by far more than any tolerance worth having.
+
+    predictor = EnsemblePredictor(compiled=True, cascade=Cascade())
+    predictor.cascade.stats()      # cases answered by each tier, calibrated z in 'status'
+
+    python cascade.py                   # tiers, deviation, score and speed across tolerances
+    python cascade.py --tolerance 2 5   # just these tolerances
+
+Needs compiled lgb, rf and lr models (a model bundle, or compiled=True);
+otherwise `status` says why and the full ensemble is used.
+"""
+import threading
+
+import numpy as np
+
+# Dollars the partial tier's estimates may deviate by at CALIBRATION_QUANTILE;
+# None takes exact answers only
+CASCADE_TOLERANCE = None
+# RandomForest trees evaluated before deciding whether to evaluate the rest
+CASCADE_RF_TREES = 10
+# Smallest number of standard errors the partial estimate must stay within tolerance for
+CONFIDENCE_Z = 2.0
+# Inputs and quantile a tolerance is calibrated on (see Cascade._calibrate)
+CALIBRATION_FILES = ('public_cases.json', 'private_cases.json')
+CALIBRATION_QUANTILE = 0.99
+# Fewer rows than this left after the caps tier skip the partial tier (see _predict_chunk)
+PARTIAL_MIN_ROWS = 64
+TIERS = ('caps', 'partial', 'full')
+
+
+class Cascade:
+    """Tiered ML-route scoring for EnsemblePredictor, with per-tier case counts"""
+
+    def __init__(self, tolerance=CASCADE_TOLERANCE, rf_trees=CASCADE_RF_TREES, z=CONFIDENCE_Z):
+        if rf_trees < 2:
+            raise ValueError("rf_trees must be at least 2 to estimate the tree spread")
+        self.tolerance = None if tolerance is None else float(tolerance)
+        self.rf_trees = rf_trees
+        self.z = float(z)
+        self.status = None
+        self.calibrated_z = None  # None while only exact answers are taken
+        self.counts = dict.fromkeys(TIERS, 0)
+        self._lock = threading.Lock()
+        self._bounds = None
+
+    @property
+    def key(self):
+        """Settings that change predictions, for cache namespaces"""
+        tolerance = 'exact' if self.tolerance is None else f'{self.tolerance:g}'
+        return f'{tolerance}/{self.rf_trees}/{self.z:g}'
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        return {'status': self.status, 'cases': total, **{tier: {'cases': count, 'share': count / total if total else 0.0}
+                                   for tier, count in counts.items()}}
+
+    def reset(self):
+        with self._lock:
+            self.counts = dict.fromkeys(TIERS, 0)
+
+    def _prepare(self, predictor):
+        """Per-model leaf bounds for the predictor's models, or None when they cannot be cascaded"""
+        from compiled_models import CompiledLinear, CompiledTrees
+
+        models = predictor.models
+        key = tuple(id(models.get(name)) for name in ('lgb', 'rf', 'lr'))
+        if self._bounds is not None and self._bounds[0] == key:
+            return self._bounds[1]
+        lgb, rf, lr = (models.get(name) for name in ('lgb', 'rf', 'lr'))
+        bounds = None
+        if not (isinstance(lgb, CompiledTrees) and isinstance(rf, CompiledTrees) and isinstance(lr, CompiledLinear)):
+            self.status = 'cascade needs compiled lgb, rf and lr models; using the full ensemble'
+        elif lgb.average or not rf.average or rf.n_trees <= self.rf_trees:
+            self.status = f'cascade needs boosted lgb and a RandomForest of more than {self.rf_trees} trees'
+        else:
+            lgb_low, lgb_high = lgb.tree_ranges()
+            rf_low, rf_high = rf.tree_ranges()
+            k = self.rf_trees
+            bounds = {
+                'lgb': (lgb_low.sum(), lgb_high.sum()),
+                'rf': (rf_low.sum() / rf.n_trees, rf_high.sum() / rf.n_trees),
+                # What the RandomForest trees after the first k can still add to the mean
+                'rf_rest': (rf_low[k:].sum() / rf.n_trees, rf_high[k:].sum() / rf.n_trees),
+            }
+            if self.tolerance is None:
+                self.calibrated_z = None
+                self.status = f'cascade on: exact answers only, {k} of {rf.n_trees} RandomForest trees'
+            else:
+                self.calibrated_z = self._calibrate(predictor, rf)
+                if self.calibrated_z is None:
+                    self.status = (f'cascade on: exact answers only, no calibration inputs for the '
+                                   f'${self.tolerance:g} tolerance ({", ".join(CALIBRATION_FILES)})')
+                else:
+                    self.status = (f'cascade on: tolerance ${self.tolerance:g} at the '
+                                   f'{CALIBRATION_QUANTILE:.0%} quantile, {k} of {rf.n_trees} '
+                                   f'RandomForest trees, z={self.calibrated_z:.3g}')
+        self._bounds = (key, bounds)
+        return bounds
+
+    def _calibrate(self, predictor, rf):
+        """Smallest z from self.z up (in 25% steps) meeting the tolerance on the calibration inputs.
+
+        The deviation of an estimate is taken before the caps, which never widen
+        it. Returns None when no calibration file exists.
+        """
+        import os
+
+        import rule_engine
+        from case_store import load_cases
+
+        columns = [[], [], []]
+        for path in CALIBRATION_FILES:
+            if os.path.exists(path):
+                cases = load_cases(path)
+                for column, values in zip(columns, (cases.days, cases.miles, cases.receipts)):
+                    column.append(np.asarray(values, dtype=np.float64))
+        if not columns[0]:
+            return None
+        days, miles, receipts = (np.concatenate(column) for column in columns)
+        ml = rule_engine.route_cases(days, miles, receipts) == rule_engine.ROUTE_ML
+        values = rf.tree_values(predictor._features(days[ml], miles[ml], receipts[ml]))
+        head = values[:self.rf_trees]
+        share = predictor.weights['rf'] / sum(predictor.weights[name] for name in ('lgb', 'rf', 'lr'))
+        deviation = share * np.abs(head.mean(axis=0) - values.mean(axis=0))
+        spread = share * _standard_error(head, rf.n_trees)
+        z = self.z
+        while True:
+            accepted = z * spread <= self.tolerance
+            if not accepted.any() or np.quantile(deviation[accepted], CALIBRATION_QUANTILE) <= self.tolerance:
+                return z
+            z *= 1.25
+
+    def predict(self, predictor, features, days, miles, receipts):
+        """Capped ML-route predictions for a feature matrix, or None to use the full ensemble"""
+        from compiled_models import _CHUNK_ROWS
+
+        bounds = self._prepare(predictor)
+        if bounds is None or not np.isfinite(features).all():
+            # Non-finite features get the plain ensemble's input checks and LR fallback
+            return None
+        result = np.empty(len(days))
+        counts = dict.fromkeys(TIERS, 0)
+        # Chunked like CompiledTrees.predict, which bounds the (trees x rows) matrices
+        for start in range(0, len(days), _CHUNK_ROWS):
+            rows = slice(start, start + _CHUNK_ROWS)
+            result[rows] = self._predict_chunk(predictor, bounds, features[rows], days[rows], miles[rows],
+                                               receipts[rows], counts)
+
+        with self._lock:
+            for tier, count in counts.items():
+                self.counts[tier] += count
+        if predictor.metrics is not None:
+            for tier, count in counts.items():
+                if count:
+                    predictor.metrics.increment('cascade_total', count, tier=tier)
+        return result
+
+    def decide_single(self, predictor, features, days, miles, receipts):
+        """Caps tier for one case of predict_normal(): the capped prediction, or None.
+
+        None means the full ensemble has to run (counted as the full tier);
+        single rows gain nothing from the partial tier, see PARTIAL_MIN_ROWS.
+        """
+        bounds = self._prepare(predictor)
+        if bounds is None or not np.isfinite(features).all():
+            return None
+        lr_pred = predictor.models['lr'].predict(features)[0]
+        ceiling, floor = predictor._ml_cap_limits(days, miles, receipts)
+        w_lgb, w_rf, w_lr = (predictor.weights[name] for name in ('lgb', 'rf', 'lr'))
+        ends = [max(min((w_lgb * lgb + w_rf * rf + w_lr * lr_pred) / (w_lgb + w_rf + w_lr), ceiling), floor)
+                for lgb, rf in zip(bounds['lgb'], bounds['rf'])]
+        tier = 'caps' if ends[0] == ends[1] else 'full'
+        with self._lock:
+            self.counts[tier] += 1
+        if predictor.metrics is not None:
+            predictor.metrics.increment('cascade_total', tier=tier)
+        return float(ends[0]) if tier == 'caps' else None
+
+    def _predict_chunk(self, predictor, bounds, features, days, miles, receipts, counts):
+        models = predictor.models
+        lgb, rf, lr = models['lgb'], models['rf'], models['lr']
+        w_lgb, w_rf, w_lr = (predictor.weights[name] for name in ('lgb', 'rf', 'lr'))
+        w_total = w_lgb + w_rf + w_lr
+        ceiling, floor = predictor._ml_cap_limits(days, miles, receipts)
+
+        def capped_blend(lgb_pred, rf_pred, lr_pred, rows=slice(None)):
+            blended = (w_lgb * lgb_pred + w_rf * rf_pred + w_lr * lr_pred) / w_total
+            return np.maximum(np.minimum(blended, ceiling[rows]), floor[rows])
+
+        result = np.empty(len(days))
+        lr_pred = lr.predict(features)
+
+        # Tier 1: every possible tree output gives the same capped answer
+        low = capped_blend(bounds['lgb'][0], bounds['rf'][0], lr_pred)
+        high = capped_blend(bounds['lgb'][1], bounds['rf'][1], lr_pred)
+        decided = low == high
+        result[decided] = low[decided]
+        rest = np.flatnonzero(~decided)
+        counts['caps'] += len(days) - len(rest)
+        if not len(rest):
+            return result
+
+        X = features[rest]
+        lgb_pred = lgb.predict(X)
+        lr_pred = lr_pred[rest]
+        k = self.rf_trees
+        if len(rest) < PARTIAL_MIN_ROWS:
+            # Tree walks cost per level, not per tree, on a few rows: stopping after
+            # k trees saves less than the second walk costs
+            accepted = np.zeros(len(rest), dtype=bool)
+            partial, tail = np.zeros(len(rest)), rf.tree_values(X)
+        else:
+            # Tier 2: full LightGBM, first k RandomForest trees
+            head = rf.tree_values(X, slice(0, k))
+            partial = np.zeros(len(rest))
+            for tree_values in head:
+                partial += tree_values
+            # The trees not evaluated can only move the forest mean within their leaf ranges
+            low = capped_blend(lgb_pred, partial / rf.n_trees + bounds['rf_rest'][0], lr_pred, rest)
+            high = capped_blend(lgb_pred, partial / rf.n_trees + bounds['rf_rest'][1], lr_pred, rest)
+            exact = low == high
+            if self.calibrated_z is None:
+                confident = False
+            else:
+                confident = self.calibrated_z * _standard_error(head, rf.n_trees) * w_rf / w_total <= self.tolerance
+            estimate = capped_blend(lgb_pred, partial / k, lr_pred, rest)
+            accepted = exact | confident
+            result[rest[accepted]] = np.where(exact, low, estimate)[accepted]
+            counts['partial'] += int(accepted.sum())
+            tail = None if accepted.all() else rf.tree_values(X[~accepted], slice(k, None))
+
+        # Tier 3: the remaining trees, summed and blended exactly as by the plain ensemble
+        full = ~accepted
+        if full.any():
+            total = partial[full]
+            for tree_values in tail:
+                total += tree_values
+            total /= rf.n_trees
+            blended = np.average(np.asarray([lgb_pred[full], total, lr_pred[full]]), axis=0,
+                                 weights=[w_lgb, w_rf, w_lr])
+            rows = rest[full]
+            result[rows] = np.maximum(np.minimum(blended, ceiling[rows]), floor[rows])
+            counts['full'] += len(rows)
+        return result
+
+
+def _standard_error(head, n_trees):
+    # Of the mean of the first k trees as an estimate of the mean of all n_trees,
+    # treating them as drawn without replacement from the forest
+    k = len(head)
+    return head.std(axis=0, ddof=1) / np.sqrt(k) * np.sqrt((n_trees - k) / (n_trees - 1))
+
+
+def cascade_from_env(environ=None):
+    """Cascade configured by REIMBURSE_CASCADE (1 = exact answers only, <dollars> = tolerance), or None"""
+    import os
+
+    value = (environ if environ is not None else os.environ).get('REIMBURSE_CASCADE', '').strip()
+    if not value or value.lower() in ('0', 'off', 'false'):
+        return None
+    if value.lower() in ('1', 'on', 'true'):
+        return Cascade()
+    return Cascade(tolerance=float(value))
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    import rule_engine
+    from case_store import load_cases
+    from ensemble import EnsemblePredictor
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cases', nargs='?', default='public_cases.json')
+    parser.add_argument('--tolerance', type=float, nargs='+', default=[0.5, 1, 2, 5, 10, 20])
+    parser.add_argument('--rf-trees', type=int, default=CASCADE_RF_TREES)
+    parser.add_argument('--z', type=float, default=CONFIDENCE_Z)
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs per setting (best is reported)')
+    args = parser.parse_args(argv)
+
+    cases = load_cases(args.cases)
+    days, miles, receipts = (np.asarray(c, dtype=np.float64) for c in (cases.days, cases.miles, cases.receipts))
+    ml = rule_engine.route_cases(days, miles, receipts) == rule_engine.ROUTE_ML
+    days, miles, receipts = days[ml], miles[ml], receipts[ml]
+    expected = np.asarray(cases.expected)[ml] if cases.expected is not None else None
+
+    single_cases = list(zip(days[:200].tolist(), miles[:200].tolist(), receipts[:200].tolist()))
+
+    def timed(predictor):
+        """Predictions, best batch time, best time per predict_normal() call"""
+        batch = single = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            pred = predictor._predict_ml_batch(days, miles, receipts)
+            batch = min(batch, time.perf_counter() - start)
+            start = time.perf_counter()
+            for case in single_cases:
+                predictor.predict_normal(*case)
+            single = min(single, (time.perf_counter() - start) / max(1, len(single_cases)))
+        return pred, batch, single
+
+    baseline = EnsemblePredictor(compiled=True, lazy=False)
+    reference, base_time, base_single = timed(baseline)
+    print(f"{args.cases}: {len(days)} ML-route cases, RandomForest prefix {args.rf_trees} trees, z={args.z:g}")
+    header = (f"{'tolerance':>9} {'z':>6} {'caps':>6} {'partial':>8} {'full':>6} {'mean dev':>9} {'p99 dev':>8} "
+              f"{'max dev':>8} {'batch ms':>9} {'single us':>10}")
+    if expected is not None:
+        header += f" {'mean err':>9} {'exact':>6}"
+    print(header)
+
+    def row(label, z, pred, elapsed, single, shares):
+        deviation = np.abs(pred - reference)
+        line = (f"{label:>9} {z:>6} {shares[0]:6.1%} {shares[1]:8.1%} {shares[2]:6.1%} {deviation.mean():9.3f} "
+                f"{np.quantile(deviation, CALIBRATION_QUANTILE):8.2f} {deviation.max():8.2f} "
+                f"{elapsed * 1000:9.1f} {single * 1e6:10.0f}")
+        if expected is not None:
+            error = np.abs(pred - expected)
+            line += f" {error.mean():9.2f} {int((error < 0.01).sum()):6d}"
+        print(line)
+
+    row('off', '', reference, base_time, base_single, (0.0, 0.0, 1.0))
+    for tolerance in [None] + args.tolerance:
+        predictor = EnsemblePredictor(compiled=True, lazy=False,
+                                      cascade=Cascade(tolerance, args.rf_trees, args.z))
+        cascade = predictor.cascade
+        if cascade._prepare(predictor) is None:
+            print(cascade.status)
+            return 1
+        pred, elapsed, single = timed(predictor)
+        cascade.reset()
+        predictor._predict_ml_batch(days, miles, receipts)
+        stats = cascade.stats()
+        row('exact' if tolerance is None else f'${tolerance:g}',
+            '' if cascade.calibrated_z is None else f'{cascade.calibrated_z:.3g}',
+            pred, elapsed, single, [stats[tier]['share'] for tier in TIERS])
+
+    # By default only exact answers are taken: the result must equal the plain
+    # ensemble bit for bit. Long trips at 300-600 miles/day exercise the caps tier.
+    rng = np.random.default_rng(0)
+    long_days = rng.integers(1, 15, 5000).astype(float)
+    long_miles = long_days * rng.uniform(300, 600, 5000)
+    long_receipts = rng.uniform(0, 2500, 5000)
+    long_haul = rule_engine.route_cases(long_days, long_miles, long_receipts) == rule_engine.ROUTE_ML
+    failed = 0
+    for label, inputs in ((args.cases, (days, miles, receipts)),
+                          ('long trips', (long_days[long_haul], long_miles[long_haul], long_receipts[long_haul]))):
+        strict = EnsemblePredictor(compiled=True, lazy=False, cascade=Cascade(None, args.rf_trees, args.z))
+        exact = strict._predict_ml_batch(*inputs)
+        single = np.array([strict.predict_normal(*case) for case in zip(*(c[:500].tolist() for c in inputs))])
+        plain = baseline._predict_ml_batch(*inputs)
+        mismatched = int((exact != plain).sum() + (single != plain[:500]).sum())
+        stats = strict.cascade.stats()
+        print(f"exact answers only, {label}: {stats['caps']['share']:.1%} caps, {stats['partial']['share']:.1%} "
+              f"partial, {mismatched} of {len(plain) + len(single)} differ from the full ensemble")
+        failed += mismatched
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Incremental reading of case files too large to json.load at once.
+
+public_cases.json and private_cases.json are a single JSON array of case
+objects. iter_json_array() decodes one element at a time from fixed-size
+reads, so memory stays bounded by the read size plus the largest element,
+however long the array is. Claim exports in NDJSON (one object per line) or
+CSV (one case per row, field names in the header) are read the same way by
+iter_records().
+"""
+import csv
+import json
+import os
+
+READ_SIZE = 1 << 16
+_WHITESPACE = ' \t\r\n'
+
+
+def iter_json_array(f, read_size=READ_SIZE):
+    """Yield the elements of the JSON array in text file `f` one by one"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+    # 'start': expect '['; 'first'/'item': expect a value ('first' also allows ']'); 'next': ',' or ']'
+    state = 'start'
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise ValueError('Unexpected end of file inside the JSON array')
+            chunk = f.read(read_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise ValueError(f'Expected a JSON array, found {char!r}')
+            pos += 1
+            state = 'first'
+        elif char == ']' and state in ('first', 'next'):
+            return
+        elif state == 'next':
+            if char != ',':
+                raise ValueError(f'Expected , or ] between array elements, found {char!r}')
+            pos += 1
+            state = 'item'
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # In a valid array an element is followed by whitespace, ',' or ']';
+                # anything else (say '.5' after '22') may still be part of it
+                complete = eof or (end < len(buffer) and buffer[end] in _WHITESPACE + ',]')
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                # The element (or a trailing number) may continue in the next read
+                chunk = f.read(read_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield value
+            pos = end
+            state = 'next'
+
+
+def iter_case_chunks(path, chunk_size):
+    """Yield (days, miles, receipts) lists of at most `chunk_size` cases, in file order.
+
+    Accepts both the private layout (flat objects) and the public one
+    (objects with an 'input' key).
+    """
+    days, miles, receipts = [], [], []
+    with open(path, 'r') as f:
+        for case in iter_json_array(f):
+            case = case.get('input', case) if isinstance(case, dict) else case
+            if not isinstance(case, dict):
+                case = {}
+            # A missing field becomes NaN downstream and fails just that case
+            days.append(case.get('trip_duration_days'))
+            miles.append(case.get('miles_traveled'))
+            receipts.append(case.get('total_receipts_amount'))
+            if len(days) == chunk_size:
+                yield days, miles, receipts
+                days, miles, receipts = [], [], []
+    if days:
+        yield days, miles, receipts
+
+
+FORMATS = ('json', 'ndjson', 'csv')
+_EXTENSIONS = {'.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv'}
+
+
+def detect_format(path):
+    """Record format from the file extension: json (array), ndjson or csv"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in _EXTENSIONS:
+        raise ValueError(f"Cannot tell the format of {path!r}; expected one of {', '.join(_EXTENSIONS)}")
+    return _EXTENSIONS[extension]
+
+
+def iter_ndjson(f):
+    """Yield the object on each non-blank line of text file `f`"""
+    for number, line in enumerate(f, start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'Line {number} is not valid JSON: {e}') from e
+
+
+def iter_records(f, fmt):
+    """Yield the case records of text file `f` in format `fmt` (see FORMATS).
+
+    CSV rows come back as dicts of strings, keyed by the header line.
+    """
+    if fmt == 'json':
+        return iter_json_array(f)
+    if fmt == 'ndjson':
+        return iter_ndjson(f)
+    if fmt == 'csv':
+        return csv.DictReader(f)
+    raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+
+def _number(value):
+    # A missing or malformed field becomes NaN downstream, which predict_batch
+    # treats like predict() does (a NaN day count or receipts fails just that case)
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def case_inputs(record):
+    """(days, miles, receipts) of a record, flat or with an 'input' key; bad fields are None.
+
+    Raises ValueError for a record that is not a case object (say `[1, 2]` on an NDJSON line).
+    """
+    case = record.get('input', record) if isinstance(record, dict) else record
+    if not isinstance(case, dict):
+        raise ValueError(f"Record is not a case object: {json.dumps(record)[:80]}")
+    return (_number(case.get('trip_duration_days')), _number(case.get('miles_traveled')),
+            _number(case.get('total_receipts_amount')))
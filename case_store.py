@@ -0,0 +1,231 @@
+"""Columnar case store: a case file's inputs and expected outputs, converted from JSON once.
+
+The first request for a case file streams it through case_io.iter_json_array
+into typed columns and saves them under .case_store/ as one structured .npy
+array; later requests memory-map it, so even millions of historical claims
+load instantly. Entries are keyed on a hash of the file contents (stale ones
+are removed), like feature_store.py, which builds its entries from here.
+
+    cases = load_cases('public_cases.json')
+    cases.days, cases.miles, cases.receipts   # float64 memmapped columns
+    cases.expected                            # expected_output column, or None for private cases
+
+    segment(cases)                            # counts per route x ratio band, in one pass
+    segment(cases, predictions)               # ... with error statistics per segment
+
+    python case_store.py build [case files...]              # build entries and print them
+    python case_store.py segment public_cases.json [--predict]
+"""
+import hashlib
+import json
+import os
+import shutil
+from array import array
+
+import numpy as np
+
+from feature_store import entry_prefix
+
+STORE_DIR = '.case_store'
+# Bump when the on-disk layout changes
+STORE_VERSION = 1
+CASE_DTYPE = np.dtype([('days', '<f8'), ('miles', '<f8'), ('receipts', '<f8'), ('expected', '<f8')])
+
+# Band edges for segment(): miles per day, and receipts per mile
+MILES_PER_DAY_BANDS = (25, 50, 100, 200, 300, 400, 500, 600, 800)
+RECEIPTS_PER_MILE_BANDS = (0.5, 1, 2, 3, 5, 8, 10, 20)
+# Same thresholds as evaluate.py
+EXACT_THRESHOLD = 0.01
+CLOSE_THRESHOLD = 1.0
+
+
+class CaseSet:
+    """Memory-mapped inputs (and expected outputs, when known) of one case file"""
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = meta
+        self.data = np.load(os.path.join(directory, 'cases.npy'), mmap_mode='r')
+        self.days = self.data['days']
+        self.miles = self.data['miles']
+        self.receipts = self.data['receipts']
+        self.expected = self.data['expected'] if meta['has_expected'] else None
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def key(self):
+        return self.meta['key']
+
+    def inputs(self):
+        """(n_cases, 3) float64 array in feature_eng.INPUT_COLUMNS order"""
+        return np.column_stack([self.days, self.miles, self.receipts])
+
+
+def store_key(path):
+    """Hash of the case file contents and the store layout"""
+    digest = hashlib.sha256(f'case-store-v{STORE_VERSION}\0'.encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _number(value):
+    # A missing field is NaN, as in the NaN-failing inputs predict_batch expects
+    return float('nan') if value is None else float(value)
+
+
+def _build(path, directory, key):
+    from case_io import iter_json_array
+
+    columns = {name: array('d') for name in CASE_DTYPE.names}
+    has_expected = True
+    with open(path, 'r') as f:
+        for case in iter_json_array(f):
+            inputs = case.get('input', case)
+            columns['days'].append(_number(inputs.get('trip_duration_days')))
+            columns['miles'].append(_number(inputs.get('miles_traveled')))
+            columns['receipts'].append(_number(inputs.get('total_receipts_amount')))
+            columns['expected'].append(_number(case.get('expected_output')))
+            has_expected = has_expected and 'expected_output' in case
+    data = np.empty(len(columns['days']), dtype=CASE_DTYPE)
+    for name, column in columns.items():
+        data[name] = np.frombuffer(column, dtype=np.float64) if column else []
+
+    # Write into a scratch directory and rename, so readers never see half an entry
+    tmp = f'{directory}.tmp{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'cases.npy'), data)
+    meta = {'key': key, 'source': os.path.abspath(path), 'rows': len(data),
+            'has_expected': bool(len(data)) and has_expected, 'version': STORE_VERSION}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    try:
+        os.rename(tmp, directory)
+    except OSError:
+        # Another process built the same entry first; theirs is identical
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_cases(path='public_cases.json', store_dir=STORE_DIR):
+    """CaseSet for a case file, building the store entry if it is missing or stale"""
+    key = store_key(path)
+    prefix = entry_prefix(path)
+    directory = os.path.join(store_dir, prefix + key[:16])
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        os.makedirs(store_dir, exist_ok=True)
+        _build(path, directory, key)
+        # Entries for older versions of this file are dead
+        for name in os.listdir(store_dir):
+            stale = os.path.join(store_dir, name)
+            if name.startswith(prefix) and len(name) == len(prefix) + 16 and stale != directory:
+                shutil.rmtree(stale, ignore_errors=True)
+    with open(os.path.join(directory, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    return CaseSet(directory, meta)
+
+
+def _band_labels(edges, unit):
+    labels = [f'<{edges[0]:g}']
+    labels += [f'{low:g}-{high:g}' for low, high in zip(edges, edges[1:])]
+    return [f'{label} {unit}' for label in labels + [f'>={edges[-1]:g}']]
+
+
+def segment(cases, predictions=None, mpd_bands=MILES_PER_DAY_BANDS, rpm_bands=RECEIPTS_PER_MILE_BANDS):
+    """Bucket every case by route, miles/day band and receipts/mile band in one pass.
+
+    Returns one dict per non-empty segment, in route then band order, with the
+    case count and mean expected output (when known) and, given predictions,
+    the mean and max absolute error and the exact (±$0.01) and close (±$1.00)
+    match counts.
+    """
+    import rule_engine
+
+    days, miles, receipts = (np.asarray(c, dtype=np.float64) for c in (cases.days, cases.miles, cases.receipts))
+    routes = rule_engine.route_cases(days, miles, receipts)
+    # Same ratios as the rule routes
+    miles_per_day = miles / np.maximum(days, 1)
+    receipts_per_mile = receipts / np.maximum(miles, 1)
+    n_mpd, n_rpm = len(mpd_bands) + 1, len(rpm_bands) + 1
+    cell = ((routes * n_mpd + np.searchsorted(mpd_bands, miles_per_day, side='right')) * n_rpm
+            + np.searchsorted(rpm_bands, receipts_per_mile, side='right'))
+    n_cells = len(rule_engine.ROUTE_NAMES) * n_mpd * n_rpm
+
+    counts = np.bincount(cell, minlength=n_cells)
+    stats = {}
+    if cases.expected is not None:
+        stats['mean_expected'] = np.bincount(cell, weights=cases.expected, minlength=n_cells)
+    if predictions is not None:
+        if cases.expected is None:
+            raise ValueError("Error statistics need a case file with expected outputs")
+        error = np.abs(np.asarray(predictions, dtype=np.float64) - cases.expected)
+        stats['mean_error'] = np.bincount(cell, weights=error, minlength=n_cells)
+        max_error = np.zeros(n_cells)
+        np.maximum.at(max_error, cell, error)
+        stats['exact'] = np.bincount(cell, weights=error < EXACT_THRESHOLD, minlength=n_cells)
+        stats['close'] = np.bincount(cell, weights=error < CLOSE_THRESHOLD, minlength=n_cells)
+
+    mpd_labels = _band_labels(mpd_bands, 'mi/day')
+    rpm_labels = _band_labels(rpm_bands, '$/mi')
+    rows = []
+    for index in np.flatnonzero(counts).tolist():
+        route, rest = divmod(index, n_mpd * n_rpm)
+        count = int(counts[index])
+        row = {'route': rule_engine.ROUTE_NAMES[route], 'miles_per_day': mpd_labels[rest // n_rpm],
+               'receipts_per_mile': rpm_labels[rest % n_rpm], 'cases': count}
+        for name, values in stats.items():
+            total = float(values[index])
+            row[name] = total / count if name.startswith('mean') else int(total)
+        if predictions is not None:
+            row['max_error'] = float(max_error[index])
+        rows.append(row)
+    return rows
+
+
+def format_segments(rows):
+    columns = [name for name in ('mean_expected', 'mean_error', 'max_error', 'exact', 'close') if name in rows[0]] \
+        if rows else []
+    lines = [f"{'route':26} {'miles/day':15} {'receipts/mile':14} {'cases':>7} "
+             + ' '.join(f'{name:>13}' for name in columns)]
+    for row in rows:
+        lines.append(f"{row['route']:26} {row['miles_per_day']:15} {row['receipts_per_mile']:14} {row['cases']:7d} "
+                     + ' '.join(f'{row[name]:13.2f}' if isinstance(row[name], float) else f'{row[name]:13d}'
+                                for name in columns))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', nargs='?', choices=('build', 'segment'), default='build')
+    parser.add_argument('cases', nargs='*', default=['public_cases.json', 'private_cases.json'])
+    parser.add_argument('--predict', action='store_true',
+                        help='segment: add error statistics for the ensemble predictions')
+    args = parser.parse_args(argv)
+
+    for path in args.cases:
+        start = time.perf_counter()
+        cases = load_cases(path)
+        elapsed = time.perf_counter() - start
+        if args.command == 'build':
+            target = 'with expected outputs' if cases.expected is not None else 'no expected outputs'
+            print(f"{path}: {len(cases)} cases, {target}, key {cases.key[:16]} "
+                  f"({elapsed * 1000:.0f} ms) -> {cases.directory}")
+            continue
+        predictions = None
+        if args.predict:
+            from ensemble import EnsemblePredictor
+            predictions = EnsemblePredictor(compiled=True).predict_batch(cases.days, cases.miles, cases.receipts)
+        start = time.perf_counter()
+        rows = segment(cases, predictions)
+        print(f"{path}: {len(cases)} cases in {len(rows)} segments ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        print(format_segments(rows))
+
+
+if __name__ == '__main__':
+    main()
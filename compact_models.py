@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""Compact the tree models into a smaller bundle: fewer nodes, float32 arrays, fewer trees.
+
+Starts from the compiled models of ensemble.bundle (or the pickles) and
+writes a model bundle (see model_bundle.py) after up to three steps:
+
+  merge     rebuild every tree without the splits its ancestors already decide,
+            collapsing subtrees whose leaves agree within --merge-tolerance
+            (model output units; 0, the default, is lossless) into one leaf at
+            the midpoint of their range. Missing-value arrays are dropped when
+            no split uses them.
+  float32   store thresholds and leaf values as float32, per model and array,
+            keeping each conversion only when every public and private case
+            prints the same amount as before it (so eval.sh's ±$0.01 exact
+            matches cannot change). RandomForest thresholds are rounded down, which is
+            exact: its splits compare float32-cast inputs.
+  drop      remove trees one at a time, always the one that moves the final
+            prediction least, while no public ML-route case moves by more than
+            --drop-tolerance dollars from the models before this step and the
+            public exact-match count does not fall
+
+    python compact_models.py                                  # merge + float32
+    python compact_models.py --drop-tolerance 0.5 --merge-tolerance 1
+    python compact_models.py --no-float32 --output ensemble.bundle
+
+The report gives, for the pickles, the source bundle and each step: trees,
+nodes, file size, load time and memory in a fresh interpreter, and the
+deviation from the source models on public and private cases with the public
+score. Bundles are memory-mapped: 'shared' is page cache every worker on a
+host shares, 'private' what each worker holds on its own.
+
+Serve the result with EnsemblePredictor(bundle=...) or by writing it over
+ensemble.bundle; the model checksum changes, so cached predictions and lookup
+grids are not reused, and a surrogate distilled from the old models is not used.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import compiled_models
+import model_bundle
+import rule_engine
+from compiled_models import MISSING_NONE, CompiledTrees
+from ensemble import BUNDLE_FILE, EnsemblePredictor
+
+COMPACT_FILE = 'ensemble.compact.bundle'
+CASE_FILES = ('public_cases.json', 'private_cases.json')
+TREE_MODELS = ('lgb', 'rf')
+
+
+def compact_trees(model, trees=None, tolerance=0.0):
+    """Rebuild the selected trees (default all, in order) without redundant structure.
+
+    A split is dropped when the splits above it on the same feature already
+    decide its direction; a subtree whose leaf values span at most `tolerance`
+    becomes one leaf (at the middle of the span, so no prediction moves by more
+    than tolerance / 2 per tree). Splits with missing-value handling neither
+    get dropped nor constrain the splits below them.
+    """
+    trees = range(model.n_trees) if trees is None else trees
+    handles_missing = model.missing_type is not None
+    builder = compiled_models._TreeBuilder()
+
+    def rebuild(node, bounds):
+        """(low, high, subtree) for a node; subtree is a leaf value or a split tuple"""
+        if model.is_leaf[node]:
+            value = float(model.value[node])
+            return value, value, value
+        feature, threshold = int(model.feature[node]), float(model.threshold[node])
+        plain = not handles_missing or model.missing_type[node] == MISSING_NONE
+        low, high = bounds.get(feature, (-np.inf, np.inf))
+        if plain and high <= threshold:
+            return rebuild(model.left[node], bounds)
+        if plain and low >= threshold:
+            return rebuild(model.right[node], bounds)
+        left_bounds, right_bounds = bounds, bounds
+        if plain:
+            left_bounds = {**bounds, feature: (low, min(high, threshold))}
+            right_bounds = {**bounds, feature: (max(low, threshold), high)}
+        left = rebuild(model.left[node], left_bounds)
+        right = rebuild(model.right[node], right_bounds)
+        span = (min(left[0], right[0]), max(left[1], right[1]))
+        if span[1] - span[0] <= tolerance:
+            return span[0], span[1], (span[0] + span[1]) / 2
+        return span[0], span[1], (node, left[2], right[2])
+
+    def emit(subtree, depth):
+        builder.max_depth = max(builder.max_depth, depth)
+        if not isinstance(subtree, tuple):
+            return builder.add_node(value=subtree)
+        node, left, right = subtree
+        index = builder.add_node(
+            feature=int(model.feature[node]), threshold=float(model.threshold[node]),
+            default_left=bool(model.default_left[node]) if handles_missing else False,
+            missing_type=int(model.missing_type[node]) if handles_missing else MISSING_NONE)
+        builder.left[index] = emit(left, depth + 1)
+        builder.right[index] = emit(right, depth + 1)
+        return index
+
+    for tree in trees:
+        builder.roots.append(emit(rebuild(model.roots[tree], {})[2], 0))
+    return CompiledTrees(builder.feature, np.array(builder.threshold, dtype=model.threshold.dtype),
+                         builder.left, builder.right, np.array(builder.value, dtype=model.value.dtype),
+                         builder.roots, builder.max_depth, average=model.average,
+                         float32_inputs=model.float32_inputs,
+                         default_left=builder.default_left if handles_missing else None,
+                         missing_type=builder.missing_type if handles_missing else None)
+
+
+def to_float32(model, array):
+    """Copy of a CompiledTrees with its 'threshold' or 'value' array stored as float32"""
+    arrays = dict(model.arrays())
+    values = np.asarray(arrays[array], dtype=np.float64)
+    converted = values.astype(np.float32)
+    if array == 'threshold' and model.float32_inputs:
+        # Largest float32 <= threshold: float32 inputs split exactly as before
+        above = converted.astype(np.float64) > values
+        converted[above] = np.nextafter(converted[above], np.float32(-np.inf))
+    arrays[array] = converted
+    return CompiledTrees.from_arrays(arrays)
+
+
+class Evaluation:
+    """Final predictions of the source models on the case files, to compare candidates with"""
+
+    def __init__(self, source, weights):
+        from evaluate import load_cases
+        from feature_store import load_features
+
+        self.weights = weights
+        self.inputs = {path: tuple(np.asarray(load_features(path).inputs).T) for path in CASE_FILES}
+        self.cases = load_cases(CASE_FILES[0])
+        self.expected = np.array([case['expected_output'] for case in self.cases], dtype=float)
+        self.reference = {path: self.predict(source, path) for path in CASE_FILES}
+        # Only these public cases reach the models (see drop_trees)
+        days, miles, receipts = self.inputs[CASE_FILES[0]]
+        self.ml = rule_engine.route_cases(days, miles, receipts) == rule_engine.ROUTE_ML
+
+    def predictor(self, models):
+        predictor = EnsemblePredictor(compiled=True, bundle=None)
+        predictor.models = models
+        predictor.weights = dict(self.weights)
+        return predictor
+
+    def predict(self, models, path):
+        return self.predictor(models).predict_batch(*self.inputs[path])
+
+    def printed(self, models):
+        """Case-file outputs rounded to cents, as run.sh prints them"""
+        return {path: np.round(self.predict(models, path), 2) for path in CASE_FILES}
+
+    def changed_outputs(self, models, printed):
+        """Case-file outputs that print differently from `printed`"""
+        return sum(int((self.printed(models)[path] != printed[path]).sum()) for path in CASE_FILES)
+
+    def deviation(self, models):
+        report = {}
+        for path in CASE_FILES:
+            predictions = self.predict(models, path)
+            diff = np.abs(predictions - self.reference[path])
+            report[path] = {'mean': float(diff.mean()), 'max': float(diff.max()),
+                            'changed_outputs': int((np.round(predictions, 2)
+                                                    != np.round(self.reference[path], 2)).sum())}
+        return report
+
+    def public_score(self, models):
+        from evaluate import _format_outputs, score_outputs
+
+        outputs = _format_outputs(self.predict(models, CASE_FILES[0]))
+        metrics = score_outputs(self.cases, outputs, [None] * len(self.cases))
+        return {'score': float(metrics['score']), 'exact': int(metrics['exact_matches'])}
+
+
+def apply_float32(models, evaluation):
+    """float32 thresholds/values wherever no printed output changes; returns (models, {array: changed})"""
+    printed = evaluation.printed(models)
+    models, tried = dict(models), {}
+    for name in TREE_MODELS:
+        for array in ('threshold', 'value'):
+            candidate = {**models, name: to_float32(models[name], array)}
+            tried[f'{name}.{array}'] = changed = evaluation.changed_outputs(candidate, printed)
+            if not changed:
+                models = candidate
+    return models, tried
+
+
+def drop_trees(models, evaluation, tolerance):
+    """Greedily drop trees within tolerance dollars on the public ML-route cases; returns (models, dropped)"""
+    predictor = evaluation.predictor(models)
+    days, miles, receipts = (column[evaluation.ml] for column in evaluation.inputs[CASE_FILES[0]])
+    X = predictor._features(days, miles, receipts)
+    # Relative to the models given, so earlier lossy steps do not use up the tolerance
+    reference = evaluation.predict(models, CASE_FILES[0])[evaluation.ml]
+    expected = evaluation.expected[evaluation.ml]
+    exact_before = int((np.abs(np.round(reference, 2) - expected) < 0.01).sum())
+    ceiling, floor = predictor._ml_cap_limits(days, miles, receipts)
+    weights = np.array([predictor.weights[name] for name in ('lgb', 'rf', 'lr')])
+    lr_pred = models['lr'].predict(X)
+
+    values = {name: models[name].tree_values(X).astype(np.float64) for name in TREE_MODELS}
+    keep = {name: np.ones(models[name].n_trees, dtype=bool) for name in TREE_MODELS}
+
+    def outputs(lgb_sum, rf_sum, rf_count):
+        model_out = {'lgb': lgb_sum, 'rf': rf_sum / rf_count}
+        blended = (weights[0] * model_out['lgb'] + weights[1] * model_out['rf'] + weights[2] * lr_pred) \
+            / weights.sum()
+        return np.maximum(np.minimum(blended, ceiling), floor)
+
+    while True:
+        sums = {name: values[name][keep[name]].sum(axis=0) for name in TREE_MODELS}
+        rf_count = keep['rf'].sum()
+        candidates = []
+        for name in TREE_MODELS:
+            trees = np.flatnonzero(keep[name])
+            if len(trees) <= 1:
+                continue
+            # Every remaining tree's removal at once: (trees, cases)
+            if name == 'lgb':
+                pred = outputs(sums['lgb'] - values['lgb'][trees], sums['rf'], rf_count)
+            else:
+                pred = outputs(sums['lgb'], sums['rf'] - values['rf'][trees], rf_count - 1)
+            worst = np.abs(pred - reference).max(axis=1)
+            exact = (np.abs(np.round(pred, 2) - expected) < 0.01).sum(axis=1)
+            ok = (worst <= tolerance) & (exact >= exact_before)
+            candidates += [(worst[i], name, trees[i]) for i in np.flatnonzero(ok)]
+        if not candidates:
+            break
+        _, name, tree = min(candidates)
+        keep[name][tree] = False
+
+    dropped = {name: np.flatnonzero(~keep[name]).tolist() for name in TREE_MODELS}
+    compacted = dict(models)
+    for name in TREE_MODELS:
+        if dropped[name]:
+            compacted[name] = compact_trees(models[name], np.flatnonzero(keep[name]))
+    return compacted, dropped
+
+
+def _memory_kb():
+    """(resident, anonymous) kB of this process; anonymous memory is what no other process shares"""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            name, value = line.split()[:2]
+            if name in ('Rss:', 'Anonymous:'):
+                fields[name] = int(value)
+    return fields['Rss:'], fields['Anonymous:']
+
+
+def _measure(path):
+    """Child side of footprint(): load one model source and print its cost as JSON"""
+    import json
+    import sys
+
+    if path == 'pickles':
+        import joblib
+        import lightgbm  # noqa: F401  (imported first: the import is not the models' cost)
+        import sklearn.ensemble  # noqa: F401
+
+        def load():
+            return [joblib.load(f'{name}_model.pkl') for name in ('lgb', 'rf', 'lr')]
+    else:
+        def load():
+            # The checksum pass reads every page, as serving eventually does
+            return model_bundle.read_bundle(path)
+    before = _memory_kb()
+    start = time.perf_counter()
+    models = load()
+    elapsed = time.perf_counter() - start
+    after = _memory_kb()
+    json.dump({'load_ms': elapsed * 1000, 'private_kb': after[1] - before[1],
+               'shared_kb': (after[0] - after[1]) - (before[0] - before[1])}, sys.stdout)
+    del models
+
+
+def footprint(path):
+    """Load time and memory of a bundle (or 'pickles') in a fresh interpreter.
+
+    private_kb is anonymous memory each worker process holds on its own;
+    shared_kb is file-backed (the memory-mapped bundle), shared by all workers.
+    """
+    import json
+    import subprocess
+    import sys
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        return {'load_ms': float('nan'), 'private_kb': 0, 'shared_kb': 0}
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c',
+                             'import sys, compact_models; compact_models._measure(sys.argv[1])', path],
+                            capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output)
+
+
+def _nodes(models):
+    return sum(len(models[name].feature) for name in TREE_MODELS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default=BUNDLE_FILE, help='bundle to compact (default: the pickles if missing)')
+    parser.add_argument('--output', default=COMPACT_FILE)
+    parser.add_argument('--merge-tolerance', type=float, default=0.0,
+                        help='collapse subtrees whose leaves agree within this (model output units)')
+    parser.add_argument('--no-float32', dest='float32', action='store_false',
+                        help='keep thresholds and leaf values as float64')
+    parser.add_argument('--drop-tolerance', type=float, default=None,
+                        help='drop trees while no public ML-route case moves by more than this many dollars')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.source):
+        bundle = model_bundle.read_bundle(args.source)
+        source, weights, origin = bundle.models, bundle.weights, {'bundle': args.source, 'checksum': bundle.checksum}
+    else:
+        pickled = EnsemblePredictor(bundle=None)
+        source = compiled_models.compile_models(pickled.models)
+        weights, origin = pickled.weights, {'built_from': sorted(f'{name}_model.pkl' for name in source)}
+    missing = set(TREE_MODELS + ('lr',)) - set(source)
+    if missing:
+        raise SystemExit(f"compact_models.py needs lgb, rf and lr models; missing {sorted(missing)}")
+    evaluation = Evaluation(source, weights)
+
+    steps = [('source', source, None)]
+    models = source
+    start = time.perf_counter()
+    models = {**models, **{name: compact_trees(models[name], tolerance=args.merge_tolerance)
+                           for name in TREE_MODELS}}
+    steps.append((f'merge {args.merge_tolerance:g}', models, f'{time.perf_counter() - start:.1f}s'))
+    float32 = []
+    if args.float32:
+        models, tried = apply_float32(models, evaluation)
+        float32 = [array for array, changed in tried.items() if not changed]
+        steps.append(('float32', models, ', '.join(f'{array} kept' if not changed else
+                                                   f'{array} would change {changed} outputs'
+                                                   for array, changed in tried.items())))
+    dropped = {name: [] for name in TREE_MODELS}
+    if args.drop_tolerance is not None:
+        models, dropped = drop_trees(models, evaluation, args.drop_tolerance)
+        steps.append((f'drop {args.drop_tolerance:g}', models,
+                      ', '.join(f'{len(trees)} {name}' for name, trees in dropped.items()) + ' trees'))
+
+    pickle_bytes = sum(os.path.getsize(f'{name}_model.pkl') for name in ('lgb', 'rf', 'lr'))
+    pickles = footprint('pickles')
+    print(f"{'step':14} {'trees':>8} {'nodes':>7} {'bytes':>9} {'load ms':>8} {'private':>9} {'shared':>8} "
+          f"{'pub mean':>9} {'pub max':>8} {'pri max':>8} {'changed':>8} {'score':>9}")
+    print(f"{'pickles':14} {'':>8} {'':>7} {pickle_bytes:9,} {pickles['load_ms']:8.1f} "
+          f"{pickles['private_kb']:6,} kB {pickles['shared_kb']:5,} kB")
+    report = [{'step': 'pickles', 'bytes': pickle_bytes, **pickles}]
+    with tempfile.TemporaryDirectory() as scratch:
+        for i, (label, step_models, note) in enumerate(steps):
+            path = os.path.join(scratch, f'step{i}.bundle')
+            model_bundle.write_bundle(path, step_models, weights=weights)
+            size = {'bytes': os.path.getsize(path), **footprint(path)}
+            deviation = evaluation.deviation(step_models)
+            score = evaluation.public_score(step_models)
+            public, private = deviation[CASE_FILES[0]], deviation[CASE_FILES[1]]
+            trees = '/'.join(str(step_models[name].n_trees) for name in TREE_MODELS)
+            print(f"{label:14} {trees:>8} {_nodes(step_models):7,} {size['bytes']:9,} {size['load_ms']:8.1f} "
+                  f"{size['private_kb']:6,} kB {size['shared_kb']:5,} kB {public['mean']:9.4f} "
+                  f"{public['max']:8.3f} {private['max']:8.3f} "
+                  f"{public['changed_outputs'] + private['changed_outputs']:8d} {score['score']:9.2f}"
+                  + (f"   ({note})" if note else ''))
+            report.append({'step': label, 'nodes': _nodes(step_models), **size, 'deviation': deviation, **score})
+
+    checksum = model_bundle.write_bundle(
+        args.output, models, weights=weights,
+        source={'compacted_by': 'compact_models.py', **origin, 'merge_tolerance': args.merge_tolerance,
+                'float32': float32, 'drop_tolerance': args.drop_tolerance, 'dropped_trees': dropped,
+                'report': report})
+    compiled_models.check_compiled(models, model_bundle.read_bundle(args.output).models, tolerance=0.0)
+    print(f"\nWrote {args.output} ({os.path.getsize(args.output):,} bytes, sha256 {checksum[:12]}); "
+          f"'changed' counts case outputs that print differently from the source models")
+
+
+if __name__ == '__main__':
+    main()
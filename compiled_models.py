@@ -0,0 +1,370 @@
+"""Array-backed inference for the trained RandomForest, LightGBM and linear models.
+
+The sklearn/LightGBM objects pay fixed overhead on every predict call (input
+validation, DataFrame conversion, thread dispatch) that dwarfs the tree walks
+for our small models. This module flattens them into struct-of-arrays form:
+per node a feature index, threshold, left/right child and leaf value. A
+pure-NumPy evaluator then walks every tree for a whole batch at once.
+
+Inputs are validated like the originals: RandomForest rejects values beyond
+float32 range and LinearRegression any non-finite value, with sklearn's
+ValueError messages; NaN features follow each library's missing-value routing.
+
+    python compiled_models.py            # compile the pickles and verify the result
+
+Compiled models expose predict(X) like the originals, where X is a
+FEATURE_COLUMNS matrix (ndarray or DataFrame). Predictions match the originals
+within 1e-9.
+"""
+import numpy as np
+
+# LightGBM missing-value handling per split node
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+_LGB_ZERO_THRESHOLD = 1e-35
+
+# Rows evaluated per chunk, which bounds the (trees x rows) node-index matrix
+_CHUNK_ROWS = 8192
+# From this many rows on, trees are walked one at a time (see CompiledTrees.leaves)
+_PER_TREE_ROWS = 256
+
+
+class CompiledTrees:
+    """Tree ensemble flattened into node arrays shared by all trees.
+
+    Leaves point back to themselves (left == right == own index). Small batches
+    advance every (tree, row) pair one level per step until all reach a leaf;
+    larger ones walk each tree over all rows for exactly that tree's depth.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth,
+                 average=False, float32_inputs=False, default_left=None, missing_type=None):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        # float32 thresholds and values (see compact_models.py) are kept as stored, so
+        # a bundle's arrays stay memory-mapped; comparisons and sums promote to float64
+        self.threshold = _float_array(threshold)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.value = _float_array(value)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        # RandomForest averages its trees; boosted trees are summed
+        self.average = bool(average)
+        # sklearn trees compare float32-cast inputs against float64 thresholds
+        self.float32_inputs = bool(float32_inputs)
+        self.default_left = None if default_left is None else np.asarray(default_left, dtype=bool)
+        self.missing_type = None if missing_type is None else np.asarray(missing_type, dtype=np.int8)
+        self.is_leaf = self.left == np.arange(len(self.left))
+        # Zero-as-missing splits need the missing-value rules on every input,
+        # the others only when an input is NaN
+        self._zero_as_missing = (self.missing_type is not None
+                                 and bool((self.missing_type == MISSING_ZERO).any()))
+        self._tree_walk = None
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def leaves(self, X, trees=None):
+        """Leaf node index reached in every tree (or those selected by `trees`), shape (trees, n_rows)"""
+        roots = self.roots if trees is None else self.roots[trees]
+        X = _as_matrix(X)
+        if self.float32_inputs:
+            _check_finite(X, allow_nan=True, dtype=np.float32)
+            X = X.astype(np.float32).astype(np.float64)
+        has_nan = bool(np.isnan(X).any())
+        if len(X) >= _PER_TREE_ROWS and not has_nan and not self._zero_as_missing:
+            selected = np.arange(self.n_trees)
+            return self._leaves_per_tree(X, selected if trees is None else selected[trees])
+        handle_missing = self._zero_as_missing or (has_nan and self.missing_type is not None)
+        n_rows, n_cols = X.shape
+        flat_X = np.ascontiguousarray(X).ravel()
+
+        # One (tree, row) walker per pair; only walkers still on a split node move
+        node = np.repeat(roots, n_rows)
+        row_offset = np.tile(np.arange(n_rows) * n_cols, len(roots))
+        active = np.flatnonzero(~self.is_leaf[node])
+        while active.size:
+            current = node[active]
+            x = flat_X[row_offset[active] + self.feature[current]]
+            go_left = x <= self.threshold[current]
+            if handle_missing:
+                go_left = self._missing_decision(current, x, go_left)
+            current = np.where(go_left, self.left[current], self.right[current])
+            node[active] = current
+            active = active[~self.is_leaf[current]]
+        return node.reshape(len(roots), n_rows)
+
+    def _leaves_per_tree(self, X, trees):
+        # Per level one gather per array over contiguous rows, and no bookkeeping of
+        # finished rows: leaves loop back to themselves. Node n is kept as 2n so the
+        # split outcome (0 left, 1 right) indexes `children` directly.
+        if self._tree_walk is None:
+            children = np.empty(2 * len(self.left), dtype=np.intp)
+            children[0::2], children[1::2] = 2 * self.left, 2 * self.right
+            self._tree_walk = (children, np.repeat(self.feature.astype(np.intp), 2),
+                               np.repeat(self.threshold, 2), self._tree_depths())
+        children, feature, threshold, depths = self._tree_walk
+        n_rows = len(X)
+        columns = np.ascontiguousarray(X.T).ravel()
+        offset = feature * n_rows
+        rows = np.arange(n_rows)
+        out = np.empty((len(trees), n_rows), dtype=np.intp)
+        for i, tree in enumerate(trees):
+            state = np.full(n_rows, 2 * self.roots[tree], dtype=np.intp)
+            for _ in range(depths[tree]):
+                state = children[state + (columns[offset[state] + rows] > threshold[state])]
+            out[i] = state >> 1
+        return out
+
+    def _tree_depths(self):
+        # Trees occupy consecutive node ranges starting at their roots
+        depth = np.zeros(len(self.left), dtype=np.intp)
+        level, d = self.roots, 0
+        while level.size:
+            depth[level] = d
+            split = level[~self.is_leaf[level]]
+            level = np.concatenate([self.left[split], self.right[split]])
+            d += 1
+        return np.maximum.reduceat(depth, self.roots)
+
+    def _missing_decision(self, node, x, go_left):
+        # Mirrors LightGBM's NumericalDecision for NaN and zero-as-missing splits
+        missing_type = self.missing_type[node]
+        is_nan = np.isnan(x)
+        x = np.where(is_nan & (missing_type != MISSING_NAN), 0.0, x)
+        use_default = (((missing_type == MISSING_ZERO) & (np.abs(x) <= _LGB_ZERO_THRESHOLD))
+                       | ((missing_type == MISSING_NAN) & is_nan))
+        go_left = np.where(is_nan, x <= self.threshold[node], go_left)
+        return np.where(use_default, self.default_left[node], go_left)
+
+    def tree_values(self, X, trees=None):
+        """Per-tree predictions (of the trees selected by `trees`), shape (trees, n_rows)"""
+        return self.value[self.leaves(X, trees)]
+
+    def tree_ranges(self):
+        """Smallest and largest leaf value of each tree: bounds on its output for any input"""
+        ends = np.append(self.roots[1:], len(self.value))
+        low = np.array([self.value[start:end][self.is_leaf[start:end]].min()
+                        for start, end in zip(self.roots, ends)])
+        high = np.array([self.value[start:end][self.is_leaf[start:end]].max()
+                         for start, end in zip(self.roots, ends)])
+        return low, high
+
+    def predict(self, X):
+        X = _as_matrix(X)
+        out = np.empty(len(X))
+        for start in range(0, len(X), _CHUNK_ROWS):
+            values = self.tree_values(X[start:start + _CHUNK_ROWS])
+            # Accumulate tree by tree, in the same order as sklearn and LightGBM
+            total = np.zeros(values.shape[1])
+            for tree_values in values:
+                total += tree_values
+            if self.average:
+                total /= self.n_trees
+            out[start:start + _CHUNK_ROWS] = total
+        return out
+
+    def arrays(self):
+        """Named arrays for serialization; from_arrays() inverts this"""
+        arrays = {
+            'feature': self.feature, 'threshold': self.threshold,
+            'left': self.left, 'right': self.right, 'value': self.value, 'roots': self.roots,
+            'params': np.array([self.max_depth, self.average, self.float32_inputs], dtype=np.int64),
+        }
+        if self.missing_type is not None:
+            arrays['default_left'] = self.default_left
+            arrays['missing_type'] = self.missing_type
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        max_depth, average, float32_inputs = (int(v) for v in arrays['params'])
+        return cls(arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+                   arrays['value'], arrays['roots'], max_depth, average=bool(average),
+                   float32_inputs=bool(float32_inputs),
+                   default_left=arrays.get('default_left'), missing_type=arrays.get('missing_type'))
+
+
+class CompiledLinear:
+    """Linear model as a coefficient vector and intercept"""
+
+    def __init__(self, coef, intercept):
+        self.coef = np.asarray(coef, dtype=np.float64).reshape(-1)
+        self.intercept = float(np.asarray(intercept).reshape(-1)[0])
+
+    def predict(self, X):
+        # Each row is summed left to right, one column at a time, whatever the
+        # batch size or memory layout, so chunked or sharded scoring matches one
+        # batch exactly (a BLAS matmul does not: its rounding depends on a row's
+        # position in the block)
+        X = _as_matrix(X)
+        _check_finite(X)
+        if len(X) == 1:
+            # The same sum in Python floats: a single case skips the per-column array calls
+            row, coef = X[0].tolist(), self.coef.tolist()
+            total = row[0] * coef[0]
+            for j in range(1, len(coef)):
+                total += row[j] * coef[j]
+            return np.array([total + self.intercept])
+        coef = self.coef
+        total = X[:, 0] * coef[0]
+        for j in range(1, len(coef)):
+            total += X[:, j] * coef[j]
+        return total + self.intercept
+
+    def arrays(self):
+        return {'coef': self.coef, 'intercept': np.array([self.intercept])}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['coef'], arrays['intercept'])
+
+
+def _as_matrix(X):
+    return np.asarray(X, dtype=np.float64)
+
+
+def _check_finite(X, allow_nan=False, dtype=np.float64):
+    # Same rejections and messages as sklearn's input validation
+    if not allow_nan and np.isnan(X).any():
+        raise ValueError("Input X contains NaN.")
+    if (np.abs(X) > np.finfo(dtype).max).any():
+        raise ValueError(f"Input X contains infinity or a value too large for {np.dtype(dtype)!r}.")
+
+
+def _float_array(values):
+    values = np.asarray(values)
+    return values if values.dtype in (np.float32, np.float64) else values.astype(np.float64)
+
+
+class _TreeBuilder:
+    """Accumulates trees into the flat node arrays of a CompiledTrees"""
+
+    def __init__(self):
+        self.feature, self.threshold, self.left, self.right, self.value = [], [], [], [], []
+        self.default_left, self.missing_type = [], []
+        self.roots = []
+        self.max_depth = 0
+
+    def add_node(self, feature=0, threshold=0.0, value=0.0, default_left=False,
+                 missing_type=MISSING_NONE):
+        index = len(self.feature)
+        self.feature.append(feature)
+        self.threshold.append(threshold)
+        self.value.append(value)
+        self.left.append(index)
+        self.right.append(index)
+        self.default_left.append(default_left)
+        self.missing_type.append(missing_type)
+        return index
+
+
+def compile_random_forest(model):
+    """Flatten a fitted sklearn RandomForestRegressor"""
+    builder = _TreeBuilder()
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        offset = len(builder.feature)
+        builder.roots.append(offset)
+        builder.max_depth = max(builder.max_depth, tree.max_depth)
+        # sklearn sends NaN inputs to the child recorded in missing_go_to_left
+        go_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=bool))
+        for node in range(tree.node_count):
+            is_leaf = tree.children_left[node] == -1
+            builder.add_node(
+                feature=0 if is_leaf else int(tree.feature[node]),
+                threshold=float(tree.threshold[node]),
+                value=float(tree.value[node].reshape(-1)[0]),
+                default_left=bool(go_left[node]),
+                missing_type=MISSING_NONE if is_leaf else MISSING_NAN,
+            )
+            if not is_leaf:
+                builder.left[-1] = offset + int(tree.children_left[node])
+                builder.right[-1] = offset + int(tree.children_right[node])
+    return CompiledTrees(builder.feature, builder.threshold, builder.left, builder.right,
+                         builder.value, builder.roots, builder.max_depth,
+                         average=True, float32_inputs=True,
+                         default_left=builder.default_left, missing_type=builder.missing_type)
+
+
+def compile_lightgbm(model):
+    """Flatten a fitted LGBMRegressor (or lightgbm Booster) with numerical splits"""
+    booster = getattr(model, 'booster_', model)
+    dump = booster.dump_model()
+    if dump['num_tree_per_iteration'] != 1 or dump['average_output']:
+        raise ValueError("Only single-output gbdt LightGBM models can be compiled")
+
+    builder = _TreeBuilder()
+
+    def add(node, depth):
+        builder.max_depth = max(builder.max_depth, depth)
+        if 'leaf_value' in node:
+            return builder.add_node(value=float(node['leaf_value']))
+        if node['decision_type'] != '<=':
+            raise ValueError(f"Unsupported LightGBM split type: {node['decision_type']}")
+        index = builder.add_node(
+            feature=int(node['split_feature']),
+            threshold=float(node['threshold']),
+            default_left=bool(node['default_left']),
+            missing_type=_MISSING_TYPES[node['missing_type']],
+        )
+        builder.left[index] = add(node['left_child'], depth + 1)
+        builder.right[index] = add(node['right_child'], depth + 1)
+        return index
+
+    for tree in dump['tree_info']:
+        builder.roots.append(add(tree['tree_structure'], 0))
+    return CompiledTrees(builder.feature, builder.threshold, builder.left, builder.right,
+                         builder.value, builder.roots, builder.max_depth,
+                         default_left=builder.default_left, missing_type=builder.missing_type)
+
+
+def compile_linear(model):
+    """Extract coefficients from a fitted sklearn linear model"""
+    return CompiledLinear(model.coef_, model.intercept_)
+
+
+_COMPILERS = {'lgb': compile_lightgbm, 'rf': compile_random_forest, 'lr': compile_linear}
+
+
+def compile_models(models):
+    """Compile a {'lgb': ..., 'rf': ..., 'lr': ...} dict as loaded by EnsemblePredictor"""
+    return {name: _COMPILERS[name](model) for name, model in models.items()}
+
+
+def check_compiled(models, compiled, case_files=('public_cases.json', 'private_cases.json'),
+                   tolerance=1e-9):
+    """Largest absolute prediction difference per model over the case files.
+
+    Raises AssertionError when any model differs by more than `tolerance`.
+    """
+    from feature_store import load_features
+
+    worst = {name: 0.0 for name in compiled}
+    rng = np.random.default_rng(0)
+    for path in case_files:
+        features = load_features(path)
+        X, frame = features.X, features.frame()
+        # Trees also accept NaN features; a tenth of the values knocked out checks their routing
+        X_nan = np.where(rng.random(X.shape) < 0.1, np.nan, X)
+        frame_nan = frame.copy()
+        frame_nan[:] = X_nan
+        for name, model in compiled.items():
+            diff = np.abs(model.predict(X) - models[name].predict(frame)).max()
+            if isinstance(model, CompiledTrees):
+                diff = max(diff, np.abs(model.predict(X_nan) - models[name].predict(frame_nan)).max())
+            worst[name] = max(worst[name], float(diff))
+    failed = {name: diff for name, diff in worst.items() if diff > tolerance}
+    if failed:
+        raise AssertionError(f"Compiled models differ by more than {tolerance}: {failed}")
+    return worst
+
+
+if __name__ == '__main__':
+    from ensemble import EnsemblePredictor
+
+    models = EnsemblePredictor(bundle=None).models
+    worst = check_compiled(models, compile_models(models))
+    for name, diff in worst.items():
+        print(f"{name}: max |compiled - original| = {diff:.3g}")
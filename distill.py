@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Distill the ML route's three-model blend into one compact surrogate.
+
+predict_normal() blends LightGBM (0.4), RandomForest (0.5) and
+LinearRegression (0.1), about 150 trees per case, before applying the caps.
+This trains a single shallow LightGBM model on dense random samples of that
+blend (only inputs the ML route handles), compiles it and writes it as a
+model bundle with its measured agreement:
+
+    python distill.py [--samples 300000] [--trees 100] [--depth 5]
+
+The report gives the surrogate's agreement with the full ensemble's final
+output on held-out samples and on the public/private case inputs, both scores
+against public_cases.json, and the speed of each.
+
+EnsemblePredictor(fast=True) (REIMBURSE_FAST=1 for run.sh and the worker)
+then uses the surrogate instead of the blend, but only when the bundle was
+distilled from the models being served and its mean disagreement on the case
+inputs is within `fast_tolerance` dollars; otherwise it keeps the full
+ensemble and says why in `surrogate_status`.
+
+The default 100-tree depth-5 surrogate disagrees with the ensemble by $12.48
+on average on the case inputs ($52 p99, $170 max), which costs 788 points of
+public score (14409 -> 15197, average error $143.09 -> $150.97), for about
+2.9x the ML-route throughput. Surrogates that get within $5 on average need
+200-400 depth-8 trees and are no faster than the ensemble itself, so the
+default FAST_TOLERANCE ($15) accepts the small one.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import rule_engine
+from ensemble import FAST_TOLERANCE, SURROGATE_FILE, EnsemblePredictor
+from feature_eng import engineer_features_array
+
+DEFAULT_SAMPLES = 300_000
+DEFAULT_TREES = 100
+DEFAULT_DEPTH = 5
+# Input ranges sampled; a little wider than public and private cases
+DAYS_RANGE = (1, 14)
+MILES_RANGE = (5, 1400)
+RECEIPTS_RANGE = (0.5, 2600)
+
+
+def sample_ml_cases(n, seed=0):
+    """Random cases the ML route handles (drawn n at a time, rule-routed ones dropped)"""
+    rng = np.random.default_rng(seed)
+    days = rng.integers(DAYS_RANGE[0], DAYS_RANGE[1] + 1, n).astype(float)
+    miles = np.round(rng.uniform(*MILES_RANGE, n))
+    receipts = np.round(rng.uniform(*RECEIPTS_RANGE, n), 2)
+    ml = rule_engine.route_cases(days, miles, receipts) == rule_engine.ROUTE_ML
+    return days[ml], miles[ml], receipts[ml]
+
+
+def case_file_inputs(paths=('public_cases.json', 'private_cases.json')):
+    """ML-routed inputs of the case files, as (days, miles, receipts)"""
+    from feature_store import load_features
+
+    inputs = np.concatenate([np.asarray(load_features(path).inputs) for path in paths])
+    days, miles, receipts = inputs.T
+    ml = rule_engine.route_cases(days, miles, receipts) == rule_engine.ROUTE_ML
+    return days[ml], miles[ml], receipts[ml]
+
+
+def blend(predictor, days, miles, receipts):
+    """The full ensemble's weighted average before the post-ML caps"""
+    return predictor._ensemble_average(predictor._model_frame(engineer_features_array(days, miles, receipts)))
+
+
+def train_surrogate(X, y, trees=DEFAULT_TREES, depth=DEFAULT_DEPTH):
+    """Shallow LightGBM regressor fitted to the blend"""
+    from lightgbm import LGBMRegressor
+
+    model = LGBMRegressor(n_estimators=trees, max_depth=depth, num_leaves=2 ** depth,
+                          learning_rate=0.15, min_child_samples=5, random_state=42, verbose=-1)
+    model.fit(X, y)
+    return model
+
+
+def agreement(full, fast, days, miles, receipts):
+    """Absolute differences between two predictors' final ML-route outputs"""
+    diff = np.abs(fast._predict_ml_batch(days, miles, receipts) - full._predict_ml_batch(days, miles, receipts))
+    return {'cases': int(diff.size), 'mean': float(diff.mean()), 'p95': float(np.percentile(diff, 95)),
+            'p99': float(np.percentile(diff, 99)), 'max': float(diff.max())}
+
+
+def public_score(predictor, path='public_cases.json'):
+    from evaluate import _format_outputs, load_cases, score_outputs
+    from feature_store import load_features
+
+    days, miles, receipts = np.asarray(load_features(path).inputs).T
+    cases = load_cases(path)
+    metrics = score_outputs(cases, _format_outputs(predictor.predict_batch(days, miles, receipts)),
+                            [None] * len(cases))
+    return {'score': float(metrics['score']), 'avg_error': float(metrics['avg_error'])}
+
+
+def _cases_per_second(fn, days, miles, receipts, repeat=3):
+    best = min(_timed(fn, days, miles, receipts) for _ in range(repeat))
+    return len(days) / best
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    import compiled_models
+    import model_bundle
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='random inputs drawn')
+    parser.add_argument('--trees', type=int, default=DEFAULT_TREES)
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=SURROGATE_FILE)
+    args = parser.parse_args(argv)
+
+    full = EnsemblePredictor(compiled=True, lazy=False)
+    teacher = full.model_fingerprint()
+
+    train_cases = sample_ml_cases(args.samples, args.seed)
+    start = time.perf_counter()
+    target = blend(full, *train_cases)
+    print(f"Sampled {len(target):,} ML-route cases, labelled by the ensemble in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    surrogate = compiled_models.compile_lightgbm(
+        train_surrogate(engineer_features_array(*train_cases), target, args.trees, args.depth))
+    print(f"Trained a {args.trees}-tree depth-{args.depth} surrogate ({len(surrogate.feature):,} nodes) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    fast = EnsemblePredictor(compiled=True, bundle=None)
+    fast.models = full.models
+    fast.surrogate = surrogate
+    report = {
+        'held_out': agreement(full, fast, *sample_ml_cases(args.samples // 5, args.seed + 1)),
+        'case_files': agreement(full, fast, *case_file_inputs()),
+        'public_score': {'ensemble': public_score(full), 'surrogate': public_score(fast)},
+    }
+    real = case_file_inputs()
+    speed = {'ensemble': _cases_per_second(full._predict_ml_batch, *real),
+             'surrogate': _cases_per_second(fast._predict_ml_batch, *real)}
+
+    print("\nAgreement with the full ensemble (final ML-route output, $):")
+    for name in ('held_out', 'case_files'):
+        a = report[name]
+        print(f"  {name:11} mean {a['mean']:7.2f}   p95 {a['p95']:7.2f}   p99 {a['p99']:7.2f}   "
+              f"max {a['max']:7.2f}   ({a['cases']:,} cases)")
+    print("public_cases.json:")
+    for name, score in report['public_score'].items():
+        print(f"  {name:11} score {score['score']:9.2f}   average error ${score['avg_error']:.2f}")
+    print("ML-route throughput on the case inputs:")
+    for name, rate in speed.items():
+        print(f"  {name:11} {rate:12,.0f} cases/s")
+
+    checksum = model_bundle.write_bundle(
+        args.output, {'surrogate': surrogate}, weights={'surrogate': 1.0},
+        source={'trained_by': 'distill.py', 'teacher_checksum': teacher, 'samples': len(target),
+                'trees': args.trees, 'depth': args.depth, 'agreement': report},
+    )
+    status = 'within' if report['case_files']['mean'] <= FAST_TOLERANCE else 'outside'
+    print(f"\nSurrogate written to {args.output} (sha256 {checksum[:12]}); mean disagreement "
+          f"${report['case_files']['mean']:.2f} is {status} the default fast_tolerance of ${FAST_TOLERANCE:.2f}")
+
+
+if __name__ == '__main__':
+    main()
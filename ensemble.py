@@ -1,16 +1,86 @@
-import joblib
-import pandas as pd
-import numpy as np
-from feature_eng import engineer_features
 import os
+import time
+
+# numpy, pandas, joblib, sklearn/LightGBM and the feature/model modules are
+# imported inside the methods that need them: rule-routed cases are answered in
+# plain Python and should not pay for importing the ML stack (see startup_report.py)
+
+# Single-file model bundle written by train_ensemble.py (see model_bundle.py)
+BUNDLE_FILE = 'ensemble.bundle'
+
+# Distilled single-model replacement for the ML blend (see distill.py)
+SURROGATE_FILE = 'surrogate.bundle'
+# Largest mean disagreement (in dollars, on the case-file inputs) at which fast mode uses it.
+# Fast mode trades accuracy for speed: the shipped surrogate is off by $12.48 on
+# average ($52 p99, $170 max) and scores 15197 on the public cases against 14409
+FAST_TOLERANCE = 15.0
+
+# EXPERT'S LATEST: Favor RandomForest for outlier handling [0.4, 0.5, 0.1]
+MODEL_WEIGHTS = {'lgb': 0.4, 'rf': 0.5, 'lr': 0.1}
+
 
 class EnsemblePredictor:
-    def __init__(self):
-        self.models = {}
-        self.load_models()
+    def __init__(self, compiled=None, lazy=True, bundle=BUNDLE_FILE, cache=None, metrics=None, grid=None,
+                 fast=False, fast_tolerance=FAST_TOLERANCE, cascade=None):
+        # compiled=True swaps the sklearn/LightGBM objects for array-backed
+        # equivalents from compiled_models.py (same predictions, less overhead),
+        # read from `bundle` when that file exists. compiled=False keeps the
+        # library objects from the pickles; the default None takes the bundle
+        # when it exists and the pickles as they are otherwise.
+        # bundle=None forces the individual pickles.
+        # cache: optional prediction_cache.PredictionCache consulted by predict()
+        # metrics: optional instrumentation.Metrics for route/stage counters and timings
+        # grid: optional lookup_grid.LookupGrid answering tabulated cases before the cache
+        # fast=True replaces the ML blend with the distilled surrogate when it was
+        # distilled from these models and agrees within fast_tolerance dollars
+        # cascade: optional cascade.Cascade answering ML-route cases from cheap
+        # estimates when they are within its tolerance (ignored while the surrogate is in use)
+        self.compiled = compiled
+        self.bundle = bundle
+        self.weights = dict(MODEL_WEIGHTS)
+        self.model_checksum = None
+        self.cache = cache
+        self.metrics = metrics
+        self.grid = grid
+        self.fast = fast
+        self.fast_tolerance = fast_tolerance
+        self.cascade = cascade
+        self.surrogate = None
+        self.surrogate_checksum = None
+        self.surrogate_status = None
+        self._cache_namespace = None
+        self._models = None
+        self._feature_plan = None
+        if not lazy:
+            self.load_models()
+    
+    @property
+    def models(self):
+        """Trained models, loaded on first use by the ML route"""
+        if self._models is None:
+            self.load_models()
+        return self._models
+    
+    @models.setter
+    def models(self, models):
+        self._models = models
     
     def load_models(self):
         """Load all available trained models"""
+        if self.bundle and os.path.exists(self.bundle) and self.compiled is not False:
+            # A bad bundle raises BundleError: never fall back to rules silently
+            import model_bundle
+            loaded = model_bundle.read_bundle(self.bundle)
+            self.compiled = True
+            self.weights = loaded.weights
+            self.model_checksum = loaded.checksum
+            self.models = loaded.models
+            if self.fast:
+                self._load_surrogate()
+            return
+        
+        import joblib
+        self._models = {}
         model_files = {
             'lgb': 'lgb_model.pkl',
             'rf': 'rf_model.pkl', 
@@ -23,6 +93,45 @@ class EnsemblePredictor:
                     self.models[name] = joblib.load(filename)
                 except Exception as e:
                     pass
+        
+        if self.compiled:
+            import compiled_models
+            self.models = compiled_models.compile_models(self.models)
+        if self.fast:
+            self._load_surrogate()
+    
+    def model_fingerprint(self):
+        """Checksum of the models in use, or of those load_models() would pick, without loading them"""
+        import prediction_cache
+        
+        if self.model_checksum:
+            return self.model_checksum
+        from_bundle = self.compiled is not False and self.bundle and os.path.exists(self.bundle)
+        return prediction_cache.model_fingerprint(self.bundle if from_bundle else None)
+    
+    def _load_surrogate(self):
+        """Use the distilled surrogate if it matches the loaded models and agrees closely enough"""
+        import model_bundle
+        
+        self.surrogate = None
+        self.surrogate_checksum = None
+        if not os.path.exists(SURROGATE_FILE):
+            self.surrogate_status = f'{SURROGATE_FILE} not found (run distill.py); using the full ensemble'
+            return
+        # A corrupt surrogate bundle raises BundleError like the main bundle
+        loaded = model_bundle.read_bundle(SURROGATE_FILE)
+        source = loaded.manifest['source']
+        teacher = self.model_fingerprint()
+        disagreement = source['agreement']['case_files']['mean']
+        if source.get('teacher_checksum') != teacher:
+            self.surrogate_status = 'surrogate was distilled from other models; using the full ensemble'
+        elif disagreement > self.fast_tolerance:
+            self.surrogate_status = (f'surrogate disagreement ${disagreement:.2f} exceeds the '
+                                     f'${self.fast_tolerance:.2f} tolerance; using the full ensemble')
+        else:
+            self.surrogate = loaded.models['surrogate']
+            self.surrogate_checksum = loaded.checksum
+            self.surrogate_status = f'using the surrogate (mean disagreement ${disagreement:.2f})'
     
     def rule_based_calculation(self, days, miles, receipts):
         """Rule-based calculation with expert's targeted receipt handling"""
@@ -235,6 +344,99 @@ class EnsemblePredictor:
         
         return total
     
+    def _features(self, days, miles, receipts):
+        """FEATURE_COLUMNS matrix with only the columns the models in use read"""
+        models = self.models
+        active = {'surrogate': self.surrogate} if self.surrogate is not None else models
+        key = tuple(map(id, active.values()))
+        if self._feature_plan is None or self._feature_plan[0] != key:
+            import feature_registry
+            self._feature_plan = (key, feature_registry.plan_for_models(active))
+        return self._feature_plan[1].compute(days, miles, receipts)
+    
+    def _model_frame(self, features):
+        """Label a FEATURE_COLUMNS matrix for the sklearn/LightGBM models fitted on DataFrames"""
+        self.models  # load first: models from a bundle are compiled and take the matrix as is
+        if self.compiled:
+            return features
+        import pandas as pd
+        from feature_eng import FEATURE_COLUMNS
+        return pd.DataFrame(features, columns=FEATURE_COLUMNS, copy=False)
+    
+    def _ensemble_average(self, df, mode='batch'):
+        """Weighted ensemble prediction for every row of an engineered feature frame.
+
+        Returns None when no model could produce predictions. `mode` labels the
+        stage timings recorded in self.metrics.
+        """
+        import numpy as np
+        
+        predictions = []
+        weights = []
+        metrics = self.metrics
+        
+        models = self.models
+        if self.surrogate is not None:
+            if metrics is not None:
+                start = time.perf_counter()
+            pred = self.surrogate.predict(df)
+            if metrics is not None:
+                metrics.observe('stage_seconds', time.perf_counter() - start, stage='surrogate', mode=mode)
+            return pred
+        
+        # Weights default to MODEL_WEIGHTS; a model bundle carries its own
+        for name in ('lgb', 'rf', 'lr'):
+            if name not in models:
+                if metrics is not None:
+                    metrics.increment('fallbacks_total', reason='model_missing', model=name)
+                continue
+            if metrics is not None:
+                start = time.perf_counter()
+            try:
+                pred = models[name].predict(df)
+            except Exception:
+                # EXPERT'S RECOMMENDATION: Include Linear Regression in ensemble,
+                # but never let it take the prediction down
+                if name != 'lr':
+                    raise
+                if metrics is not None:
+                    metrics.increment('fallbacks_total', reason='model_error', model=name)
+                # In a batch only the rows it cannot score (NaN inputs) go without it
+                pred = self._predict_finite_rows(models[name], df)
+                if pred is None:
+                    continue
+            if metrics is not None:
+                metrics.observe('stage_seconds', time.perf_counter() - start, stage=name, mode=mode)
+            predictions.append(pred)
+            weights.append(self.weights[name])
+        
+        if not predictions:
+            if metrics is not None:
+                metrics.increment('fallbacks_total', reason='no_models', model='all')
+            return None
+        
+        predictions = np.asarray(predictions)
+        if np.isnan(predictions).any():
+            # Rows a model skipped average the others, as predict() does for them alone
+            row_weights = np.where(np.isnan(predictions), 0.0, np.asarray(weights)[:, None])
+            return (np.nan_to_num(predictions) * row_weights).sum(axis=0) / row_weights.sum(axis=0)
+        return np.average(predictions, axis=0, weights=weights)
+    
+    @staticmethod
+    def _predict_finite_rows(model, df):
+        """model's predictions for the rows with finite features, NaN elsewhere; None if none"""
+        import numpy as np
+        
+        finite = np.isfinite(np.asarray(df, dtype=float)).all(axis=1)
+        if finite.all() or not finite.any():
+            return None
+        pred = np.full(len(finite), np.nan)
+        try:
+            pred[finite] = model.predict(df[finite])
+        except Exception:
+            return None
+        return pred
+    
     def predict_normal(self, days, miles, receipts):
         """Handle normal cases with ensemble logic and expert's receipt caps"""
         # Check for extreme cases using current logic
@@ -242,39 +444,27 @@ class EnsemblePredictor:
             return self.rule_based_calculation(days, miles, receipts)
         
         # Use ML ensemble for normal cases
-        df = pd.DataFrame([[days, miles, receipts]], 
-                         columns=['trip_duration_days', 'miles_traveled', 'total_receipts_amount'])
-        df = engineer_features(df)
-        
-        predictions = []
-        weights = []
-        
-        # EXPERT'S LATEST: Favor RandomForest for outlier handling [0.4, 0.5, 0.1]
-        if 'lgb' in self.models:
-            pred = self.models['lgb'].predict(df)[0]
-            predictions.append(pred)
-            weights.append(0.4)  # EXPERT'S LATEST: RandomForest-focused approach
-        
-        if 'rf' in self.models:
-            pred = self.models['rf'].predict(df)[0]
-            predictions.append(pred)
-            weights.append(0.5)  # EXPERT'S LATEST: Primary for outlier handling
-        
-        # EXPERT'S RECOMMENDATION: Include Linear Regression in ensemble
-        if 'lr' in self.models:
-            try:
-                pred = self.models['lr'].predict(df)[0]
-                predictions.append(pred)
-                weights.append(0.1)  # EXPERT'S LATEST: Maintained at 0.1
-            except:
-                pass
-        
-        if not predictions:
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        features = self._features(days, miles, receipts)
+        if metrics is not None:
+            metrics.observe('stage_seconds', time.perf_counter() - start, stage='features', mode='single')
+        if self.cascade is not None and self.surrogate is None:
+            capped = self.cascade.decide_single(self, features, days, miles, receipts)
+            if capped is not None:
+                return capped
+        df = self._model_frame(features)
+        
+        ensemble_preds = self._ensemble_average(df, mode='single')
+        if ensemble_preds is None:
             # Fallback to rule-based if no models available
             return self.rule_based_calculation(days, miles, receipts)
         
         # Weighted average with expert's weights
-        weighted_pred = np.average(predictions, weights=weights[:len(predictions)])
+        weighted_pred = ensemble_preds[0]
+        if metrics is not None:
+            start = time.perf_counter()
         
         # EXPERT'S RULE-BASED ADJUSTMENTS for extreme cases
         miles_per_day = miles / max(days, 1)
@@ -292,10 +482,44 @@ class EnsemblePredictor:
             min_reimbursement = 100 * days + 0.3 * miles
             weighted_pred = max(weighted_pred, min_reimbursement)
         
+        if metrics is not None:
+            metrics.observe('stage_seconds', time.perf_counter() - start, stage='caps', mode='single')
         return weighted_pred
 
     def predict(self, days, miles, receipts):
         """Main prediction method with expert's updated routing"""
+        if self.grid is not None:
+            tabulated = self.grid.lookup(days, miles, receipts)
+            if tabulated is not None:
+                return tabulated
+        if self.cache is None:
+            return self._predict_uncached(days, miles, receipts)
+        
+        import prediction_cache
+        key = prediction_cache.normalize_inputs(days, miles, receipts)
+        if key is None:
+            return self._predict_uncached(days, miles, receipts)
+        if self._cache_namespace is None:
+            # Retraining changes the model checksum, editing the rules changes the code hash
+            if self.fast:
+                self.models  # whether the surrogate is in use decides the namespace
+            model = self.model_fingerprint()
+            self._cache_namespace = f'{model[:16]}:{prediction_cache.code_fingerprint()[:16]}'
+            if self.surrogate is not None:
+                # A re-distilled surrogate answers differently for the same models
+                self._cache_namespace += f':fast{self.surrogate_checksum[:16]}'
+            elif self.cascade is not None:
+                self._cache_namespace += f':cascade{self.cascade.key}'
+        cached = self.cache.get(self._cache_namespace, key)
+        if cached is not None:
+            return cached
+        result = self._predict_uncached(days, miles, receipts)
+        self.cache.put(self._cache_namespace, key, result)
+        return result
+    
+    def _predict_uncached(self, days, miles, receipts):
+        if self.metrics is not None:
+            return self._predict_instrumented(days, miles, receipts)
         miles_per_day = miles / max(days, 1)
         receipt_to_mile = receipts / max(miles, 1)
         
@@ -310,4 +534,148 @@ class EnsemblePredictor:
         elif miles_per_day < 50 and receipt_to_mile > 8:
             return self.predict_low_mileage_high_receipt(days, miles, receipts)
         else:
-            return self.predict_normal(days, miles, receipts) 
\ No newline at end of file
+            return self.predict_normal(days, miles, receipts)
+
+    def select_route(self, days, miles, receipts):
+        """Name of the predict() branch that handles a case (see rule_engine.ROUTE_NAMES)"""
+        miles_per_day = miles / max(days, 1)
+        receipt_to_mile = receipts / max(miles, 1)
+        estimated_reasonable = miles * 0.45 + days * 80
+        receipt_to_expected_ratio = receipts / max(estimated_reasonable, 1)
+        
+        if miles_per_day > 600 and miles > 1000 and 3.0 < receipt_to_expected_ratio < 3.3:
+            return 'high_intensity_strict'
+        elif miles_per_day > 600:
+            return 'high_intensity'
+        elif miles_per_day < 50 and receipt_to_mile > 8:
+            return 'low_mileage_high_receipt'
+        elif self.is_extreme_case(days, miles, receipts):
+            return 'extreme_rule_based'
+        return 'ml_ensemble'
+    
+    def _predict_instrumented(self, days, miles, receipts):
+        """predict() that records its route and latency in self.metrics"""
+        route = self.select_route(days, miles, receipts)
+        start = time.perf_counter()
+        if route == 'high_intensity_strict':
+            result = self.predict_high_intensity_strict(days, miles, receipts)
+        elif route == 'high_intensity':
+            result = self.predict_high_intensity(days, miles, receipts)
+        elif route == 'low_mileage_high_receipt':
+            result = self.predict_low_mileage_high_receipt(days, miles, receipts)
+        else:
+            result = self.predict_normal(days, miles, receipts)
+        self.metrics.observe('predict_seconds', time.perf_counter() - start, route=route)
+        self.metrics.increment('predictions_total', route=route)
+        return result
+
+    def predict_batch(self, days, miles=None, receipts=None):
+        """Vectorized predict(): route cases with boolean masks and call each model once.
+
+        Accepts three array-likes, or a DataFrame with the public_cases.json input
+        columns as the only argument. Returns an array matching predict() row for row.
+        """
+        import numpy as np
+        
+        if miles is None and receipts is None:
+            cases = days
+            days = cases['trip_duration_days']
+            miles = cases['miles_traveled']
+            receipts = cases['total_receipts_amount']
+        days = np.asarray(days, dtype=float).ravel()
+        miles = np.asarray(miles, dtype=float).ravel()
+        receipts = np.asarray(receipts, dtype=float).ravel()
+        if not len(days) == len(miles) == len(receipts):
+            raise ValueError("days, miles and receipts must have the same length")
+        
+        if self.grid is not None:
+            result, found = self.grid.lookup_batch(days, miles, receipts)
+            if not found.all():
+                rest = ~found
+                result[rest] = self._predict_batch_live(days[rest], miles[rest], receipts[rest])
+            return result
+        return self._predict_batch_live(days, miles, receipts)
+    
+    def _predict_batch_live(self, days, miles, receipts):
+        import numpy as np
+        import rule_engine
+        
+        result = np.empty(len(days))
+        
+        # Same routing as predict(); rule routes are evaluated as whole arrays
+        routes = rule_engine.route_cases(days, miles, receipts)
+        if self.metrics is not None:
+            for code, count in enumerate(np.bincount(routes, minlength=len(rule_engine.ROUTE_NAMES))):
+                if count:
+                    self.metrics.increment('predictions_total', int(count), route=rule_engine.ROUTE_NAMES[code])
+        for code, route in rule_engine.ROUTE_FUNCTIONS.items():
+            mask = routes == code
+            if mask.any():
+                result[mask] = route(days[mask], miles[mask], receipts[mask])
+        
+        ml = routes == rule_engine.ROUTE_ML
+        if ml.any():
+            result[ml] = self._predict_ml_batch(days[ml], miles[ml], receipts[ml])
+        
+        return result
+    
+    def _predict_ml_batch(self, days, miles, receipts):
+        """Vectorized ML branch of predict_normal() for cases that are not extreme"""
+        import numpy as np
+        import rule_engine
+        
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        features = self._features(days, miles, receipts)
+        if metrics is not None:
+            metrics.observe('stage_seconds', time.perf_counter() - start, stage='features', mode='batch')
+        if self.cascade is not None and self.surrogate is None:
+            # The cascade applies the caps itself; None means these models cannot be cascaded
+            if metrics is not None:
+                start = time.perf_counter()
+            result = self.cascade.predict(self, features, days, miles, receipts)
+            if result is not None:
+                if metrics is not None:
+                    metrics.observe('stage_seconds', time.perf_counter() - start, stage='cascade', mode='batch')
+                return result
+        df = self._model_frame(features)
+        
+        weighted_pred = self._ensemble_average(df)
+        if weighted_pred is None:
+            # Fallback to rule-based if no models available
+            return rule_engine.rule_based_calculation(days, miles, receipts)
+        
+        if metrics is not None:
+            start = time.perf_counter()
+        weighted_pred = self._apply_ml_caps(weighted_pred, days, miles, receipts)
+        if metrics is not None:
+            metrics.observe('stage_seconds', time.perf_counter() - start, stage='caps', mode='batch')
+        return weighted_pred
+    
+    @staticmethod
+    def _ml_cap_limits(days, miles, receipts):
+        """(ceiling, floor) the post-ML caps of predict_normal() clamp each prediction to.
+
+        ±inf where a cap does not apply. Clamping is non-decreasing in the
+        prediction, so clamped interval ends bound everything inside (see cascade.py).
+        """
+        import numpy as np
+        
+        miles_per_day = miles / np.maximum(days, 1)
+        receipt_to_mile = receipts / np.maximum(miles, 1)
+        
+        short_high_receipt = (receipt_to_mile > 15) & (days <= 4)
+        ceiling = np.where(short_high_receipt, 300 * days, np.inf)
+        
+        high_intensity = miles_per_day > 400
+        floor = np.where(high_intensity, 100 * days + 0.3 * miles, -np.inf)
+        return ceiling, floor
+    
+    @classmethod
+    def _apply_ml_caps(cls, weighted_pred, days, miles, receipts):
+        """Same post-ML caps as predict_normal(), on arrays"""
+        import numpy as np
+        
+        ceiling, floor = cls._ml_cap_limits(days, miles, receipts)
+        return np.maximum(np.minimum(weighted_pred, ceiling), floor)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""In-process replacement for eval.sh.
+
+eval.sh forks ./run.sh once per case and calls bc several times per case. This
+loads public_cases.json once, scores every case with predict_batch and
+reproduces eval.sh's metrics exactly: the same formatted two-decimal outputs,
+the same thresholds, bc's truncating arithmetic and the same top-5 ordering.
+
+    python evaluate.py                      # batch prediction in this process
+    python evaluate.py --workers 4          # split the cases over a process pool
+    python evaluate.py --via-run-sh         # score through ./run.sh (shell contract check)
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+from decimal import ROUND_DOWN, Decimal
+
+# eval.sh accepts run.sh output matching this pattern
+OUTPUT_PATTERN = re.compile(r'^-?[0-9]+\.?[0-9]*$')
+EXACT_THRESHOLD = Decimal('0.01')
+CLOSE_THRESHOLD = Decimal('1.0')
+TOP_CASES = 5
+
+
+def load_cases(path='public_cases.json'):
+    """Cases with numbers kept as written in the file, like jq prints them"""
+    with open(path, 'r') as f:
+        return json.load(f, parse_float=Decimal)
+
+
+def _format_outputs(results):
+    # run.sh prints f'{result:.2f}'; eval.sh compares against that text
+    return [f'{float(r):.2f}' for r in results]
+
+
+def _predict_chunk(triples):
+    import numpy as np
+    from ensemble import EnsemblePredictor
+
+    predictor = EnsemblePredictor(compiled=True)
+    days, miles, receipts = (np.array(column, dtype=float) for column in zip(*triples))
+    try:
+        return _format_outputs(predictor.predict_batch(days, miles, receipts)), [None] * len(triples)
+    except Exception:
+        pass
+    # Some case in the chunk fails: score one by one so only that case is an error
+    outputs, errors = [], []
+    for triple in triples:
+        try:
+            outputs.extend(_format_outputs([predictor.predict(*map(float, triple))]))
+            errors.append(None)
+        except Exception as e:
+            outputs.append(None)
+            errors.append(f'{type(e).__name__}: {e}')
+    return outputs, errors
+
+
+def predict_outputs(triples, workers=1):
+    """run.sh-formatted output (or None) and error message (or None) for every case"""
+    if workers <= 1 or len(triples) < 2 * workers:
+        return _predict_chunk(triples)
+    from concurrent.futures import ProcessPoolExecutor
+
+    size = -(-len(triples) // workers)
+    chunks = [triples[i:i + size] for i in range(0, len(triples), size)]
+    outputs, errors = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_outputs, chunk_errors in pool.map(_predict_chunk, chunks):
+            outputs.extend(chunk_outputs)
+            errors.extend(chunk_errors)
+    return outputs, errors
+
+
+def _run_sh_case(triple):
+    args = ['./run.sh'] + [str(value) for value in triple]
+    result = subprocess.run(args, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, 'Script failed with error: ' + result.stderr.replace('\n', '')
+    return ''.join(result.stdout.split()), None
+
+
+def run_sh_outputs(triples, workers=1):
+    """Outputs gathered by calling ./run.sh per case, as eval.sh does"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        pairs = list(pool.map(_run_sh_case, triples))
+    return [output for output, _ in pairs], [error for _, error in pairs]
+
+
+def _truncate(value, places):
+    # bc's `scale=N` division truncates rather than rounds
+    return value.quantize(Decimal(1).scaleb(-places), rounding=ROUND_DOWN)
+
+
+def bc_format(value):
+    """Print a Decimal the way bc does: no leading zero before the point"""
+    if value == 0:
+        return '0'
+    text = format(value, 'f')
+    if text.startswith('0.'):
+        return text[1:]
+    if text.startswith('-0.'):
+        return '-' + text[2:]
+    return text
+
+
+def score_outputs(cases, outputs, errors):
+    """eval.sh's metrics for the given run.sh-style outputs"""
+    results = []
+    messages = []
+    total_error = Decimal(0)
+    max_error = Decimal(0)
+    exact = close = 0
+    for i, (case, output, error) in enumerate(zip(cases, outputs, errors), start=1):
+        if error is not None:
+            messages.append(f'Case {i}: {error}' if error.startswith('Script failed')
+                            else f'Case {i}: Script failed with error: {error}')
+            continue
+        if not OUTPUT_PATTERN.match(output):
+            messages.append(f'Case {i}: Invalid output format: {output}')
+            continue
+        expected = Decimal(case['expected_output'])
+        diff = abs(Decimal(output) - expected)
+        inputs = case['input']
+        results.append((i, expected, Decimal(output), diff, inputs['trip_duration_days'],
+                        inputs['miles_traveled'], inputs['total_receipts_amount']))
+        exact += diff < EXACT_THRESHOLD
+        close += diff < CLOSE_THRESHOLD
+        total_error += diff
+        if diff > max_error:
+            max_error = diff
+
+    successful = len(results)
+    metrics = {
+        'num_cases': len(cases),
+        'successful_runs': successful,
+        'exact_matches': exact,
+        'close_matches': close,
+        'errors': messages,
+    }
+    if not successful:
+        return metrics
+
+    avg_error = _truncate(total_error / successful, 2)
+    metrics.update({
+        'exact_pct': _truncate(Decimal(exact * 100) / successful, 1),
+        'close_pct': _truncate(Decimal(close * 100) / successful, 1),
+        'avg_error': avg_error,
+        'max_error': max_error,
+        'score': avg_error * 100 + (len(cases) - exact) * Decimal('0.1'),
+    })
+
+    # `sort -t: -k4 -nr`: error descending, ties broken by the whole line, descending
+    lines = [(row, ':'.join(bc_format(v) if isinstance(v, Decimal) and k == 3 else str(v)
+                            for k, v in enumerate(row))) for row in results]
+    lines.sort(key=lambda item: (item[0][3], item[1]), reverse=True)
+    metrics['high_error_cases'] = [row for row, _ in lines[:TOP_CASES]]
+    return metrics
+
+
+def format_report(metrics):
+    """The results section of eval.sh's output"""
+    out = []
+    if not metrics['successful_runs']:
+        out.append('❌ No successful test cases!')
+    else:
+        out += [
+            '✅ Evaluation Complete!',
+            '',
+            '📈 Results Summary:',
+            f"  Total test cases: {metrics['num_cases']}",
+            f"  Successful runs: {metrics['successful_runs']}",
+            f"  Exact matches (±$0.01): {metrics['exact_matches']} ({bc_format(metrics['exact_pct'])}%)",
+            f"  Close matches (±$1.00): {metrics['close_matches']} ({bc_format(metrics['close_pct'])}%)",
+            f"  Average error: ${bc_format(metrics['avg_error'])}",
+            f"  Maximum error: ${bc_format(metrics['max_error'])}",
+            '',
+            f"🎯 Your Score: {bc_format(metrics['score'])} (lower is better)",
+        ]
+        if metrics['exact_matches'] < metrics['num_cases']:
+            out += ['', '  Check these high-error cases:']
+            for case_num, expected, actual, error, days, miles, receipts in metrics['high_error_cases']:
+                out.append(f'    Case {case_num}: {days} days, {miles} miles, ${receipts} receipts')
+                out.append(f'      Expected: ${float(expected):.2f}, Got: ${float(actual):.2f}, '
+                           f'Error: ${float(error):.2f}')
+    if metrics['errors']:
+        out += ['', '⚠️  Errors encountered:']
+        out += [f'  {message}' for message in metrics['errors'][:10]]
+        if len(metrics['errors']) > 10:
+            out.append(f"  ... and {len(metrics['errors']) - 10} more errors")
+    return '\n'.join(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', default='public_cases.json')
+    parser.add_argument('--workers', type=int, default=1, help='processes (or run.sh calls) in parallel')
+    parser.add_argument('--via-run-sh', action='store_true', help='score each case through ./run.sh')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    cases = load_cases(args.cases)
+    triples = [(c['input']['trip_duration_days'], c['input']['miles_traveled'],
+                c['input']['total_receipts_amount']) for c in cases]
+    if args.via_run_sh:
+        outputs, errors = run_sh_outputs(triples, args.workers)
+    else:
+        outputs, errors = predict_outputs(triples, args.workers)
+    metrics = score_outputs(cases, outputs, errors)
+    print(format_report(metrics))
+    print(f"\nEvaluated {len(cases)} cases in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,9 @@
-import pandas as pd
 import numpy as np
 
 def engineer_features(df):
+    # pandas is only needed here; the array fast path below works without it
+    import pandas as pd
+    
     # Prevent divide by zero and add small epsilon
     df = df.copy()
     
@@ -107,4 +109,76 @@ def engineer_features(df):
         df['receipts_per_day'] / 100, 0
     )
     
-    return df
\ No newline at end of file
+    return df
+
+
+# Column order of engineer_features() output, which is what the trained models expect
+INPUT_COLUMNS = ['trip_duration_days', 'miles_traveled', 'total_receipts_amount']
+FEATURE_COLUMNS = INPUT_COLUMNS + [
+    'miles_per_day', 'receipts_per_day', 'log_miles_per_day', 'log_receipts_per_day',
+    'efficiency_score', 'sweet_spot_5day', 'low_receipt_score', 'high_spending_penalty',
+    'miles_per_day_soft_cap', 'receipts_per_day_soft_cap', 'miles_receipts_interaction',
+    'receipts_to_miles_ratio', 'sqrt_miles', 'sqrt_receipts', 'mileage_receipt_balance',
+    'intensity_spending_score', 'efficiency_cost_ratio', 'high_miles_low_receipt',
+    'low_miles_high_receipt', 'proportional_spending', 'extreme_receipt_pattern',
+    'duration_miles_interaction', 'duration_receipts_interaction', 'miles_squared_per_receipt',
+    'receipts_squared_per_mile', 'trip_intensity', 'high_miles_efficiency', 'total_trip_score',
+    'spending_category', 'long_trip_receipt_penalty', 'extreme_mileage_flag', 'extreme_intensity',
+    'high_spend_low_miles',
+]
+
+
+def allocate_feature_buffer(n_rows):
+    """Feature buffer for engineer_features_array; column-major so every feature is contiguous"""
+    return np.empty((n_rows, len(FEATURE_COLUMNS)), order='F')
+
+
+def engineer_features_array(days, miles, receipts, out=None):
+    """Fast path of engineer_features for one case or a batch, without pandas.
+
+    Evaluates the formulas registered in feature_registry and writes the same
+    values as engineer_features, in FEATURE_COLUMNS order, into `out` (see
+    allocate_feature_buffer) and returns it. Reusing `out` across calls avoids
+    allocating the feature matrix. The DataFrame version stays the reference
+    and is what training uses.
+    """
+    from feature_registry import FULL_PLAN
+    return FULL_PLAN.compute(days, miles, receipts, out)
+
+
+def check_feature_parity(case_files=('public_cases.json', 'private_cases.json')):
+    """Compare engineer_features_array with engineer_features on the case files.
+
+    Checks the whole batch and single-row calls into a reused buffer; returns the
+    names of features that differ (empty when the paths agree exactly).
+    """
+    import json
+    import pandas as pd
+
+    mismatched = set()
+    for path in case_files:
+        with open(path, 'r') as f:
+            cases = pd.DataFrame([c.get('input', c) for c in json.load(f)])
+        reference = engineer_features(cases)
+        if list(reference.columns) != FEATURE_COLUMNS:
+            raise AssertionError(f"engineer_features columns changed: {list(reference.columns)}")
+        expected = reference.to_numpy(dtype=float)
+
+        batch = engineer_features_array(cases['trip_duration_days'], cases['miles_traveled'],
+                                        cases['total_receipts_amount'])
+        buffer = allocate_feature_buffer(1)
+        rows = np.vstack([
+            engineer_features_array(d, m, r, out=buffer).copy()
+            for d, m, r in cases[INPUT_COLUMNS].itertuples(index=False)
+        ])
+        for got in (batch, rows):
+            differs = ~((got == expected) | (np.isnan(got) & np.isnan(expected))).all(axis=0)
+            mismatched.update(np.array(FEATURE_COLUMNS)[differs])
+    return sorted(mismatched)
+
+
+if __name__ == '__main__':
+    differing = check_feature_parity()
+    if differing:
+        raise SystemExit(f"Fast feature path differs from engineer_features on: {differing}")
+    print(f"engineer_features_array matches engineer_features on all {len(FEATURE_COLUMNS)} columns")
@@ -0,0 +1,403 @@
+"""Declarative registry of the engineered features, computed on demand.
+
+Every feature of feature_eng.FEATURE_COLUMNS is a small function registered
+with @feature; its parameter names are the inputs or other features it reads.
+A FeaturePlan resolves those dependencies once for a set of wanted columns
+and then computes only what they need, in dependency order, sharing
+intermediates such as miles_per_day and receipts_to_miles_ratio. These are the
+only array formulas: engineer_features_array is FULL_PLAN.compute, and the
+values are bit-identical to the DataFrame engineer_features.
+
+    plan = plan_for_models(predictor.models)   # columns the models actually read
+    X = plan.compute(days, miles, receipts)     # FEATURE_COLUMNS layout, unread columns 0
+
+    python feature_registry.py                  # parity with engineer_features, per-model column usage
+    python feature_registry.py report           # pruning report for the saved models
+
+pruning_report() ranks the columns by importance in trained models and flags
+exact duplicates; train_ensemble.py prints it after training.
+"""
+import inspect
+
+import numpy as np
+
+from feature_eng import FEATURE_COLUMNS, INPUT_COLUMNS, allocate_feature_buffer
+
+FEATURES = {}
+_INDEX = {name: i for i, name in enumerate(FEATURE_COLUMNS)}
+
+
+class Feature:
+    __slots__ = ('name', 'inputs', 'compute')
+
+    def __init__(self, name, inputs, compute):
+        self.name = name
+        self.inputs = inputs
+        self.compute = compute
+
+
+def feature(fn):
+    """Register fn as the feature named after it; its parameters name what it reads"""
+    FEATURES[fn.__name__] = Feature(fn.__name__, tuple(inspect.signature(fn).parameters), fn)
+    return fn
+
+
+@feature
+def miles_per_day(miles_traveled, trip_duration_days):
+    return miles_traveled / np.maximum(trip_duration_days, 0.1)
+
+
+@feature
+def receipts_per_day(total_receipts_amount, trip_duration_days):
+    return total_receipts_amount / np.maximum(trip_duration_days, 0.1)
+
+
+@feature
+def log_miles_per_day(miles_per_day):
+    return np.log1p(miles_per_day)
+
+
+@feature
+def log_receipts_per_day(receipts_per_day):
+    return np.log1p(receipts_per_day)
+
+
+@feature
+def efficiency_score(miles_per_day):
+    # Peaks at 200 miles/day, tapers off gradually
+    return np.exp(-((miles_per_day - 200)**2) / (2 * 50**2))
+
+
+@feature
+def sweet_spot_5day(trip_duration_days):
+    return trip_duration_days == 5
+
+
+@feature
+def low_receipt_score(total_receipts_amount):
+    return np.where(total_receipts_amount < 50, 1 - (total_receipts_amount / 50), 0)
+
+
+@feature
+def high_spending_penalty(receipts_per_day):
+    return np.maximum(0, (receipts_per_day - 150) / 100)
+
+
+@feature
+def miles_per_day_soft_cap(miles_per_day):
+    return np.minimum(miles_per_day, 1000)
+
+
+@feature
+def receipts_per_day_soft_cap(receipts_per_day):
+    return np.minimum(receipts_per_day, 1000)
+
+
+@feature
+def miles_receipts_interaction(miles_per_day, receipts_per_day):
+    return miles_per_day * receipts_per_day
+
+
+@feature
+def receipts_to_miles_ratio(total_receipts_amount, miles_traveled):
+    return total_receipts_amount / np.maximum(miles_traveled, 0.1)
+
+
+@feature
+def sqrt_miles(miles_traveled):
+    return np.sqrt(miles_traveled)
+
+
+@feature
+def sqrt_receipts(total_receipts_amount):
+    return np.sqrt(total_receipts_amount)
+
+
+@feature
+def mileage_receipt_balance(receipts_to_miles_ratio):
+    expected_receipts_per_mile = 1.5
+    return np.abs(receipts_to_miles_ratio - expected_receipts_per_mile) / expected_receipts_per_mile
+
+
+@feature
+def intensity_spending_score(miles_per_day, log_receipts_per_day):
+    return miles_per_day * log_receipts_per_day
+
+
+@feature
+def efficiency_cost_ratio(miles_traveled, total_receipts_amount):
+    return miles_traveled / np.maximum(total_receipts_amount, 1)
+
+
+@feature
+def high_miles_low_receipt(miles_per_day, receipts_to_miles_ratio):
+    return np.where((miles_per_day > 400) & (receipts_to_miles_ratio < 2), miles_per_day / 100, 0)
+
+
+@feature
+def low_miles_high_receipt(miles_per_day, receipts_to_miles_ratio):
+    return np.where((miles_per_day < 100) & (receipts_to_miles_ratio > 5), receipts_to_miles_ratio / 10, 0)
+
+
+@feature
+def proportional_spending(receipts_per_day, trip_duration_days, miles_traveled):
+    return receipts_per_day * trip_duration_days / np.maximum(miles_traveled, 1)
+
+
+@feature
+def extreme_receipt_pattern(receipts_to_miles_ratio, miles_per_day):
+    return np.where((receipts_to_miles_ratio > 3) & (miles_per_day > 500),
+                    receipts_to_miles_ratio * miles_per_day / 1000, 0)
+
+
+@feature
+def duration_miles_interaction(trip_duration_days, miles_per_day):
+    return trip_duration_days * miles_per_day / 100
+
+
+@feature
+def duration_receipts_interaction(trip_duration_days, receipts_per_day):
+    return trip_duration_days * receipts_per_day / 100
+
+
+@feature
+def miles_squared_per_receipt(miles_per_day, receipts_per_day):
+    return miles_per_day ** 2 / np.maximum(receipts_per_day, 1)
+
+
+@feature
+def receipts_squared_per_mile(receipts_per_day, miles_per_day):
+    return receipts_per_day ** 2 / np.maximum(miles_per_day, 1)
+
+
+@feature
+def trip_intensity(miles_traveled, total_receipts_amount, trip_duration_days):
+    return miles_traveled * total_receipts_amount / trip_duration_days
+
+
+@feature
+def high_miles_efficiency(miles_per_day_soft_cap):
+    # Same values as miles_per_day_soft_cap; kept because the trained models expect the column
+    return miles_per_day_soft_cap
+
+
+@feature
+def total_trip_score(miles_traveled, trip_duration_days):
+    return miles_traveled * trip_duration_days
+
+
+@feature
+def spending_category(receipts_per_day_soft_cap, trip_duration_days, total_receipts_amount):
+    # pd.cut(..., bins=[0, 75, 120, inf]) in engineer_features: values at or
+    # below 0 (or NaN) have no category and make it fail
+    if not (receipts_per_day_soft_cap > 0).all():
+        first = np.flatnonzero(~(receipts_per_day_soft_cap > 0))[0]
+        raise ValueError(f"Receipts per day must be positive; got trip_duration_days="
+                         f"{trip_duration_days[first]:g}, total_receipts_amount={total_receipts_amount[first]:g}")
+    return (receipts_per_day_soft_cap > 75).astype(float) + (receipts_per_day_soft_cap > 120)
+
+
+@feature
+def long_trip_receipt_penalty(trip_duration_days, receipts_per_day):
+    return np.where(trip_duration_days > 7, receipts_per_day / 1000, 0)
+
+
+@feature
+def extreme_mileage_flag(miles_per_day):
+    return miles_per_day > 1000
+
+
+@feature
+def extreme_intensity(miles_per_day):
+    return np.where(miles_per_day > 500, (miles_per_day - 500) / 1000, 0)
+
+
+@feature
+def high_spend_low_miles(receipts_per_day, miles_per_day):
+    return np.where((receipts_per_day > 200) & (miles_per_day < 100), receipts_per_day / 100, 0)
+
+
+# Computed by every plan: spending_category is what rejects invalid inputs, and
+# skipping it must not turn a failing case into a prediction
+ALWAYS_COMPUTED = ('spending_category',)
+
+
+class FeaturePlan:
+    """The features needed for a set of columns, in dependency order"""
+
+    def __init__(self, columns=FEATURE_COLUMNS):
+        unknown = set(columns) - set(FEATURE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown feature columns: {sorted(unknown)}")
+        self.columns = [name for name in FEATURE_COLUMNS if name in set(columns)]
+        self.order = []
+        seen = set(INPUT_COLUMNS)
+        for name in self.columns + list(ALWAYS_COMPUTED):
+            self._visit(name, seen, ())
+        # compute() keeps values in a list: the inputs, then each feature in order
+        slots = {name: i for i, name in enumerate(INPUT_COLUMNS + self.computed)}
+        self._steps = [(f.compute, [slots[name] for name in f.inputs]) for f in self.order]
+        # Columns left out of the output stay 0: trees never read them and the linear
+        # models' coefficients for them are 0
+        self._outputs = [(slot, _INDEX[name]) for name, slot in slots.items() if name in set(self.columns)]
+        self._unused = [i for name, i in _INDEX.items() if name not in set(self.columns)]
+
+    def _visit(self, name, seen, path):
+        if name in seen:
+            return
+        if name in path:
+            raise ValueError(f"Feature dependency cycle: {' -> '.join(path + (name,))}")
+        if name not in FEATURES:
+            raise ValueError(f"{path[-1] if path else 'plan'} reads unknown feature {name!r}")
+        for dependency in FEATURES[name].inputs:
+            self._visit(dependency, seen, path + (name,))
+        seen.add(name)
+        self.order.append(FEATURES[name])
+
+    @property
+    def computed(self):
+        """Names of the features this plan evaluates (dependencies included)"""
+        return [f.name for f in self.order]
+
+    def compute(self, days, miles, receipts, out=None):
+        """FEATURE_COLUMNS matrix for the cases, written into `out` when given"""
+        values = [np.asarray(column, dtype=float).reshape(-1) for column in (days, miles, receipts)]
+        for compute, inputs in self._steps:
+            values.append(compute(*[values[slot] for slot in inputs]))
+        if out is None:
+            out = allocate_feature_buffer(len(values[0]))
+        for slot, index in self._outputs:
+            out[:, index] = values[slot]
+        if self._unused:
+            out[:, self._unused] = 0.0
+        return out
+
+
+# Every column: what engineer_features_array computes
+FULL_PLAN = FeaturePlan()
+
+
+def columns_used(model):
+    """FEATURE_COLUMNS a fitted or compiled model reads (all of them when unknown)"""
+    if hasattr(model, 'is_leaf'):  # compiled_models.CompiledTrees
+        used = np.unique(model.feature[~model.is_leaf])
+    elif hasattr(model, 'booster_'):  # LGBMRegressor
+        used = np.flatnonzero(model.booster_.feature_importance('split'))
+    elif hasattr(model, 'estimators_'):  # RandomForestRegressor
+        used = np.unique(np.concatenate([tree.tree_.feature[tree.tree_.feature >= 0]
+                                         for tree in model.estimators_]))
+    elif hasattr(model, 'coef_') or hasattr(model, 'coef'):  # LinearRegression / CompiledLinear
+        used = np.flatnonzero(np.ravel(getattr(model, 'coef_', getattr(model, 'coef', None))))
+    else:
+        return list(FEATURE_COLUMNS)
+    return [FEATURE_COLUMNS[i] for i in sorted(int(i) for i in used)]
+
+
+def plan_for_models(models):
+    """FeaturePlan for the union of the columns the models read"""
+    wanted = set()
+    for model in models.values():
+        wanted.update(columns_used(model))
+    return FeaturePlan(sorted(wanted, key=_INDEX.get))
+
+
+def _importances(name, model, X):
+    # Share of each column's contribution, summing to 1 per model
+    if name == 'lgb':
+        raw = model.booster_.feature_importance('gain')
+    elif name == 'rf':
+        raw = model.feature_importances_
+    else:
+        # |coefficient| x column standard deviation: the spread each column adds
+        raw = np.abs(np.ravel(model.coef_)) * np.asarray(X).std(axis=0)
+    raw = np.asarray(raw, dtype=float)
+    return raw / raw.sum() if raw.sum() else raw
+
+
+def pruning_report(models, X, weights=None, threshold=0.001):
+    """Rank columns by weighted importance in fitted models and flag duplicates.
+
+    Returns one dict per column (most important first) with the per-model and
+    ensemble-weighted importance, the column it duplicates exactly (if any),
+    and 'prune' set when the column duplicates another or its weighted
+    importance is below `threshold`.
+    """
+    from ensemble import MODEL_WEIGHTS
+
+    weights = weights or MODEL_WEIGHTS
+    X = np.asarray(X, dtype=float)
+    per_model = {name: _importances(name, model, X) for name, model in models.items()}
+    total = sum(weights[name] for name in per_model)
+    combined = sum(weights[name] * importance for name, importance in per_model.items()) / total
+
+    duplicate_of = {}
+    for j, name in enumerate(FEATURE_COLUMNS):
+        for i in range(j):
+            if FEATURE_COLUMNS[i] not in duplicate_of and np.array_equal(X[:, i], X[:, j]):
+                duplicate_of[name] = FEATURE_COLUMNS[i]
+                break
+
+    rows = []
+    for j, name in enumerate(FEATURE_COLUMNS):
+        rows.append({
+            'feature': name,
+            'importance': float(combined[j]),
+            **{name_: float(importance[j]) for name_, importance in per_model.items()},
+            'duplicate_of': duplicate_of.get(name),
+            'prune': name not in INPUT_COLUMNS and (name in duplicate_of or combined[j] < threshold),
+        })
+    rows.sort(key=lambda row: row['importance'], reverse=True)
+    return rows
+
+
+def format_pruning_report(rows):
+    names = [key for key in ('lgb', 'rf', 'lr') if key in rows[0]]
+    lines = [f"{'feature':32} {'weighted':>9} " + ' '.join(f'{name:>7}' for name in names)]
+    for row in rows:
+        note = f"duplicate of {row['duplicate_of']}" if row['duplicate_of'] else ('prune' if row['prune'] else '')
+        lines.append(f"{row['feature']:32} {row['importance']:9.4f} "
+                     + ' '.join(f"{row[name]:7.4f}" for name in names) + f"  {note}")
+    pruned = [row['feature'] for row in rows if row['prune']]
+    lines.append(f"{len(pruned)} of {len(rows)} columns are pruning candidates: {', '.join(pruned) or 'none'}")
+    return '\n'.join(lines)
+
+
+def _report_saved_models():
+    from ensemble import EnsemblePredictor
+    from feature_store import load_features
+
+    models = EnsemblePredictor(bundle=None).models  # importances need the fitted objects
+    print(format_pruning_report(pruning_report(models, load_features('public_cases.json').X)))
+
+
+if __name__ == '__main__':
+    import sys
+
+    if sys.argv[1:] == ['report']:
+        _report_saved_models()
+        sys.exit()
+
+    from ensemble import EnsemblePredictor
+    from feature_eng import check_feature_parity
+    from feature_store import load_features
+
+    differing = check_feature_parity()
+    if differing:
+        raise SystemExit(f"Feature registry differs from engineer_features on: {differing}")
+    print(f"Feature registry matches engineer_features on all {len(FEATURE_COLUMNS)} columns")
+
+    days, miles, receipts = np.asarray(load_features('private_cases.json').inputs).T
+    expected = FULL_PLAN.compute(days, miles, receipts)
+
+    predictor = EnsemblePredictor(compiled=True, lazy=False, fast=True)
+    models = dict(predictor.models)
+    if predictor.surrogate is not None:
+        models['surrogate'] = predictor.surrogate
+    for name, model in models.items():
+        # Columns a plan leaves at 0 must not change the model's predictions
+        pruned = plan_for_models({name: model}).compute(days, miles, receipts)
+        if not np.array_equal(model.predict(pruned), model.predict(expected)):
+            raise SystemExit(f"{name} predicts differently from its pruned feature plan")
+        print(f"  {name}: reads {len(columns_used(model))} of {len(FEATURE_COLUMNS)} columns")
+    plan = plan_for_models(predictor.models)
+    print(f"  ensemble plan computes {len(plan.computed)} features for {len(plan.columns)} columns")
@@ -0,0 +1,138 @@
+"""Cached engineered-feature matrices shared by training, tuning and evaluation.
+
+The first request for a case file parses it, runs engineer_features and saves
+the result under .feature_store/ as plain .npy files. Later requests
+memory-map those files instead of re-parsing the JSON and re-engineering.
+
+Entries are keyed on a hash of the case file plus the feature_eng.py source,
+so editing either rebuilds the entry on next use; stale entries for the same
+file are removed then.
+
+    features = load_features('public_cases.json')
+    features.X          # (n_cases, 36) float64 memmap, FEATURE_COLUMNS order
+    features.y          # expected_output memmap, or None for private cases
+    features.frame()    # DataFrame view for the sklearn/LightGBM models
+
+    python feature_store.py [case files...]    # build (or verify) entries and print them
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+STORE_DIR = '.feature_store'
+# Bump when the on-disk layout changes
+STORE_VERSION = 1
+
+_FEATURE_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feature_eng.py')
+
+
+class FeatureSet:
+    """Memory-mapped engineered features (and target, when known) for one case file"""
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = meta
+        self.columns = meta['columns']
+        self.X = np.load(os.path.join(directory, 'features.npy'), mmap_mode='r')
+        self.inputs = np.load(os.path.join(directory, 'inputs.npy'), mmap_mode='r')
+        target = os.path.join(directory, 'target.npy')
+        self.y = np.load(target, mmap_mode='r') if os.path.exists(target) else None
+
+    def __len__(self):
+        return len(self.X)
+
+    @property
+    def key(self):
+        return self.meta['key']
+
+    def frame(self):
+        """The features as a DataFrame with the trained column names (no copy)"""
+        import pandas as pd
+        return pd.DataFrame(self.X, columns=self.columns, copy=False)
+
+
+def store_key(path):
+    """Hash of the case file contents, the feature code and the store layout"""
+    digest = hashlib.sha256(f'feature-store-v{STORE_VERSION}\0'.encode())
+    for source in (path, _FEATURE_SOURCE):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def entry_prefix(path):
+    """Store entry name prefix for a case file: its base name plus a hash of its location.
+
+    Same-named files in different directories get separate entries; the case
+    store names its entries the same way.
+    """
+    location = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+    return f'{os.path.splitext(os.path.basename(path))[0]}-{location}-'
+
+
+def _build(path, directory, key):
+    import pandas as pd
+    from case_store import load_cases
+    from feature_eng import INPUT_COLUMNS, engineer_features
+
+    # The JSON is parsed once, into the case store, and read back from there
+    cases = load_cases(path)
+    inputs = pd.DataFrame(cases.inputs(), columns=INPUT_COLUMNS)
+    features = engineer_features(inputs)
+
+    # Write into a scratch directory and rename, so readers never see half an entry
+    tmp = f'{directory}.tmp{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'features.npy'), features.to_numpy(dtype=np.float64))
+    np.save(os.path.join(tmp, 'inputs.npy'), inputs.to_numpy(dtype=np.float64))
+    if cases.expected is not None:
+        np.save(os.path.join(tmp, 'target.npy'), np.asarray(cases.expected, dtype=np.float64))
+    meta = {'key': key, 'source': os.path.abspath(path), 'rows': len(features),
+            'columns': list(features.columns), 'version': STORE_VERSION}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    try:
+        os.rename(tmp, directory)
+    except OSError:
+        # Another process built the same entry first; theirs is identical
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_features(path='public_cases.json', store_dir=STORE_DIR):
+    """FeatureSet for a case file, building the cache entry if it is missing or stale"""
+    key = store_key(path)
+    prefix = entry_prefix(path)
+    directory = os.path.join(store_dir, prefix + key[:16])
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        os.makedirs(store_dir, exist_ok=True)
+        _build(path, directory, key)
+        # Entries for older versions of this file or of feature_eng.py are dead
+        for name in os.listdir(store_dir):
+            stale = os.path.join(store_dir, name)
+            if name.startswith(prefix) and len(name) == len(prefix) + 16 and stale != directory:
+                shutil.rmtree(stale, ignore_errors=True)
+    with open(os.path.join(directory, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    return FeatureSet(directory, meta)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    from feature_eng import FEATURE_COLUMNS
+
+    for path in sys.argv[1:] or ['public_cases.json', 'private_cases.json']:
+        start = time.perf_counter()
+        features = load_features(path)
+        elapsed = (time.perf_counter() - start) * 1000
+        assert features.columns == FEATURE_COLUMNS, "feature_eng column order changed"
+        target = 'with target' if features.y is not None else 'no target'
+        print(f"{path}: {len(features)} rows x {len(features.columns)} features, {target}, "
+              f"key {features.key[:16]} ({elapsed:.0f} ms) -> {features.directory}")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Streaming replacement for generate_results.sh.
+
+Reads the case file incrementally (case_io.iter_json_array), scores it chunk
+by chunk with predict_batch and writes one line per case, in order, through a
+buffered writer. The output is byte-compatible with generate_results.sh: the
+run.sh-formatted amount, or ERROR when a case cannot be scored. Memory stays
+bounded by the chunk size, so the same pipeline runs over the full claims
+history.
+
+    python generate_results.py                                  # private_cases.json -> private_results.txt
+    python generate_results.py claims.json claims_results.txt --chunk-size 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+from case_io import iter_case_chunks
+from evaluate import OUTPUT_PATTERN
+
+DEFAULT_CHUNK_SIZE = 10_000
+_WRITE_BUFFER = 1 << 20
+
+
+def score_chunk(predictor, days, miles, receipts):
+    """run.sh-formatted outputs for a chunk, with None (and an error) for failed cases.
+
+    A chunk that fails as a whole is split in halves until the failing cases
+    are isolated, so one bad case costs O(log n) batch calls, not a scalar pass.
+    """
+    import numpy as np
+
+    try:
+        results = predictor.predict_batch(np.array(days, dtype=float), np.array(miles, dtype=float),
+                                          np.array(receipts, dtype=float))
+    except (TypeError, ValueError, ArithmeticError) as e:
+        if len(days) == 1:
+            return [None], [f'{type(e).__name__}: {e}']
+        half = len(days) // 2
+        first = score_chunk(predictor, days[:half], miles[:half], receipts[:half])
+        second = score_chunk(predictor, days[half:], miles[half:], receipts[half:])
+        return first[0] + second[0], first[1] + second[1]
+
+    outputs, errors = [], []
+    for result in results:
+        output = f'{result:.2f}'
+        if OUTPUT_PATTERN.match(output):
+            outputs.append(output)
+            errors.append(None)
+        else:
+            outputs.append(None)
+            errors.append(f'Invalid output format: {output}')
+    return outputs, errors
+
+
+def generate_results(cases_path='private_cases.json', output_path='private_results.txt',
+                     chunk_size=DEFAULT_CHUNK_SIZE, predictor=None, log=sys.stderr):
+    """Write one result line per case; returns (cases written, ERROR lines)"""
+    if predictor is None:
+        from ensemble import EnsemblePredictor
+        predictor = EnsemblePredictor(compiled=True)
+    predictor.models  # a broken bundle should fail the run, not turn every case into ERROR
+
+    written = failed = 0
+    # Write next to the target and rename, so a crash never leaves a partial file
+    tmp_path = f'{output_path}.tmp'
+    with open(tmp_path, 'w', buffering=_WRITE_BUFFER) as out:
+        for days, miles, receipts in iter_case_chunks(cases_path, chunk_size):
+            outputs, errors = score_chunk(predictor, days, miles, receipts)
+            for i, (output, error) in enumerate(zip(outputs, errors), start=written + 1):
+                if output is None:
+                    print(f'Error on case {i}: {error}', file=log)
+                    out.write('ERROR\n')
+                    failed += 1
+                else:
+                    out.write(output + '\n')
+            written += len(outputs)
+            print(f'Progress: {written} cases processed...', file=log)
+    os.replace(tmp_path, output_path)
+    return written, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cases', nargs='?', default='private_cases.json')
+    parser.add_argument('output', nargs='?', default='private_results.txt')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    written, failed = generate_results(args.cases, args.output, args.chunk_size)
+    print(f'Wrote {written} results ({failed} ERROR) to {args.output} '
+          f'in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Update the trained ensemble with a new batch of labelled cases.
+
+Instead of retraining on the whole history with train_ensemble.py:
+  * LightGBM keeps its trees and boosts --lgb-rounds more on the new batch (init_model)
+  * RandomForest keeps its trees and grows --rf-trees more on the new batch (warm_start)
+  * LinearRegression is re-solved from running sufficient statistics (LINEAR_STATS_FILE),
+    so the new batch is merged exactly without rereading older data
+
+    python incremental_update.py new_cases.json                      # update and save
+    python incremental_update.py new_cases.json --dry-run            # report only
+    python incremental_update.py new_cases.json --holdout public_cases.json
+
+The report shows how far each model's predictions, and the final predict_batch
+outputs, moved on the holdout file; with labels it also scores both versions
+the way eval.sh does. Saving rewrites the pickles, the model bundle and the
+linear statistics.
+"""
+import argparse
+import copy
+import os
+import time
+
+import joblib
+import numpy as np
+
+from ensemble import EnsemblePredictor
+from feature_store import load_features
+from train_ensemble import MODEL_FILES, MODEL_LABELS, final_split
+
+LINEAR_STATS_FILE = 'lr_stats.npz'
+DEFAULT_LGB_ROUNDS = 20
+DEFAULT_RF_TREES = 10
+
+
+class LinearStats:
+    """Count, means and centered cross-products of a least-squares problem.
+
+    Two sets of statistics merge exactly (Chan et al.'s pairwise update), so
+    the linear model for all data seen so far can be re-solved from these
+    alone. Centering keeps the cross-products well conditioned.
+    """
+
+    def __init__(self, n, mean_x, mean_y, sxx, sxy, columns):
+        self.n = int(n)
+        self.mean_x = np.asarray(mean_x, dtype=np.float64)
+        self.mean_y = float(mean_y)
+        self.sxx = np.asarray(sxx, dtype=np.float64)
+        self.sxy = np.asarray(sxy, dtype=np.float64)
+        self.columns = list(columns)
+
+    @classmethod
+    def from_data(cls, X, y, columns):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        mean_x, mean_y = X.mean(axis=0), y.mean()
+        centered = X - mean_x
+        return cls(len(y), mean_x, mean_y, centered.T @ centered, centered.T @ (y - mean_y), columns)
+
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError("Linear statistics were collected over different feature columns")
+        n = self.n + other.n
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        scale = self.n * other.n / n
+        return LinearStats(
+            n,
+            self.mean_x + dx * (other.n / n),
+            self.mean_y + dy * (other.n / n),
+            self.sxx + other.sxx + np.outer(dx, dx) * scale,
+            self.sxy + other.sxy + dx * dy * scale,
+            self.columns,
+        )
+
+    def solve(self):
+        """(coef, intercept) of ordinary least squares with an intercept"""
+        # Several engineered features are exact combinations of others, and the
+        # columns span many orders of magnitude: solve on the correlation scale
+        # (minimum-norm, as LinearRegression does) and map back
+        scale = np.sqrt(np.diag(self.sxx))
+        scale[scale == 0] = 1.0
+        coef = np.linalg.lstsq(self.sxx / np.outer(scale, scale), self.sxy / scale, rcond=None)[0] / scale
+        return coef, self.mean_y - self.mean_x @ coef
+
+    def to_model(self):
+        """Fitted LinearRegression with the solved coefficients"""
+        from sklearn.linear_model import LinearRegression
+
+        model = LinearRegression()
+        model.coef_, model.intercept_ = self.solve()
+        model.n_features_in_ = len(self.columns)
+        model.feature_names_in_ = np.asarray(self.columns, dtype=object)
+        return model
+
+    def save(self, path=LINEAR_STATS_FILE):
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, n=self.n, mean_x=self.mean_x, mean_y=self.mean_y, sxx=self.sxx,
+                 sxy=self.sxy, columns=np.asarray(self.columns))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=LINEAR_STATS_FILE):
+        with np.load(path) as data:
+            return cls(data['n'], data['mean_x'], data['mean_y'], data['sxx'], data['sxy'],
+                       [str(column) for column in data['columns']])
+
+
+def initial_linear_stats(path='public_cases.json'):
+    """Statistics of the training split train_ensemble.py fits the saved models on"""
+    features = load_features(path)
+    train_idx, _ = final_split(len(features))
+    return LinearStats.from_data(features.X[train_idx], features.y[train_idx], features.columns)
+
+
+def update_lightgbm(model, X, y, rounds=DEFAULT_LGB_ROUNDS):
+    """New LGBMRegressor continuing the model's boosting for `rounds` trees on (X, y)"""
+    from lightgbm import LGBMRegressor
+
+    updated = LGBMRegressor(**dict(model.get_params(), n_estimators=rounds))
+    updated.fit(X, y, init_model=model.booster_)
+    return updated
+
+
+def update_random_forest(model, X, y, trees=DEFAULT_RF_TREES):
+    """Copy of the forest with `trees` more trees grown on (X, y)"""
+    updated = copy.deepcopy(model)
+    updated.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees,
+                       n_jobs=os.cpu_count())
+    updated.fit(X, y)
+    # The saved models predict a handful of rows at a time: no thread pools
+    updated.set_params(warm_start=False, n_jobs=None)
+    return updated
+
+
+def update_models(models, features, stats, lgb_rounds=DEFAULT_LGB_ROUNDS, rf_trees=DEFAULT_RF_TREES):
+    """Updated copies of `models` and the merged linear statistics.
+
+    Returns (models, stats, fit seconds per model).
+    """
+    X, y = features.frame(), np.asarray(features.y)
+    updated, seconds = {}, {}
+    for name, model in models.items():
+        start = time.perf_counter()
+        if name == 'lgb':
+            updated[name] = update_lightgbm(model, X, y, lgb_rounds)
+        elif name == 'rf':
+            updated[name] = update_random_forest(model, X, y, rf_trees)
+        else:
+            stats = stats.merge(LinearStats.from_data(features.X, y, features.columns))
+            updated[name] = stats.to_model()
+        seconds[name] = time.perf_counter() - start
+    return updated, stats, seconds
+
+
+def _predictor(models):
+    import compiled_models
+
+    predictor = EnsemblePredictor(compiled=True, bundle=None)
+    predictor.models = compiled_models.compile_models(models)
+    return predictor
+
+
+def _movement(before, after):
+    delta = np.abs(np.asarray(after) - np.asarray(before))
+    return {'mean': float(delta.mean()), 'p95': float(np.percentile(delta, 95)),
+            'max': float(delta.max()), 'moved': float((delta >= 0.01).mean())}
+
+
+def drift_report(old_models, new_models, holdout='public_cases.json'):
+    """How far predictions on the holdout file moved between two model sets.
+
+    Returns {'models': {name: movement}, 'ensemble': movement, 'scores': (old, new)}
+    where movement has the mean, 95th percentile and max absolute change and the
+    share of cases whose prediction changed by a cent or more. Scores are
+    evaluate.py metrics, or None when the holdout has no expected outputs.
+    """
+    features = load_features(holdout)
+    X = features.X
+    report = {'models': {}}
+    old, new = _predictor(old_models), _predictor(new_models)
+    for name in new.models:
+        if name in old.models:
+            report['models'][name] = _movement(old.models[name].predict(X), new.models[name].predict(X))
+
+    days, miles, receipts = np.asarray(features.inputs).T
+    old_outputs = old.predict_batch(days, miles, receipts)
+    new_outputs = new.predict_batch(days, miles, receipts)
+    report['ensemble'] = _movement(np.round(old_outputs, 2), np.round(new_outputs, 2))
+
+    report['scores'] = None
+    if features.y is not None:
+        from evaluate import _format_outputs, load_cases, score_outputs
+
+        cases = load_cases(holdout)
+        errors = [None] * len(cases)
+        report['scores'] = tuple(score_outputs(cases, _format_outputs(outputs), errors)
+                                 for outputs in (old_outputs, new_outputs))
+    return report
+
+
+def _format_movement(movement):
+    return (f"mean {movement['mean']:8.2f}   p95 {movement['p95']:8.2f}   max {movement['max']:8.2f}   "
+            f"moved {movement['moved']:6.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cases', help='new labelled cases (same format as public_cases.json)')
+    parser.add_argument('--holdout', default='public_cases.json',
+                        help='cases to measure prediction movement on')
+    parser.add_argument('--lgb-rounds', type=int, default=DEFAULT_LGB_ROUNDS)
+    parser.add_argument('--rf-trees', type=int, default=DEFAULT_RF_TREES)
+    parser.add_argument('--stats', default=LINEAR_STATS_FILE)
+    parser.add_argument('--dry-run', action='store_true', help='report without saving')
+    args = parser.parse_args(argv)
+
+    features = load_features(args.cases)
+    if features.y is None:
+        parser.error(f"{args.cases} has no expected_output values")
+    models = {name: joblib.load(filename) for name, filename in MODEL_FILES.items()
+              if os.path.exists(filename)}
+    if not models:
+        parser.error("No trained models found; run train_ensemble.py first")
+
+    if os.path.exists(args.stats):
+        stats = LinearStats.load(args.stats)
+    else:
+        # Only needed once: train_ensemble.py saves the statistics from then on
+        print(f"{args.stats} not found; rebuilding it from the public_cases.json training split")
+        stats = initial_linear_stats()
+    print(f"Updating with {len(features)} new cases (linear model history: {stats.n} cases)")
+
+    updated, new_stats, seconds = update_models(models, features, stats, args.lgb_rounds, args.rf_trees)
+    for name, model in updated.items():
+        size = {'lgb': lambda m: f"{m.booster_.num_trees()} trees",
+                'rf': lambda m: f"{len(m.estimators_)} trees",
+                'lr': lambda m: f"{new_stats.n} cases"}[name](model)
+        print(f"  {MODEL_LABELS[name]:18} {size:>12}   {seconds[name]:6.2f}s")
+
+    report = drift_report(models, updated, args.holdout)
+    print(f"\nPrediction movement on {args.holdout}:")
+    for name, movement in report['models'].items():
+        print(f"  {MODEL_LABELS[name]:18} {_format_movement(movement)}")
+    print(f"  {'Final output':18} {_format_movement(report['ensemble'])}")
+    if report['scores']:
+        before, after = report['scores']
+        print(f"  Score {before['score']} -> {after['score']}   "
+              f"average error ${before['avg_error']} -> ${after['avg_error']}")
+
+    if args.dry_run:
+        print("\nDry run: nothing saved")
+        return
+    for name, model in updated.items():
+        joblib.dump(model, MODEL_FILES[name])
+    new_stats.save(args.stats)
+
+    import compiled_models
+    import model_bundle
+
+    previous = (model_bundle.read_header(model_bundle.BUNDLE_FILE)[0]['checksum']['sha256']
+                if os.path.exists(model_bundle.BUNDLE_FILE) else None)
+    checksum = model_bundle.write_bundle(
+        model_bundle.BUNDLE_FILE,
+        compiled_models.compile_models(updated),
+        source={'trained_by': 'incremental_update.py', 'update_data': args.cases,
+                'update_cases': len(features), 'previous_bundle': previous},
+    )
+    print(f"\nModels, {args.stats} and {model_bundle.BUNDLE_FILE} updated (sha256 {checksum[:12]})")
+
+
+if __name__ == '__main__':
+    main()
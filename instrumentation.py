@@ -0,0 +1,146 @@
+"""Counters and latency histograms for EnsemblePredictor.
+
+Pass a Metrics to the predictor to see which branch of predict() handled each
+claim and where the time went:
+
+    metrics = Metrics()
+    predictor = EnsemblePredictor(metrics=metrics)
+    ...
+    metrics.write_prometheus('reimbursement.prom')   # node_exporter textfile format
+    metrics.write_json('reimbursement.json')
+
+Recorded series:
+  predictions_total{route}               cases per predict() route
+  predict_seconds{route}                 latency per route (single-case predict)
+  stage_seconds{stage, mode}             features, lgb, rf, lr, caps and cascade; mode is single or batch
+  fallbacks_total{reason, model}         model_missing, model_error (the LR try/except), no_models
+  cascade_total{tier}                    ML-route cases answered by each cascade tier (see cascade.py)
+
+With metrics=None (the default) the predictor records nothing and takes none
+of the timing calls.
+"""
+import json
+import os
+import threading
+import time
+
+# Histogram upper bounds in seconds, from single rule-route calls to large batches
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 10.0)
+
+_HELP = {
+    'predictions_total': 'Cases scored, by predict() route',
+    'predict_seconds': 'Single-case prediction latency, by route',
+    'stage_seconds': 'Time spent per prediction stage',
+    'fallbacks_total': 'Models skipped or replaced by the rule-based fallback',
+    'cascade_total': 'ML-route cases answered by each cascade tier',
+}
+
+
+class Metrics:
+    """Thread-safe labelled counters and fixed-bucket histograms"""
+
+    def __init__(self, prefix='reimbursement', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket (non-cumulative) counts, then the +Inf bucket, sum and count
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = histogram[0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """JSON-serializable copy of every series"""
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = []
+            for (name, labels), (counts, total, count) in sorted(self._histograms.items()):
+                cumulative, running = [], 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    running += bucket_count
+                    cumulative.append([bound if bound != float('inf') else '+Inf', running])
+                histograms.append({'name': name, 'labels': dict(labels), 'buckets': cumulative,
+                                   'sum': total, 'count': count})
+        return {'timestamp': time.time(), 'counters': counters, 'histograms': histograms}
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                full = f'{self.prefix}_{name}'
+                if name in _HELP:
+                    lines.append(f'# HELP {full} {_HELP[name]}')
+                lines.append(f'# TYPE {full} {kind}')
+
+        for series in snapshot['counters']:
+            declare(series['name'], 'counter')
+            lines.append(f"{self.prefix}_{series['name']}{_labels(series['labels'])} {series['value']}")
+        for series in snapshot['histograms']:
+            declare(series['name'], 'histogram')
+            full = f"{self.prefix}_{series['name']}"
+            for bound, count in series['buckets']:
+                labels = dict(series['labels'], le=bound if bound == '+Inf' else repr(bound))
+                lines.append(f'{full}_bucket{_labels(labels)} {count}')
+            lines.append(f"{full}_sum{_labels(series['labels'])} {series['sum']!r}")
+            lines.append(f"{full}_count{_labels(series['labels'])} {series['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        _write_atomic(path, self.to_prometheus())
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.snapshot(), indent=2))
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def _write_atomic(path, text):
+    # Scrapers must never read a half-written file
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def metrics_from_env(environ=os.environ):
+    """Metrics enabled by REIMBURSE_METRICS (any value but '' or '0'), else None"""
+    if environ.get('REIMBURSE_METRICS', '') in ('', '0'):
+        return None
+    return Metrics()
@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""Precomputed reimbursement grid over the bounded input domain.
+
+Trip days are small integers and miles/receipts stay within a few thousand, so
+the ensemble can be tabulated offline. `build` evaluates EnsemblePredictor on
+every (days, miles, receipts) point of a regular grid and writes the values to
+one memory-mapped file; serving then answers a grid point with one array read.
+
+Receipts carry cents, so real cases almost never fall on a grid point. Opt-in
+interpolation answers them bilinearly in miles and receipts inside cells that
+passed a check: for every cell `build` also evaluates the ensemble at the
+centre and the four edge midpoints and stores the largest interpolation error
+found there, or infinity when the corners differ in route or post-ML cap. That
+is a sample, not a bound: the tree models step wherever a split threshold on
+any engineered feature crosses the cell, so points between the samples can be
+off by dollars. `build` reports the error on dense random cases inside the
+accepted cells.
+
+    python lookup_grid.py build [--miles 0:1400:10] [--receipts 10:2600:10] [--workers N]
+    python lookup_grid.py info                   # header, build report, checksum
+    python lookup_grid.py lookup 5 250 150       # one case, and how it was answered
+
+Layout (as model_bundle.py): magic, header length, JSON header (axes, model
+checksum, code hash, build report), then 64-byte aligned float64 arrays: the
+values, shape (days, miles, receipts), and the cell errors, shape
+(days, miles - 1, receipts - 1).
+
+Serving (EnsemblePredictor(grid=load_grid(...)), or REIMBURSE_GRID=<path> for
+run.sh and the worker):
+  * exact grid points are looked up
+  * with interpolate=True (REIMBURSE_GRID_MODE=interpolate), off-grid cases
+    with a day count on the grid are interpolated when their cell's sampled
+    error is within `max_error` (DEFAULT_MAX_ERROR, a cent;
+    REIMBURSE_GRID_TOLERANCE=<dollars>); check the build report's dense-sample
+    error before turning this on
+  * every other case uses the live ensemble
+
+The grid records the model checksum and prediction-code hash it was built
+from; loading it against different models or code raises GridError.
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+GRID_FILE = 'reimbursement.grid'
+FORMAT_VERSION = 2
+MAGIC = b'TRLOOKUP'
+ALIGNMENT = 64
+AXIS_NAMES = ('days', 'miles', 'receipts')
+# (start, stop, step) per axis, stop included; covers public and private cases.
+# The ensemble rejects receipts <= 0, so that axis starts one step up. Finer
+# steps barely raise the share of cells within DEFAULT_MAX_ERROR (26% of case
+# inputs at 5, against 21% at 10) for four times the size and build time
+DEFAULT_AXES = {'days': (1, 14, 1), 'miles': (0, 1400, 10), 'receipts': (10, 2600, 10)}
+# Largest sampled cell error (dollars) at which interpolate=True interpolates a case
+DEFAULT_MAX_ERROR = 0.01
+# Off-grid cases sampled when checking the grid against the live ensemble
+VERIFY_SAMPLES = 2000
+# Random cases inside accepted cells the build report checks interpolation on
+DENSE_SAMPLES = 200_000
+_ON_GRID_TOLERANCE = 1e-9
+
+
+class GridError(ValueError):
+    """The lookup grid is unreadable, corrupt or was built from other models/code"""
+
+
+class Axis:
+    """Evenly spaced grid coordinates start, start + step, ... (count points)"""
+
+    def __init__(self, start, step, count):
+        self.start = float(start)
+        self.step = float(step)
+        self.count = int(count)
+
+    @classmethod
+    def from_range(cls, start, stop, step):
+        return cls(start, step, int(round((stop - start) / step)) + 1)
+
+    @property
+    def stop(self):
+        return self.start + self.step * (self.count - 1)
+
+    def points(self):
+        return self.start + self.step * np.arange(self.count)
+
+    def to_json(self):
+        return {'start': self.start, 'step': self.step, 'count': self.count}
+
+    def index(self, value):
+        """Grid index of a scalar exactly on the axis, else None"""
+        position = (value - self.start) / self.step
+        k = round(position)
+        if 0 <= k < self.count and abs(position - k) < _ON_GRID_TOLERANCE:
+            return k
+        return None
+
+    def locate(self, values):
+        """(lower index, fraction towards the next point, inside) for an array"""
+        position = (np.asarray(values, dtype=float) - self.start) / self.step
+        inside = (position >= -_ON_GRID_TOLERANCE) & (position <= self.count - 1 + _ON_GRID_TOLERANCE)
+        lower = np.clip(np.floor(position + _ON_GRID_TOLERANCE), 0, max(self.count - 2, 0)).astype(np.intp)
+        fraction = np.clip(position - lower, 0.0, 1.0)
+        fraction[np.abs(fraction) < _ON_GRID_TOLERANCE] = 0.0
+        fraction[np.abs(fraction - 1.0) < _ON_GRID_TOLERANCE] = 1.0
+        return lower, fraction, inside
+
+
+class LookupGrid:
+    """A loaded grid: values and cell errors backed by a read-only memory map, with hit counters"""
+
+    def __init__(self, path, header, values, cell_errors, interpolate=False, max_error=DEFAULT_MAX_ERROR):
+        self.path = path
+        self.header = header
+        self.values = values
+        self.cell_errors = cell_errors
+        self.axes = [Axis(**header['axes'][name]) for name in AXIS_NAMES]
+        # A single-point axis has no cells to interpolate in
+        self.interpolate = interpolate and cell_errors.size > 0
+        self.max_error = max_error
+        self.hits = 0
+        self.interpolated = 0
+        self.misses = 0
+
+    @property
+    def model_checksum(self):
+        return self.header['model_checksum']
+
+    def lookup(self, days, miles, receipts):
+        """Grid value for one case, or None when the live ensemble must answer"""
+        days_axis, miles_axis, receipts_axis = self.axes
+        d = days_axis.index(days)
+        if d is not None:
+            m = miles_axis.index(miles)
+            r = receipts_axis.index(receipts)
+            if m is not None and r is not None:
+                value = float(self.values[d, m, r])
+                if value == value:  # NaN: the live ensemble rejects this case
+                    self.hits += 1
+                    return value
+            elif self.interpolate:
+                values, found = self._interpolate(np.array([d]), np.array([miles]), np.array([receipts]))
+                if found[0]:
+                    self.interpolated += 1
+                    return float(values[0])
+        self.misses += 1
+        return None
+
+    def lookup_batch(self, days, miles, receipts):
+        """(values, found) for arrays of cases; values are only meaningful where found"""
+        days_axis, miles_axis, receipts_axis = self.axes
+        day_position = (np.asarray(days, dtype=float) - days_axis.start) / days_axis.step
+        d = np.rint(day_position)
+        on_days = (np.abs(day_position - d) < _ON_GRID_TOLERANCE) & (d >= 0) & (d < days_axis.count)
+        d = np.where(on_days, d, 0).astype(np.intp)
+
+        m, mf, m_inside = miles_axis.locate(miles)
+        r, rf, r_inside = receipts_axis.locate(receipts)
+        exact = on_days & m_inside & r_inside & (mf % 1.0 == 0) & (rf % 1.0 == 0)
+        values = np.zeros(len(d))
+        if exact.any():
+            # A fraction of exactly 1.0 means the upper neighbour is the grid point
+            values[exact] = self.values[d[exact], m[exact] + (mf[exact] == 1.0), r[exact] + (rf[exact] == 1.0)]
+        # NaN points (and interpolations touching them) are left to the live ensemble
+        exact &= ~np.isnan(values)
+        found = exact
+        if self.interpolate:
+            rest = on_days & ~exact & m_inside & r_inside
+            rest[rest] = self.cell_errors[d[rest], m[rest], r[rest]] <= self.max_error
+            if rest.any():
+                values[rest] = self._bilinear(d[rest], m[rest], mf[rest], r[rest], rf[rest])
+                rest &= ~np.isnan(values)
+                found = exact | rest
+            self.interpolated += int(rest.sum())
+        self.hits += int(exact.sum())
+        self.misses += int(len(d) - found.sum())
+        return values, found
+
+    def _interpolate(self, d, miles, receipts):
+        m, mf, m_inside = self.axes[1].locate(miles)
+        r, rf, r_inside = self.axes[2].locate(receipts)
+        accurate = m_inside & r_inside & (self.cell_errors[d, m, r] <= self.max_error)
+        values = self._bilinear(d, m, mf, r, rf)
+        return values, accurate & ~np.isnan(values)
+
+    def _bilinear(self, d, m, mf, r, rf):
+        v = self.values
+        # Degenerate (single-point) axes have no upper neighbour
+        m1 = np.minimum(m + 1, self.axes[1].count - 1)
+        r1 = np.minimum(r + 1, self.axes[2].count - 1)
+        return ((1 - mf) * ((1 - rf) * v[d, m, r] + rf * v[d, m, r1])
+                + mf * ((1 - rf) * v[d, m1, r] + rf * v[d, m1, r1]))
+
+    def stats(self):
+        served = self.hits + self.interpolated + self.misses
+        return {'hits': self.hits, 'interpolated': self.interpolated, 'misses': self.misses,
+                'hit_rate': (self.hits + self.interpolated) / served if served else 0.0}
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def parse_axis(text):
+    """'start:stop:step' -> (start, stop, step)"""
+    try:
+        start, stop, step = (float(part) for part in text.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected START:STOP:STEP, got {text!r}")
+    if step <= 0 or stop < start:
+        raise argparse.ArgumentTypeError(f"empty axis {text!r}")
+    return start, stop, step
+
+
+# Set in each pool process by _init_worker
+_predictor = None
+
+
+def _init_worker():
+    global _predictor
+    from ensemble import EnsemblePredictor
+    _predictor = EnsemblePredictor(compiled=True, lazy=False)
+
+
+def _predict_or_nan(days, miles, receipts):
+    # Points the live ensemble rejects are stored as NaN and left to it at
+    # serving time; failing batches are halved until those points are isolated
+    try:
+        return _predictor.predict_batch(days, miles, receipts)
+    except (TypeError, ValueError, ArithmeticError):
+        if len(days) == 1:
+            return np.full(1, np.nan)
+        half = len(days) // 2
+        return np.concatenate([_predict_or_nan(days[:half], miles[:half], receipts[:half]),
+                               _predict_or_nan(days[half:], miles[half:], receipts[half:])])
+
+
+def _build_day(task):
+    """Ensemble values for one day count over a miles x receipts mesh"""
+    day, miles, receipts = task
+    miles_mesh, receipts_mesh = np.meshgrid(miles, receipts, indexing='ij')
+    if not miles_mesh.size:
+        return np.empty(miles_mesh.shape)
+    days = np.full(miles_mesh.size, day)
+    return _predict_or_nan(days, miles_mesh.ravel(), receipts_mesh.ravel()).reshape(miles_mesh.shape)
+
+
+def compute_grid(axes, workers=1):
+    """Ensemble values at every grid point, shape (days, miles, receipts), and the
+    measured interpolation error of every cell, shape (days, miles - 1, receipts - 1)
+    """
+    days, miles, receipts = (axis.points() for axis in axes)
+    miles_mid, receipts_mid = miles[:-1] + axes[1].step / 2, receipts[:-1] + axes[2].step / 2
+    # Grid points, cell centres, and midpoints of the edges along miles and along receipts
+    meshes = [(miles, receipts), (miles_mid, receipts_mid), (miles_mid, receipts), (miles, receipts_mid)]
+    tasks = [(day, mesh_miles, mesh_receipts) for mesh_miles, mesh_receipts in meshes for day in days]
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            results = list(pool.map(_build_day, tasks))
+    else:
+        _init_worker()
+        results = [_build_day(task) for task in tasks]
+    values, centres, miles_edges, receipts_edges = (np.stack(results[i:i + len(days)])
+                                                    for i in range(0, len(tasks), len(days)))
+    return values, _cell_errors(axes, values, centres, miles_edges, receipts_edges)
+
+
+def _cell_errors(axes, values, centres, miles_edges, receipts_edges):
+    # Bilinear interpolation is the mean of the four corners at a cell centre and
+    # the mean of the two ends at an edge midpoint
+    corners = (values[:, :-1, :-1] + values[:, 1:, :-1] + values[:, :-1, 1:] + values[:, 1:, 1:]) / 4
+    along_miles = np.abs(miles_edges - (values[:, :-1, :] + values[:, 1:, :]) / 2)
+    along_receipts = np.abs(receipts_edges - (values[:, :, :-1] + values[:, :, 1:]) / 2)
+    errors = np.maximum.reduce([np.abs(centres - corners),
+                                along_miles[:, :, :-1], along_miles[:, :, 1:],
+                                along_receipts[:, :-1, :], along_receipts[:, 1:, :]])
+    # Cells with a rejected input (NaN) or across a route or cap boundary are never interpolated
+    regime = _regimes(axes)
+    same = ((regime[:, :-1, :-1] == regime[:, 1:, :-1]) & (regime[:, :-1, :-1] == regime[:, :-1, 1:])
+            & (regime[:, :-1, :-1] == regime[:, 1:, 1:]))
+    return np.where(same & ~np.isnan(errors), errors, np.inf)
+
+
+def _regimes(axes):
+    """Route and applicable post-ML caps of every grid point, as one code"""
+    import rule_engine
+    from ensemble import EnsemblePredictor
+
+    days, miles, receipts = np.meshgrid(*(axis.points() for axis in axes), indexing='ij')
+    ceiling, floor = EnsemblePredictor._ml_cap_limits(days, miles, receipts)
+    return rule_engine.route_cases(days, miles, receipts) * 4 + np.isfinite(ceiling) * 2 + np.isfinite(floor)
+
+
+def _error_summary(values, live):
+    errors = np.abs(np.asarray(values, dtype=float) - live)
+    if not errors.size:
+        return {'samples': 0}
+    # Answers whose run.sh output (two decimals) differs, which changes exact matches
+    printed = np.char.mod('%.2f', values) != np.char.mod('%.2f', live)
+    return {'samples': int(errors.size), 'max': float(errors.max()), 'mean': float(errors.mean()),
+            'p99': float(np.percentile(errors, 99)), 'within_cent': float((errors < 0.005).mean()),
+            'cents_changed': float(printed.mean())}
+
+
+def verify_grid(grid, samples=VERIFY_SAMPLES, dense_samples=DENSE_SAMPLES,
+                case_files=('public_cases.json', 'private_cases.json'), seed=0):
+    """Largest differences between the grid and the live predict() path.
+
+    Checks random grid points with the scalar predict(), and interpolation
+    within grid.max_error against predict_batch() on the case files' inputs
+    and on `dense_samples` random cases spread over the accepted cells
+    (uniform within each cell, cents rounded), which is where the sampled cell
+    errors can miss a step of the tree models.
+    """
+    from ensemble import EnsemblePredictor
+    from feature_store import load_features
+
+    predictor = EnsemblePredictor(compiled=True, lazy=False)
+    rng = np.random.default_rng(seed)
+    days_axis, miles_axis, receipts_axis = grid.axes
+
+    index = [rng.integers(0, axis.count, samples) for axis in grid.axes]
+    points = [axis.start + axis.step * k for axis, k in zip(grid.axes, index)]
+    live = np.array([predictor.predict(float(d), float(m), float(r)) for d, m, r in zip(*points)])
+    report = {'grid_points': _error_summary(grid.values[index[0], index[1], index[2]], live),
+              'max_error': grid.max_error}
+
+    interpolating = LookupGrid(grid.path, grid.header, grid.values, grid.cell_errors,
+                               interpolate=True, max_error=grid.max_error)
+    inputs = [np.asarray(load_features(path).inputs) for path in case_files if os.path.exists(path)]
+    if inputs:
+        days, miles, receipts = np.concatenate(inputs).T
+        values, found = interpolating.lookup_batch(days, miles, receipts)
+        report['case_inputs'] = _error_summary(values[found], predictor.predict_batch(
+            days[found], miles[found], receipts[found]))
+        report['case_inputs_interpolated'] = float(found.mean())
+
+    accepted = np.argwhere(np.asarray(grid.cell_errors) <= grid.max_error)
+    report['accepted_cells'] = len(accepted) / grid.cell_errors.size if grid.cell_errors.size else 0.0
+    if len(accepted) and dense_samples:
+        cells = accepted[rng.integers(0, len(accepted), dense_samples)]
+        days = days_axis.start + days_axis.step * cells[:, 0]
+        miles = (miles_axis.start + miles_axis.step * (cells[:, 1] + rng.random(dense_samples))).round(2)
+        receipts = (receipts_axis.start + receipts_axis.step * (cells[:, 2] + rng.random(dense_samples))).round(2)
+        values, found = interpolating.lookup_batch(days, miles, receipts)
+        report['dense'] = _error_summary(values[found], predictor.predict_batch(
+            days[found], miles[found], receipts[found]))
+    else:
+        report['dense'] = {'samples': 0}
+    return report
+
+
+def write_grid(path, axes, values, cell_errors, report=None, bundle=None):
+    """Write values and cell errors (shapes matching axes) with the current model/code fingerprints"""
+    import prediction_cache
+    from ensemble import BUNDLE_FILE
+
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    cell_errors = np.ascontiguousarray(cell_errors, dtype=np.float64)
+    header = {
+        'format_version': FORMAT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'axes': {name: axis.to_json() for name, axis in zip(AXIS_NAMES, axes)},
+        'dtype': values.dtype.str,
+        'model_checksum': prediction_cache.model_fingerprint(bundle or BUNDLE_FILE),
+        'code_hash': prediction_cache.code_fingerprint(),
+        'checksum': {'sha256': hashlib.sha256(values.tobytes() + cell_errors.tobytes()).hexdigest()},
+        'report': report or {},
+    }
+    encoded = json.dumps(header, indent=2).encode()
+    offset = _aligned(len(MAGIC) + 8 + len(encoded))
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(encoded)))
+        f.write(encoded)
+        f.write(b'\0' * (offset - f.tell()))
+        f.write(values.tobytes())
+        f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+        f.write(cell_errors.tobytes())
+    os.replace(tmp_path, path)
+    return header['checksum']['sha256']
+
+
+def read_header(path):
+    """Parse and validate the grid header; returns (header, payload offset)"""
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise GridError(f"{path} is not a lookup grid (bad magic {magic!r})")
+        (header_length,) = struct.unpack('<Q', f.read(8))
+        try:
+            header = json.loads(f.read(header_length))
+        except ValueError as e:
+            raise GridError(f"{path} has a corrupt header: {e}") from e
+    if not isinstance(header, dict) or header.get('format_version') != FORMAT_VERSION:
+        version = header.get('format_version') if isinstance(header, dict) else None
+        raise GridError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+    return header, _aligned(len(MAGIC) + 8 + header_length)
+
+
+def load_grid(path=GRID_FILE, interpolate=False, max_error=DEFAULT_MAX_ERROR, bundle=None, verify=True):
+    """Memory-map a grid, checking it still matches the models and prediction code"""
+    import prediction_cache
+    from ensemble import BUNDLE_FILE
+
+    header, offset = read_header(path)
+    shape = tuple(header['axes'][name]['count'] for name in AXIS_NAMES)
+    cell_shape = (shape[0], max(shape[1] - 1, 0), max(shape[2] - 1, 0))
+    dtype = np.dtype(header['dtype'])
+    cell_offset = _aligned(offset + dtype.itemsize * int(np.prod(shape)))
+    if os.path.getsize(path) < cell_offset + dtype.itemsize * int(np.prod(cell_shape)):
+        raise GridError(f"{path} is truncated")
+    values = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+    cell_errors = np.memmap(path, dtype=dtype, mode='r', offset=cell_offset, shape=cell_shape)
+    if verify:
+        payload = values.tobytes() + cell_errors.tobytes()
+        if hashlib.sha256(payload).hexdigest() != header['checksum']['sha256']:
+            raise GridError(f"{path} payload does not match its checksum")
+        if header['model_checksum'] != prediction_cache.model_fingerprint(bundle or BUNDLE_FILE):
+            raise GridError(f"{path} was built from other models; rebuild it (python lookup_grid.py build)")
+        if header['code_hash'] != prediction_cache.code_fingerprint():
+            raise GridError(f"{path} was built from other prediction code; rebuild it (python lookup_grid.py build)")
+    return LookupGrid(path, header, values, cell_errors, interpolate=interpolate, max_error=max_error)
+
+
+def grid_from_env(environ=os.environ):
+    """LookupGrid named by REIMBURSE_GRID, else None.
+
+    Answers grid points only unless REIMBURSE_GRID_MODE=interpolate;
+    REIMBURSE_GRID_TOLERANCE sets max_error in dollars.
+    """
+    path = environ.get('REIMBURSE_GRID', '')
+    if path in ('', '0'):
+        return None
+    return load_grid(path, interpolate=environ.get('REIMBURSE_GRID_MODE', 'exact') == 'interpolate',
+                     max_error=float(environ.get('REIMBURSE_GRID_TOLERANCE') or DEFAULT_MAX_ERROR))
+
+
+def _format_errors(summary):
+    if not summary['samples']:
+        return 'no samples'
+    return (f"max ${summary['max']:.6f}   mean ${summary['mean']:.6f}   p99 ${summary['p99']:.6f}   "
+            f"within half a cent {summary['within_cent']:.1%}   cents changed {summary['cents_changed']:.2%}   "
+            f"({summary['samples']} cases)")
+
+
+def _print_report(report):
+    print(f"  grid points    {_format_errors(report['grid_points'])}")
+    print(f"Opt-in interpolation (REIMBURSE_GRID_MODE=interpolate) within ${report['max_error']:g} "
+          f"sampled cell error, {report['accepted_cells']:.1%} of cells:")
+    if 'case_inputs' in report:
+        print(f"  case inputs    {_format_errors(report['case_inputs'])}   "
+              f"{report['case_inputs_interpolated']:.1%} interpolated")
+    print(f"  dense cells    {_format_errors(report['dense'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='tabulate the ensemble and write the grid file')
+    for name in AXIS_NAMES:
+        start, stop, step = DEFAULT_AXES[name]
+        build.add_argument(f'--{name}', type=parse_axis, default=(start, stop, step),
+                           help=f'START:STOP:STEP (default {start}:{stop}:{step})')
+    build.add_argument('--workers', type=int, default=1)
+    build.add_argument('--samples', type=int, default=VERIFY_SAMPLES, help='random grid points to check')
+    build.add_argument('--dense-samples', type=int, default=DENSE_SAMPLES,
+                       help='random cases inside accepted cells to check interpolation on')
+    build.add_argument('--max-error', type=float, default=DEFAULT_MAX_ERROR,
+                       help='sampled cell error (dollars) the build report interpolates within')
+    info = commands.add_parser('info', help='print the header and verify the grid')
+    lookup = commands.add_parser('lookup', help='answer one case')
+    lookup.add_argument('days', type=float)
+    lookup.add_argument('miles', type=float)
+    lookup.add_argument('receipts', type=float)
+    lookup.add_argument('--interpolate', action='store_true')
+    lookup.add_argument('--max-error', type=float, default=DEFAULT_MAX_ERROR)
+    for command in (build, info, lookup):
+        command.add_argument('--grid', default=GRID_FILE)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        axes = [Axis.from_range(*getattr(args, name)) for name in AXIS_NAMES]
+        shape = tuple(axis.count for axis in axes)
+        print(f"Tabulating {int(np.prod(shape)):,} points {shape} ...")
+        start = time.perf_counter()
+        values, cell_errors = compute_grid(axes, args.workers)
+        elapsed = time.perf_counter() - start
+        print(f"  computed in {elapsed:.1f}s")
+        header = {'axes': {name: axis.to_json() for name, axis in zip(AXIS_NAMES, axes)}}
+        grid = LookupGrid(args.grid, header, values, cell_errors, max_error=args.max_error)
+        report = verify_grid(grid, args.samples, args.dense_samples)
+        report['build_seconds'] = round(elapsed, 3)
+        checksum = write_grid(args.grid, axes, values, cell_errors, report)
+        size = values.nbytes + cell_errors.nbytes
+        print(f"Grid written to {args.grid} ({size / 1e6:.1f} MB, sha256 {checksum[:12]})")
+        print(f"Error against the live ensemble:")
+        _print_report(report)
+        return
+
+    if args.command == 'info':
+        grid = load_grid(args.grid)
+        header = grid.header
+        print(f"{args.grid}: format v{header['format_version']}, created {header['created']}")
+        for name, axis in zip(AXIS_NAMES, grid.axes):
+            print(f"  {name:9} {axis.start:g}..{axis.stop:g} step {axis.step:g} ({axis.count} points)")
+        print(f"  models {header['model_checksum'][:12]}, code {header['code_hash'][:12]}")
+        _print_report(header['report'])
+        print(f"  sha256 {header['checksum']['sha256']} (verified)")
+        return
+
+    grid = load_grid(args.grid, interpolate=args.interpolate, max_error=args.max_error)
+    value = grid.lookup(args.days, args.miles, args.receipts)
+    if value is None:
+        from ensemble import EnsemblePredictor
+        print(f"{EnsemblePredictor().predict(args.days, args.miles, args.receipts):.2f} (live ensemble)")
+    else:
+        print(f"{value:.2f} ({'grid point' if grid.hits else 'interpolated'})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Versioned single-file model bundle, memory-mapped at load time.
+
+Replaces shipping lgb_model.pkl, rf_model.pkl and lr_model.pkl separately.
+Layout:
+
+    8 bytes   magic b'TRBUNDLE'
+    8 bytes   header length (little-endian uint64)
+    header    UTF-8 JSON: format version, manifest, feature columns,
+              ensemble weights and the payload checksum
+    payload   the compiled tree/coefficient arrays (see compiled_models.py),
+              each 64-byte aligned so they can be used straight from np.memmap
+
+Loading maps the file read-only, so worker processes share its pages. Any
+problem with the file (bad magic, unknown version, checksum or feature-column
+mismatch, truncated payload) raises BundleError. Nothing falls back silently.
+
+    python model_bundle.py build     # bundle the current pickles into ensemble.bundle
+    python model_bundle.py info      # print the manifest and verify the checksum
+"""
+import hashlib
+import json
+import os
+import struct
+import time
+
+from ensemble import BUNDLE_FILE, MODEL_WEIGHTS
+
+# numpy and compiled_models are imported by the functions that need them, so
+# read_header() stays cheap enough for callers that only want the checksum
+
+FORMAT_VERSION = 1
+MAGIC = b'TRBUNDLE'
+ALIGNMENT = 64
+
+
+class BundleError(ValueError):
+    """The model bundle is unreadable, corrupt or does not match this code"""
+
+
+class ModelBundle:
+    """A loaded bundle: compiled models backed by a read-only memory map"""
+
+    def __init__(self, path, header, models):
+        self.path = path
+        self.header = header
+        self.models = models
+
+    @property
+    def weights(self):
+        return dict(self.header['weights'])
+
+    @property
+    def feature_columns(self):
+        return list(self.header['feature_columns'])
+
+    @property
+    def checksum(self):
+        return self.header['checksum']['sha256']
+
+    @property
+    def manifest(self):
+        return self.header['manifest']
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_bundle(path, compiled, weights=None, feature_columns=None, source=None):
+    """Write compiled models (see compiled_models.compile_models) as a bundle file.
+
+    Returns the payload checksum. `source` is free-form provenance recorded in
+    the manifest (training script, input files, ...).
+    """
+    import numpy as np
+    from compiled_models import CompiledTrees
+    from feature_eng import FEATURE_COLUMNS
+
+    weights = dict(MODEL_WEIGHTS if weights is None else weights)
+    feature_columns = list(FEATURE_COLUMNS if feature_columns is None else feature_columns)
+    missing = set(compiled) - set(weights)
+    if missing:
+        raise BundleError(f"No ensemble weight for models: {sorted(missing)}")
+
+    chunks = []
+    offset = 0
+    models = {}
+    for name, model in compiled.items():
+        kind = 'trees' if isinstance(model, CompiledTrees) else 'linear'
+        entries = {}
+        for key, array in model.arrays().items():
+            array = np.ascontiguousarray(array)
+            offset = _aligned(offset)
+            entries[key] = {'dtype': array.dtype.str, 'shape': list(array.shape),
+                            'offset': offset, 'nbytes': array.nbytes}
+            chunks.append((offset, array.tobytes()))
+            offset += array.nbytes
+        models[name] = {'kind': kind, 'arrays': entries}
+
+    payload = bytearray(offset)
+    for start, data in chunks:
+        payload[start:start + len(data)] = data
+    checksum = hashlib.sha256(payload).hexdigest()
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'manifest': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'models': models,
+            'source': source or {},
+        },
+        'feature_columns': feature_columns,
+        'weights': {name: weights[name] for name in compiled},
+        'checksum': {'sha256': checksum, 'payload_bytes': len(payload)},
+    }
+    header_bytes = json.dumps(header, indent=1).encode()
+    # Pad the header so the payload starts on an aligned file offset
+    payload_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+    header_bytes += b' ' * (payload_start - len(MAGIC) - 8 - len(header_bytes))
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return checksum
+
+
+def read_header(path):
+    """Parse and validate the bundle header; returns (header, payload offset)"""
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise BundleError(f"{path} is not a model bundle (bad magic {magic!r})")
+        (header_length,) = struct.unpack('<Q', f.read(8))
+        try:
+            header = json.loads(f.read(header_length))
+        except ValueError as e:
+            raise BundleError(f"{path} has a corrupt header: {e}") from e
+    if not isinstance(header, dict) or header.get('format_version') != FORMAT_VERSION:
+        version = header.get('format_version') if isinstance(header, dict) else None
+        raise BundleError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+    missing = {'manifest', 'feature_columns', 'weights', 'checksum'} - set(header)
+    if missing:
+        raise BundleError(f"{path} header is missing {sorted(missing)}")
+    return header, len(MAGIC) + 8 + header_length
+
+
+def read_bundle(path=BUNDLE_FILE, verify=True):
+    """Memory-map a bundle and rebuild its compiled models; raises BundleError on any mismatch"""
+    import numpy as np
+    from compiled_models import CompiledLinear, CompiledTrees
+    from feature_eng import FEATURE_COLUMNS
+
+    kinds = {'trees': CompiledTrees, 'linear': CompiledLinear}
+
+    header, payload_start = read_header(path)
+    if header['feature_columns'] != FEATURE_COLUMNS:
+        raise BundleError(f"{path} was built for different feature columns than feature_eng.py")
+
+    payload_bytes = header['checksum']['payload_bytes']
+    if os.path.getsize(path) < payload_start + payload_bytes:
+        raise BundleError(f"{path} is truncated")
+    payload = np.memmap(path, dtype=np.uint8, mode='r', offset=payload_start, shape=(payload_bytes,))
+    if verify and hashlib.sha256(payload).hexdigest() != header['checksum']['sha256']:
+        raise BundleError(f"{path} failed its checksum")
+
+    models = {}
+    for name, entry in header['manifest']['models'].items():
+        if entry['kind'] not in kinds or name not in header['weights']:
+            raise BundleError(f"{path} has an unusable model entry: {name}")
+        arrays = {}
+        for key, spec in entry['arrays'].items():
+            view = payload[spec['offset']:spec['offset'] + spec['nbytes']]
+            arrays[key] = view.view(np.dtype(spec['dtype'])).reshape(spec['shape'])
+        try:
+            models[name] = kinds[entry['kind']].from_arrays(arrays)
+        except (KeyError, ValueError) as e:
+            raise BundleError(f"{path} has malformed arrays for {name}: {e}") from e
+    return ModelBundle(path, header, models)
+
+
+def build_from_pickles(path=BUNDLE_FILE):
+    """Bundle the current lgb/rf/lr pickles, verifying the compiled models first"""
+    import compiled_models
+    from ensemble import EnsemblePredictor
+
+    models = EnsemblePredictor(bundle=None).models
+    compiled = compiled_models.compile_models(models)
+    compiled_models.check_compiled(models, compiled)
+    source = {'built_from': sorted(f'{name}_model.pkl' for name in models)}
+    return write_bundle(path, compiled, source=source)
+
+
+if __name__ == '__main__':
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'info'
+    target = sys.argv[2] if len(sys.argv) > 2 else BUNDLE_FILE
+    if command == 'build':
+        checksum = build_from_pickles(target)
+        print(f"Wrote {target} ({os.path.getsize(target)} bytes, sha256 {checksum[:12]})")
+    elif command == 'info':
+        bundle = read_bundle(target)
+        manifest = bundle.manifest
+        print(f"{target}: format v{bundle.header['format_version']}, created {manifest['created']}")
+        print(f"  source: {manifest['source']}")
+        print(f"  features: {len(bundle.feature_columns)} columns")
+        for name, entry in manifest['models'].items():
+            nbytes = sum(spec['nbytes'] for spec in entry['arrays'].values())
+            print(f"  {name}: {entry['kind']}, weight {bundle.weights[name]}, {nbytes} bytes")
+        print(f"  sha256 {bundle.checksum} (verified)")
+    else:
+        raise SystemExit("usage: python model_bundle.py [build|info] [path]")
@@ -0,0 +1,254 @@
+"""Opt-in memoization of EnsemblePredictor.predict for repeated claims.
+
+The same standard trips get resubmitted and re-audited, so a repeated
+(days, miles, receipts) triple can skip routing, feature engineering and the
+model calls altogether. Two tiers:
+
+  * an in-process LRU (bounded by `maxsize` entries), and
+  * an optional sqlite file that survives across run.sh invocations (bounded
+    by `max_disk_entries`, least recently used rows evicted first).
+
+Keys are the normalized input triple plus a namespace made of the model
+checksum (bundle header, or the pickle contents) and a fingerprint of the
+prediction code, so retraining or editing the rules invalidates old entries
+automatically.
+
+    predictor = EnsemblePredictor(cache=PredictionCache('predictions.sqlite'))
+
+run.sh and worker.py enable it through REIMBURSE_CACHE (see cache_from_env).
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 100_000
+DEFAULT_MAX_DISK_ENTRIES = 1_000_000
+# Share of the disk entries removed when the store grows past its bound
+_EVICT_FRACTION = 0.1
+
+# Modules whose code decides the prediction for a given model
+CODE_FILES = ['ensemble.py', 'rule_engine.py', 'feature_eng.py', 'compiled_models.py',
+              'feature_registry.py', 'cascade.py']
+MODEL_FILES = ['lgb_model.pkl', 'rf_model.pkl', 'lr_model.pkl']
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def normalize_inputs(days, miles, receipts):
+    """Canonical key for an input triple, or None when it must not be cached.
+
+    5, 5.0 and '5' give the same key. Values are not rounded: the models see
+    every digit, so 150.75 and 150.751 are different claims.
+    """
+    key = tuple(float(value) + 0.0 for value in (days, miles, receipts))  # + 0.0 folds -0.0
+    if not all(math.isfinite(value) for value in key):
+        return None
+    return key
+
+
+def _hash_files(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def code_fingerprint():
+    """Hash of the source files that turn inputs and models into a prediction"""
+    return _hash_files([os.path.join(_REPO_DIR, name) for name in CODE_FILES])
+
+
+def model_fingerprint(bundle=None):
+    """Model checksum without loading the models: the bundle header or the pickle bytes"""
+    if bundle and os.path.exists(bundle):
+        import model_bundle
+        header, _ = model_bundle.read_header(bundle)
+        return header['checksum']['sha256']
+    return _hash_files([os.path.join(_REPO_DIR, name) for name in MODEL_FILES])
+
+
+class PredictionCache:
+    """Two-tier (memory LRU + optional sqlite) store of predictions with hit/miss counters"""
+
+    def __init__(self, path=None, maxsize=DEFAULT_MAXSIZE, max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.path = path
+        self.maxsize = maxsize
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_entries = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.disk_errors = 0
+        if path:
+            self._open(path)
+
+    def _open(self, path):
+        import sqlite3
+        # The worker serves requests from several threads; self._lock serializes access
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS predictions ('
+            ' namespace TEXT NOT NULL, days REAL NOT NULL, miles REAL NOT NULL,'
+            ' receipts REAL NOT NULL, value REAL NOT NULL, last_used REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, days, miles, receipts))')
+        self._db.execute('CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)')
+        self._disk_entries = self._db.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+
+    def get(self, namespace, key):
+        """Cached prediction for a normalized key, or None"""
+        memory_key = (namespace,) + key
+        with self._lock:
+            value = self._memory.get(memory_key)
+            if value is not None:
+                self._memory.move_to_end(memory_key)
+                self.hits += 1
+                return value
+            if self._db is not None:
+                value = self._disk_get(namespace, key)
+                if value is not None:
+                    self.disk_hits += 1
+                    self._remember(memory_key, value)
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, namespace, key, value):
+        value = float(value)
+        with self._lock:
+            self._remember((namespace,) + key, value)
+            if self._db is not None:
+                self._disk_put(namespace, key, value)
+
+    def _remember(self, memory_key, value):
+        self._memory[memory_key] = value
+        self._memory.move_to_end(memory_key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, namespace, key):
+        import sqlite3
+        try:
+            row = self._db.execute(
+                'SELECT value FROM predictions WHERE namespace = ? AND days = ? AND miles = ? AND receipts = ?',
+                (namespace,) + key).fetchone()
+            if row is not None:
+                self._db.execute(
+                    'UPDATE predictions SET last_used = ? WHERE namespace = ? AND days = ? AND miles = ? AND receipts = ?',
+                    (time.time(), namespace) + key)
+        except sqlite3.Error:
+            # A locked or broken store only costs us the disk tier
+            self.disk_errors += 1
+            return None
+        return None if row is None else row[0]
+
+    def _disk_put(self, namespace, key, value):
+        import sqlite3
+        try:
+            cursor = self._db.execute(
+                'INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)',
+                (namespace,) + key + (value, time.time()))
+            self._disk_entries += cursor.rowcount
+            if self._disk_entries > self.max_disk_entries:
+                self._evict_disk()
+        except sqlite3.Error:
+            self.disk_errors += 1
+
+    def _evict_disk(self):
+        # Other processes write to the same file, so recount before trimming
+        count = self._db.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+        excess = count - int(self.max_disk_entries * (1 - _EVICT_FRACTION))
+        if count > self.max_disk_entries and excess > 0:
+            self._db.execute(
+                'DELETE FROM predictions WHERE rowid IN '
+                '(SELECT rowid FROM predictions ORDER BY last_used LIMIT ?)', (excess,))
+            self.disk_evictions += excess
+            count -= excess
+        self._disk_entries = count
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM predictions')
+                self._disk_entries = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        """Hit/miss counters and current sizes"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'memory_entries': len(self._memory),
+            'disk_entries': self._disk_entries if self._db is not None else None,
+            'evictions': self.evictions,
+            'disk_evictions': self.disk_evictions,
+            'disk_errors': self.disk_errors,
+        }
+
+
+def cache_from_env(environ=os.environ):
+    """Cache configured by REIMBURSE_CACHE: unset/'0' = off, 'memory' = LRU only, else a sqlite path"""
+    setting = environ.get('REIMBURSE_CACHE', '')
+    if setting in ('', '0'):
+        return None
+    if setting == 'memory':
+        return PredictionCache()
+    return PredictionCache(os.path.expanduser(setting))
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+    import tempfile
+
+    from ensemble import EnsemblePredictor
+
+    # Score the public cases twice through a sqlite-backed cache and check that
+    # the second pass is all hits with identical results
+    with open('public_cases.json', 'r') as f:
+        cases = [c['input'] for c in json.load(f)]
+    triples = [(c['trip_duration_days'], c['miles_traveled'], c['total_receipts_amount']) for c in cases]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tmp, 'predictions.sqlite')
+        reference = EnsemblePredictor()
+        cached = EnsemblePredictor(cache=PredictionCache(path))
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            results = [cached.predict(*t) for t in triples]
+            timings.append(time.perf_counter() - start)
+        expected = [reference.predict(*t) for t in triples]
+        assert results == expected, "cached predictions differ from uncached ones"
+
+        # A fresh process-level cache on the same file is served from disk
+        reopened = EnsemblePredictor(cache=PredictionCache(path))
+        assert [reopened.predict(*t) for t in triples] == expected
+        assert reopened.cache.stats()['disk_hits'] == len(set(triples))
+
+        print(f"cold pass {timings[0]:.3f}s, warm pass {timings[1]:.3f}s")
+        print(f"stats: {cached.cache.stats()}")
+        cached.cache.close()
+        reopened.cache.close()
@@ -0,0 +1,297 @@
+"""Vectorized rule engine: the rule routes of EnsemblePredictor over whole arrays.
+
+Every function mirrors its scalar counterpart in ensemble.py branch for branch
+with np.select/np.where, so results are bit-for-bit identical. The scalar
+methods stay the reference implementation; run this module to check equivalence
+over public_cases.json and private_cases.json:
+
+    python rule_engine.py
+"""
+import numpy as np
+
+# Route codes returned by route_cases(), in predict()'s order of precedence
+ROUTE_STRICT = 0        # Route 1A: high-intensity strict
+ROUTE_AGGRESSIVE = 1    # Route 1B: high-intensity aggressive
+ROUTE_LOW_MILEAGE = 2   # Route 2: low-mileage, high-receipt
+ROUTE_EXTREME = 3       # is_extreme_case() -> rule_based_calculation
+ROUTE_ML = 4            # ML ensemble in predict_normal
+ROUTE_NAMES = ['high_intensity_strict', 'high_intensity', 'low_mileage_high_receipt',
+               'extreme_rule_based', 'ml_ensemble']
+
+
+def _as_arrays(days, miles, receipts):
+    return (np.asarray(days, dtype=float),
+            np.asarray(miles, dtype=float),
+            np.asarray(receipts, dtype=float))
+
+
+def route_cases(days, miles, receipts, high_intensity_mpd=600, strict_min_miles=1000,
+                strict_ratio_low=3.0, strict_ratio_high=3.3, low_mileage_mpd=50,
+                low_mileage_receipt_ratio=8):
+    """Route code for every case, matching predict() and is_extreme_case().
+
+    The keyword thresholds default to predict()'s; tune_params.py searches
+    over them (they broadcast, so a column of values routes every case once
+    per value).
+    """
+    days, miles, receipts = _as_arrays(days, miles, receipts)
+    miles_per_day = miles / np.maximum(days, 1)
+    receipt_to_mile = receipts / np.maximum(miles, 1)
+    estimated_reasonable = miles * 0.45 + days * 80
+    receipt_to_expected_ratio = receipts / np.maximum(estimated_reasonable, 1)
+
+    high_intensity = miles_per_day > high_intensity_mpd
+    strict = (high_intensity & (miles > strict_min_miles)
+              & (receipt_to_expected_ratio > strict_ratio_low)
+              & (receipt_to_expected_ratio < strict_ratio_high))
+    low_mileage = (miles_per_day < low_mileage_mpd) & (receipt_to_mile > low_mileage_receipt_ratio)
+
+    return np.select(
+        [strict, high_intensity, low_mileage, is_extreme_case(days, miles, receipts)],
+        [ROUTE_STRICT, ROUTE_AGGRESSIVE, ROUTE_LOW_MILEAGE, ROUTE_EXTREME],
+        ROUTE_ML,
+    )
+
+
+def is_extreme_case(days, miles, receipts):
+    """Vectorized EnsemblePredictor.is_extreme_case"""
+    days, miles, receipts = _as_arrays(days, miles, receipts)
+    miles_per_day = miles / np.maximum(days, 1)
+    receipts_per_day = receipts / np.maximum(days, 1)
+    receipts_to_miles_ratio = receipts / np.maximum(miles, 1)
+    return ((miles_per_day < 15) | (receipts_to_miles_ratio > 10)
+            | (miles_per_day > 800) | (receipts_per_day > 600))
+
+
+def rule_based_calculation(days, miles, receipts):
+    """Vectorized EnsemblePredictor.rule_based_calculation"""
+    days, miles, receipts = _as_arrays(days, miles, receipts)
+    miles_per_day = miles / np.maximum(days, 1)
+    receipts_per_day = receipts / np.maximum(days, 1)
+    receipt_to_mile = receipts / np.maximum(miles, 1)
+
+    expected_receipts_per_mile = 1.5
+    balance_score = np.abs(receipt_to_mile - expected_receipts_per_mile) / expected_receipts_per_mile
+
+    high_miles_low_receipt = (miles_per_day > 400) & (receipt_to_mile < 2)
+    low_miles_high_receipt = (miles_per_day < 100) & (receipt_to_mile > 5)
+    extreme_receipt_pattern = (receipt_to_mile > 3) & (miles_per_day > 500)
+
+    # Low-mileage penalty rule returns early, without the final floor
+    low_mileage_rule = miles_per_day < 25
+    low_mileage_total = 80 * days + np.where(
+        balance_score > 2,
+        np.minimum(10 * days, receipts * 0.03),
+        np.minimum(15 * days, receipts * 0.05),
+    )
+
+    base_per_diem = 100 + 0.05 * miles_per_day
+    base_per_diem = np.where(balance_score < 0.5, base_per_diem * 1.05, base_per_diem)
+    daily_base = days * base_per_diem
+    daily_base = np.where(days == 5, daily_base * 1.1, daily_base)
+
+    mileage_rate = np.select(
+        [high_miles_low_receipt, miles_per_day <= 200, miles_per_day <= 400, miles_per_day <= 500],
+        [0.50, 0.45, 0.40, 0.38],
+        0.70,
+    )
+    mileage_reimbursement = miles * mileage_rate
+
+    receipts_to_miles_ratio = receipt_to_mile
+    extreme_ratio = low_miles_high_receipt & (receipts_to_miles_ratio > 10)
+    short_extreme = extreme_ratio & (days <= 2) & (receipts_to_miles_ratio > 20)
+    excess = receipts - (300 * days)
+    receipt_reimbursement = np.select(
+        [
+            short_extreme & (days == 1) & (receipts > 2000),
+            short_extreme,
+            extreme_ratio,
+            low_miles_high_receipt,
+            days > 7,
+            days <= 4,
+            days == 5,
+            receipts < 50,
+            receipts_per_day <= 120,
+            receipts_per_day <= 300,
+        ],
+        [
+            np.minimum(receipts * 0.7, 180 * days),
+            np.minimum(receipts * 0.6, 120 * days),
+            np.minimum(receipts * 0.5, 100 * days),
+            np.minimum(receipts * 0.3, 50 * days),
+            np.minimum(receipts * 0.55, 75 * days),
+            np.minimum(receipts * 0.2, 40 * days),
+            np.minimum(receipts * 0.2, 40 * days),
+            receipts * 0.6,
+            receipts * 0.8,
+            receipts * 0.6,
+        ],
+        300 * days * 0.6 + np.where(extreme_receipt_pattern, excess * 0.3, excess * 0.5),
+    )
+
+    total = daily_base + mileage_reimbursement + receipt_reimbursement
+
+    # Aggressive cap for extreme receipt ratios
+    aggressive_cap = 1.5 * (miles * 0.45 + days * 80)
+    total = np.where(receipts_to_miles_ratio > 10, np.minimum(total, aggressive_cap), total)
+
+    # Proportional intensity bonus for short, intense trips
+    bonus_factor = np.where(
+        high_miles_low_receipt,
+        1 + np.minimum(0.25, (miles_per_day - 400) / 1600),
+        1 + np.minimum(0.20, (miles_per_day - 400) / 2000),
+    )
+    total = np.where((days <= 2) & (miles_per_day > 400), total * bonus_factor, total)
+
+    # Extreme mileage capping
+    max_total = np.where(extreme_receipt_pattern,
+                         180 * days + miles * 0.2,
+                         200 * days + miles * 0.25)
+    total = np.where(miles_per_day > 1000, np.minimum(total, max_total), total)
+
+    return np.where(low_mileage_rule, low_mileage_total, np.maximum(total, daily_base * 0.9))
+
+
+# The route functions below take their constants as keyword parameters with
+# predict()'s values as defaults; tune_params.py passes columns of candidates.
+
+def predict_high_intensity_strict(days, miles, receipts, base_per_day=350, mileage_rate=0.15,
+                                  receipt_rate=0.08, cap_per_day=450):
+    """Vectorized Route 1A"""
+    days, miles, receipts = _as_arrays(days, miles, receipts)
+    base_reimbursement = np.minimum(base_per_day * days, miles * mileage_rate)
+    receipt_allowance = receipts * receipt_rate
+    return np.minimum(base_reimbursement + receipt_allowance, cap_per_day * days)
+
+
+def predict_high_intensity(days, miles, receipts, base_per_day=1100, mileage_rate=0.7,
+                           receipt_rate=0.9, receipt_cap_per_day=650):
+    """Vectorized Route 1B"""
+    days, miles, receipts = _as_arrays(days, miles, receipts)
+    base_reimbursement = np.minimum(base_per_day * days, miles * mileage_rate)
+    receipt_allowance = np.minimum(receipts * receipt_rate, receipt_cap_per_day * days)
+    return base_reimbursement + receipt_allowance
+
+
+def predict_low_mileage_high_receipt(days, miles, receipts, base_per_day=115, mileage_rate=0.32,
+                                     short_receipt_rate=0.2, short_receipt_cap_per_day=40):
+    """Vectorized Route 2"""
+    days, miles, receipts = _as_arrays(days, miles, receipts)
+    base_per_diem = base_per_day * days
+    receipts_to_miles_ratio = receipts / np.maximum(miles, 1)
+
+    extreme_ratio = receipts_to_miles_ratio > 10
+    short_trip = extreme_ratio & (days <= 2)
+    receipt_allowance = np.select(
+        [
+            short_trip & (receipts_to_miles_ratio > 30) & (days == 1) & (receipts > 2000),
+            short_trip & (receipts_to_miles_ratio > 30),
+            short_trip & (receipts_to_miles_ratio > 20),
+            extreme_ratio,
+            days > 10,
+            days > 7,
+            days > 5,
+        ],
+        [
+            np.minimum(receipts * 0.8, 200 * days),
+            np.minimum(receipts * 0.7, 150 * days),
+            np.minimum(receipts * 0.6, 120 * days),
+            np.minimum(receipts * 0.5, 100 * days),
+            np.minimum(receipts * 0.35, 90 * days),
+            np.minimum(receipts * 0.55, 110 * days),
+            np.minimum(receipts * 0.7, 130 * days),
+        ],
+        np.minimum(receipts * short_receipt_rate, short_receipt_cap_per_day * days),
+    )
+
+    mileage_reimbursement = miles * mileage_rate
+    total = base_per_diem + receipt_allowance + mileage_reimbursement
+
+    estimated_reasonable = miles * 0.45 + days * 80
+    ultra_tight = (receipts_to_miles_ratio > 30) & (days <= 4)
+    total = np.where(ultra_tight, np.minimum(total, 1.1 * estimated_reasonable),
+                     np.where(extreme_ratio, np.minimum(total, 1.5 * estimated_reasonable), total))
+    return total
+
+
+ROUTE_FUNCTIONS = {
+    ROUTE_STRICT: predict_high_intensity_strict,
+    ROUTE_AGGRESSIVE: predict_high_intensity,
+    ROUTE_LOW_MILEAGE: predict_low_mileage_high_receipt,
+    ROUTE_EXTREME: rule_based_calculation,
+}
+
+
+def check_equivalence(case_files=('public_cases.json', 'private_cases.json')):
+    """Compare every vectorized function with its scalar reference on all cases.
+
+    Returns a list of mismatch descriptions (empty when everything matches).
+    """
+    import json
+    from ensemble import EnsemblePredictor
+
+    # The rule methods need no models, so skip loading them
+    reference = EnsemblePredictor()
+    reference.models = {}
+
+    pairs = [
+        (rule_based_calculation, reference.rule_based_calculation),
+        (predict_high_intensity_strict, reference.predict_high_intensity_strict),
+        (predict_high_intensity, reference.predict_high_intensity),
+        (predict_low_mileage_high_receipt, reference.predict_low_mileage_high_receipt),
+        (is_extreme_case, reference.is_extreme_case),
+    ]
+
+    mismatches = []
+    for path in case_files:
+        with open(path, 'r') as f:
+            cases = [c.get('input', c) for c in json.load(f)]
+        days = np.array([c['trip_duration_days'] for c in cases], dtype=float)
+        miles = np.array([c['miles_traveled'] for c in cases], dtype=float)
+        receipts = np.array([c['total_receipts_amount'] for c in cases], dtype=float)
+
+        for vectorized, scalar in pairs:
+            got = vectorized(days, miles, receipts)
+            for i, case in enumerate(cases):
+                expected = scalar(case['trip_duration_days'], case['miles_traveled'],
+                                  case['total_receipts_amount'])
+                if got[i] != expected:
+                    mismatches.append(f"{path} case {i + 1}: {vectorized.__name__} "
+                                      f"{got[i]!r} != {expected!r}")
+
+        # Routing: which method predict() would have dispatched to
+        routes = route_cases(days, miles, receipts)
+        for i, case in enumerate(cases):
+            d, m, r = case['trip_duration_days'], case['miles_traveled'], case['total_receipts_amount']
+            expected = _scalar_route(reference, d, m, r)
+            if routes[i] != expected:
+                mismatches.append(f"{path} case {i + 1}: route {ROUTE_NAMES[routes[i]]} "
+                                  f"!= {ROUTE_NAMES[expected]}")
+    return mismatches
+
+
+def _scalar_route(reference, days, miles, receipts):
+    """Replay predict()'s dispatch by recording which route method it calls"""
+    called = []
+    recorder = type(reference)()
+    recorder.models = {}
+    for code, name in [(ROUTE_STRICT, 'predict_high_intensity_strict'),
+                       (ROUTE_AGGRESSIVE, 'predict_high_intensity'),
+                       (ROUTE_LOW_MILEAGE, 'predict_low_mileage_high_receipt'),
+                       (ROUTE_EXTREME, 'rule_based_calculation')]:
+        setattr(recorder, name, lambda *args, code=code: called.append(code) or 0.0)
+    recorder.predict_normal = (
+        lambda d, m, r: called.append(ROUTE_EXTREME if reference.is_extreme_case(d, m, r) else ROUTE_ML)
+        or 0.0
+    )
+    recorder.predict(days, miles, receipts)
+    return called[0]
+
+
+if __name__ == '__main__':
+    problems = check_equivalence()
+    for problem in problems[:20]:
+        print(problem)
+    if problems:
+        raise SystemExit(f"{len(problems)} mismatches between vectorized and scalar rules")
+    print("Vectorized rule engine matches the scalar reference on all cases")
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Stream-score claim exports of any size in constant memory.
+
+Reads NDJSON, CSV or a JSON array of cases with the trip_duration_days,
+miles_traveled and total_receipts_amount fields (flat, or under 'input' as in
+public_cases.json), scores them with predict_batch one fixed-size chunk at a
+time and writes every record back out in the input format with a
+`reimbursement` field added:
+
+    python score_stream.py claims.ndjson -o scored.ndjson
+    python score_stream.py claims.csv > scored.csv
+    zcat claims.ndjson.gz | python score_stream.py - --format ndjson > scored.ndjson
+
+A reader thread parses the next chunks while the current one is scored; at
+most --queue-depth parsed chunks wait at a time, so memory is bounded by the
+chunk size whatever the input size. Cases the model rejects get an empty
+reimbursement and an `error` field; the rest of their chunk is unaffected.
+Records that are not case objects are not scored; they come back as
+{"record": ..., "reimbursement": null, "error": ...}.
+"""
+import argparse
+import csv
+import json
+import queue
+import sys
+import threading
+import time
+
+from case_io import FORMATS, case_inputs, detect_format, iter_records
+from generate_results import DEFAULT_CHUNK_SIZE, score_chunk
+
+DEFAULT_QUEUE_DEPTH = 2
+_WRITE_BUFFER = 1 << 20
+_DONE = object()
+
+
+def read_chunks(f, fmt, chunk_size):
+    """Yield (records, rejections, days, miles, receipts) for at most `chunk_size` records at a time.
+
+    rejections holds, per record, the error of a record that is not a case, or
+    None; days, miles and receipts hold the inputs of the other records only.
+    """
+    records, rejections, days, miles, receipts = [], [], [], [], []
+    for record in iter_records(f, fmt):
+        records.append(record)
+        try:
+            d, m, r = case_inputs(record)
+        except ValueError as e:
+            rejections.append(f'{type(e).__name__}: {e}')
+        else:
+            rejections.append(None)
+            days.append(d)
+            miles.append(m)
+            receipts.append(r)
+        if len(records) == chunk_size:
+            yield records, rejections, days, miles, receipts
+            records, rejections, days, miles, receipts = [], [], [], [], []
+    if records:
+        yield records, rejections, days, miles, receipts
+
+
+def _reader(chunks, out_queue, stop):
+    # Exceptions travel through the queue and are re-raised by the consumer
+    try:
+        for chunk in chunks:
+            while not stop.is_set():
+                try:
+                    out_queue.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if stop.is_set():
+                return
+        out_queue.put(_DONE)
+    except BaseException as e:
+        out_queue.put(e)
+
+
+def prefetch(chunks, depth=DEFAULT_QUEUE_DEPTH):
+    """Iterate `chunks` with up to `depth` items produced ahead by a background thread"""
+    out_queue = queue.Queue(maxsize=max(1, depth))  # 0 would mean unbounded
+    stop = threading.Event()
+    thread = threading.Thread(target=_reader, args=(chunks, out_queue, stop), daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = out_queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Consumer stopped early (error or close): let the reader exit
+        stop.set()
+
+
+def _scored(record, output, error):
+    if not isinstance(record, dict):
+        record = {'record': record}
+    record = dict(record, reimbursement=None if output is None else float(output))
+    if error is not None:
+        record['error'] = error
+    return record
+
+
+class NdjsonWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, record, output, error):
+        self.out.write(json.dumps(_scored(record, output, error)) + '\n')
+
+    def close(self):
+        pass
+
+
+class JsonArrayWriter(NdjsonWriter):
+    def __init__(self, out):
+        super().__init__(out)
+        self.first = True
+
+    def write(self, record, output, error):
+        self.out.write('[\n' if self.first else ',\n')
+        self.first = False
+        self.out.write(json.dumps(_scored(record, output, error)))
+
+    def close(self):
+        self.out.write('[]\n' if self.first else '\n]\n')
+
+
+class CsvWriter:
+    def __init__(self, out):
+        self.out = out
+        self.writer = None
+
+    def write(self, record, output, error):
+        if self.writer is None:
+            # Columns of the input, then ours
+            fields = list(record) + [name for name in ('reimbursement', 'error') if name not in record]
+            self.writer = csv.DictWriter(self.out, fields, extrasaction='ignore', lineterminator='\n')
+            self.writer.writeheader()
+        self.writer.writerow(dict(record, reimbursement=output or '', error=error or ''))
+
+    def close(self):
+        pass
+
+
+WRITERS = {'ndjson': NdjsonWriter, 'json': JsonArrayWriter, 'csv': CsvWriter}
+
+
+def score_stream(f, out, fmt, chunk_size=DEFAULT_CHUNK_SIZE, predictor=None,
+                 queue_depth=DEFAULT_QUEUE_DEPTH, log=None):
+    """Score every record of `f` into `out`; returns (records written, records with an error)"""
+    if predictor is None:
+        from ensemble import EnsemblePredictor
+        predictor = EnsemblePredictor(compiled=True)
+    predictor.models  # a broken bundle should fail the run, not turn every case into an error
+
+    writer = WRITERS[fmt](out)
+    written = failed = 0
+    for records, rejections, days, miles, receipts in prefetch(read_chunks(f, fmt, chunk_size), queue_depth):
+        scored = zip(*score_chunk(predictor, days, miles, receipts)) if days else iter(())
+        for record, rejection in zip(records, rejections):
+            output, error = (None, rejection) if rejection is not None else next(scored)
+            writer.write(record, output, error)
+            failed += error is not None
+        written += len(records)
+        if log is not None:
+            print(f'Progress: {written} cases processed...', file=log)
+    writer.close()
+    return written, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help="case file, or - for stdin")
+    parser.add_argument('-o', '--output', default='-', help='output file (default stdout)')
+    parser.add_argument('--format', choices=FORMATS, help='input/output format (default: from the extension)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--queue-depth', type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help='parsed chunks the reader may run ahead')
+    parser.add_argument('--progress', action='store_true', help='report progress on stderr')
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        if args.input == '-':
+            parser.error('--format is required when reading stdin')
+        fmt = detect_format(args.input)
+
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', newline='')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', newline='',
+                                                         buffering=_WRITE_BUFFER)
+    start = time.perf_counter()
+    try:
+        written, failed = score_stream(source, target, fmt, args.chunk_size,
+                                       queue_depth=args.queue_depth,
+                                       log=sys.stderr if args.progress else None)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+    elapsed = time.perf_counter() - start
+    print(f'Scored {written} cases ({failed} errors) in {elapsed:.2f}s '
+          f'({written / elapsed if elapsed else 0:,.0f} cases/s)', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
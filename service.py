@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""HTTP scoring service that micro-batches concurrent requests.
+
+A standard-library asyncio server in front of one EnsemblePredictor. Quotes
+that arrive within --window-ms of each other (up to --max-batch of them) are
+scored together with predict_batch on a worker thread, and each caller gets
+its own answer:
+
+    python service.py serve [--port 8080] [--max-batch 256] [--window-ms 2]
+    python service.py bench [--concurrency 64] [--requests 20000] [--verify]
+
+Endpoints:
+    POST /quote    {"days": 5, "miles": 250, "receipts": 150.75}  -> {"reimbursement": 487.25}
+    GET  /health   liveness, queue depth and the model checksum
+    GET  /stats    request counts, p50/p90/p99 latency, batch sizes, cache/grid/surrogate/cascade
+    GET  /metrics  Prometheus text, when REIMBURSE_METRICS is set
+
+Amounts are rounded like run.sh; a case the model rejects gets 422 with an
+error, without failing the rest of its batch. Backpressure: once
+--max-pending quotes are queued or being scored, new ones get 503 with
+Retry-After, and connections beyond --max-connections are refused the same
+way. The predictor is configured from the environment like worker.py
+(REIMBURSE_CACHE, REIMBURSE_GRID, REIMBURSE_FAST, REIMBURSE_CASCADE,
+REIMBURSE_METRICS).
+
+`bench` is a local load generator: keep-alive connections sending quotes for
+public_cases.json inputs; it reports throughput and client-side latency
+percentiles next to the server's own /stats.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from case_io import case_inputs
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_MAX_BATCH = 256
+DEFAULT_WINDOW_MS = 2.0
+DEFAULT_MAX_PENDING = 4096
+DEFAULT_MAX_CONNECTIONS = 1024
+MAX_BODY_BYTES = 64 * 1024
+LATENCY_WINDOW = 10_000  # most recent requests the percentiles cover
+RETRY_AFTER_SECONDS = 1
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 422: 'Unprocessable Entity', 500: 'Internal Server Error',
+            503: 'Service Unavailable'}
+
+
+class Overloaded(Exception):
+    """Raised by MicroBatcher.submit when max_pending quotes are already waiting"""
+
+
+class MicroBatcher:
+    """Collect quotes for up to `window` seconds (or `max_batch` of them) and score them together.
+
+    Batches are scored one at a time on a single worker thread, so the
+    predictor is never used concurrently; quotes arriving while a batch is
+    scored form the next one.
+    """
+
+    def __init__(self, predictor, max_batch=DEFAULT_MAX_BATCH, window=DEFAULT_WINDOW_MS / 1000,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.window = window
+        self.max_pending = max_pending
+        self.pending = 0  # queued plus being scored
+        self.batches = 0
+        self.batched_cases = 0
+        self.largest_batch = 0
+        self._queue = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scoring')
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, days, miles, receipts):
+        """(formatted amount, None) or (None, error message) for one case"""
+        if self.pending >= self.max_pending:
+            raise Overloaded()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((time.perf_counter(), days, miles, receipts, future))
+        self.pending += 1
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        from generate_results import score_chunk
+
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            if not self._queue:
+                self._wakeup.clear()
+                continue
+            # The window runs from the oldest waiting quote, so quotes queued
+            # during the previous batch are not held back twice
+            remaining = self._queue[0][0] + self.window - time.perf_counter()
+            if len(self._queue) < self.max_batch and remaining > 0:
+                await self._wait_for_batch(remaining)
+
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            if not self._queue:
+                self._wakeup.clear()
+            _, days, miles, receipts, futures = zip(*batch)
+            try:
+                outputs, errors = await loop.run_in_executor(
+                    self._executor, score_chunk, self.predictor, list(days), list(miles), list(receipts))
+            except Exception as e:
+                outputs, errors = [None] * len(batch), [f'{type(e).__name__}: {e}'] * len(batch)
+            self.pending -= len(batch)
+            self.batches += 1
+            self.batched_cases += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for future, output, error in zip(futures, outputs, errors):
+                if not future.done():  # the caller may have disconnected
+                    future.set_result((output, error))
+
+    async def _wait_for_batch(self, timeout):
+        deadline = time.perf_counter() + timeout
+        while len(self._queue) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            # submit() sets the event for every quote: re-check the batch size each time
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+            finally:
+                self._wakeup.set()
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Nearest-rank percentiles of `values`, in the same unit"""
+    if not values:
+        return {f'p{p}': None for p in points}
+    ordered = sorted(values)
+    return {f'p{p}': ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))]
+            for p in points}
+
+
+class ScoringService:
+    """HTTP/1.1 keep-alive server routing quotes through a MicroBatcher"""
+
+    def __init__(self, predictor, max_batch=DEFAULT_MAX_BATCH, window=DEFAULT_WINDOW_MS / 1000,
+                 max_pending=DEFAULT_MAX_PENDING, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.predictor = predictor
+        self.batcher_options = {'max_batch': max_batch, 'window': window, 'max_pending': max_pending}
+        self.max_connections = max_connections
+        self.batcher = None
+        self.connections = 0
+        self.responses = collections.Counter()
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        """Serve until cancelled; `ready` (an asyncio.Event) is set once listening"""
+        self.batcher = MicroBatcher(self.predictor, **self.batcher_options)
+        self.batcher.start()
+        server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_BODY_BYTES)
+        print(f"Scoring service listening on http://{host}:{port} "
+              f"(batches of up to {self.batcher.max_batch}, {self.batcher.window * 1000:g} ms window)",
+              file=sys.stderr)
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.close()
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.connections > self.max_connections:
+                await self._send(writer, 503, {'error': 'too many connections'}, keep_alive=False)
+                return
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    return
+                if isinstance(request, int):  # malformed: answer and drop the connection
+                    await self._send(writer, request, {'error': _REASONS[request]}, keep_alive=False)
+                    return
+                method, path, keep_alive, body = request
+                start = time.perf_counter()
+                status, payload = await self._route(method, path, body)
+                await self._send(writer, status, payload, keep_alive)
+                if path == '/quote' and status in (200, 422):  # answered, not rejected
+                    self.latencies.append(time.perf_counter() - start)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader):
+        """(method, path, keep_alive, body), an error status, or None at end of stream"""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            return 400
+        method, path, version = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return 400
+        if length > MAX_BODY_BYTES:
+            return 413
+        body = await reader.readexactly(length) if length else b''
+        connection = headers.get('connection', '')
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+        return method, path.split('?', 1)[0], keep_alive, body
+
+    async def _send(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+        head = [f'HTTP/1.1 {status} {_REASONS[status]}', f'Content-Type: {content_type}',
+                f'Content-Length: {len(body)}', f'Connection: {"keep-alive" if keep_alive else "close"}']
+        if status == 503:
+            head.append(f'Retry-After: {RETRY_AFTER_SECONDS}')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        self.responses[status] += 1
+        await writer.drain()
+
+    async def _route(self, method, path, body):
+        if path == '/quote':
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+            return await self._quote(body)
+        if method != 'GET':
+            return (405, {'error': 'use GET'}) if path in ('/health', '/stats', '/metrics') else \
+                (404, {'error': f'no such endpoint: {path}'})
+        if path == '/health':
+            return 200, {'status': 'ok', 'pid': os.getpid(), 'pending': self.batcher.pending,
+                         'model_checksum': self.predictor.model_checksum}
+        if path == '/stats':
+            return 200, self.stats()
+        if path == '/metrics':
+            if self.predictor.metrics is None:
+                return 404, {'error': 'metrics are disabled (set REIMBURSE_METRICS)'}
+            return 200, self.predictor.metrics.to_prometheus()
+        return 404, {'error': f'no such endpoint: {path}'}
+
+    async def _quote(self, body):
+        try:
+            request = json.loads(body)
+            days, miles, receipts = case_inputs({'trip_duration_days': request['days'],
+                                                 'miles_traveled': request['miles'],
+                                                 'total_receipts_amount': request['receipts']})
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return 400, {'error': 'expected a JSON object with numeric days, miles and receipts'}
+        if None in (days, miles, receipts) or any(isinstance(v, bool) for v in (days, miles, receipts)):
+            return 400, {'error': 'days, miles and receipts must be numbers'}
+        try:
+            output, error = await self.batcher.submit(days, miles, receipts)
+        except Overloaded:
+            return 503, {'error': 'overloaded, retry later'}
+        if error is not None:
+            return 422, {'error': error}
+        return 200, {'reimbursement': float(output)}
+
+    def stats(self):
+        batcher = self.batcher
+        from worker import handle_request
+
+        return {
+            'uptime_seconds': time.time() - self.started,
+            'responses': {str(status): count for status, count in sorted(self.responses.items())},
+            'latency_ms': {name: None if value is None else value * 1000
+                           for name, value in percentiles(list(self.latencies)).items()},
+            'latency_samples': len(self.latencies),
+            'batches': {'count': batcher.batches, 'largest': batcher.largest_batch,
+                        'mean_size': batcher.batched_cases / batcher.batches if batcher.batches else None},
+            'pending': batcher.pending,
+            'connections': self.connections,
+            **handle_request(self.predictor, {'command': 'stats'}),
+        }
+
+
+async def _http(reader, writer, method, path, payload=None):
+    # Minimal keep-alive client for bench: returns (status, decoded body)
+    body = b'' if payload is None else json.dumps(payload).encode()
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def bench(host, port, concurrency, requests, cases_path='public_cases.json', verify=False):
+    """Send `requests` quotes over `concurrency` connections and report latency percentiles"""
+    with open(cases_path) as f:
+        cases = [case_inputs(case) for case in json.load(f)]
+    rng = random.Random(0)
+    plan = [rng.choice(cases) for _ in range(requests)]
+    latencies, statuses, answers = [], collections.Counter(), {}
+
+    async def client(indices):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in indices:
+                days, miles, receipts = plan[i]
+                start = time.perf_counter()
+                status, body = await _http(reader, writer, 'POST', '/quote',
+                                           {'days': days, 'miles': miles, 'receipts': receipts})
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+                answers[i] = body.get('reimbursement')
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(range(c, requests, concurrency)) for c in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, server = await _http(reader, writer, 'GET', '/stats')
+    writer.close()
+
+    print(f"{requests:,} quotes over {concurrency} connections in {elapsed:.2f}s "
+          f"({requests / elapsed:,.0f} quotes/s); responses {dict(statuses)}")
+    client_ms = {name: value * 1000 for name, value in percentiles(latencies).items()}
+    print("client latency ms: " + '  '.join(f"{k} {v:.2f}" for k, v in client_ms.items()))
+    print("server latency ms: " + '  '.join(f"{k} {v:.2f}" for k, v in server['latency_ms'].items()
+                                            if v is not None))
+    batches = server['batches']
+    if batches['count']:
+        print(f"batches: {batches['count']:,}, mean size {batches['mean_size']:.1f}, largest {batches['largest']}")
+
+    if verify:
+        from ensemble import EnsemblePredictor
+        from generate_results import score_chunk
+
+        outputs, _ = score_chunk(EnsemblePredictor(compiled=True), *map(list, zip(*plan)))
+        wrong = sum(answers.get(i) != (None if out is None else float(out)) for i, out in enumerate(outputs))
+        print(f"verify: {requests - wrong:,} of {requests:,} quotes match predict_batch")
+        return 1 if wrong else 0
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='run the service')
+    serve.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH)
+    serve.add_argument('--window-ms', type=float, default=DEFAULT_WINDOW_MS,
+                       help='how long the first quote of a batch waits for company')
+    serve.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                       help='queued or in-flight quotes before answering 503')
+    serve.add_argument('--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS)
+    load = commands.add_parser('bench', help='load-test a running service')
+    load.add_argument('--concurrency', type=int, default=64)
+    load.add_argument('--requests', type=int, default=20_000)
+    load.add_argument('--verify', action='store_true', help='check every answer against predict_batch')
+    for command in (serve, load):
+        command.add_argument('--host', default=DEFAULT_HOST)
+        command.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        return asyncio.run(bench(args.host, args.port, args.concurrency, args.requests, verify=args.verify))
+
+    from worker import load_predictor
+
+    service = ScoringService(load_predictor(), args.max_batch, args.window_ms / 1000,
+                             args.max_pending, args.max_connections)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Score a large case file on every core, with inputs and outputs in shared memory.
+
+The days/miles/receipts columns are copied once into a
+multiprocessing.shared_memory block that also holds the output column. Each
+pool process attaches to it by name, loads the ensemble once and scores whole
+row ranges with predict_batch, writing straight into its slice of the output;
+only (start, stop) pairs and the rare error messages cross process
+boundaries.
+
+    python sharded_scoring.py                                   # private_cases.json -> private_results.txt
+    python sharded_scoring.py claims.json claims_results.txt --workers 8
+    python sharded_scoring.py private_cases.json --check        # compare with one process
+
+The result file matches generate_results.py line for line (ERROR for cases
+that cannot be scored). Predictions are identical to single-process
+predict_batch, not just close: every stage computes a row the same way
+whatever batch it is part of. --check verifies exactly that.
+"""
+import argparse
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from case_io import iter_case_chunks
+from evaluate import OUTPUT_PATTERN
+
+SHARDS_PER_WORKER = 4  # a few ranges per process evens out ML-heavy and rule-heavy stretches
+READ_CHUNK_SIZE = 100_000
+_WRITE_BUFFER = 1 << 20
+
+
+class SharedColumns:
+    """days, miles, receipts and output float64 columns in one shared-memory block"""
+
+    def __init__(self, shm, n_rows):
+        self.shm = shm
+        self.n_rows = n_rows
+        self.days, self.miles, self.receipts, self.output = np.ndarray(
+            (4, n_rows), dtype=np.float64, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, days, miles, receipts):
+        n_rows = len(days)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, 4 * n_rows * 8))
+        columns = cls(shm, n_rows)
+        columns.days[:], columns.miles[:], columns.receipts[:] = days, miles, receipts
+        columns.output[:] = np.nan
+        return columns
+
+    @classmethod
+    def attach(cls, name, n_rows):
+        # The creating process owns the block: attaching must not register it for cleanup
+        return cls(shared_memory.SharedMemory(name=name, track=False), n_rows)
+
+    def close(self):
+        # Drop the views first: the buffer cannot be released while they exist
+        self.days = self.miles = self.receipts = self.output = None
+        self.shm.close()
+
+
+def _float_column(values, offset, errors):
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        # Rare: find the bad fields; the case gets the error generate_results.py reports
+        column = np.empty(len(values))
+        for i, value in enumerate(values):
+            try:
+                column[i] = np.nan if value is None else float(value)
+            except (TypeError, ValueError) as e:
+                column[i] = np.nan
+                errors.setdefault(offset + i, f'{type(e).__name__}: {e}')
+        return column
+
+
+def load_columns(path, chunk_size=READ_CHUNK_SIZE):
+    """days, miles, receipts arrays of a case file and {row: error} for unreadable fields.
+
+    Missing fields become NaN, which fails just that case when it is scored.
+    """
+    parts, errors, offset = [], {}, 0
+    for chunk in iter_case_chunks(path, chunk_size):
+        parts.append([_float_column(values, offset, errors) for values in chunk])
+        offset += len(chunk[0])
+    if not parts:
+        return np.empty(0), np.empty(0), np.empty(0), errors
+    return (*(np.concatenate(column) for column in zip(*parts)), errors)
+
+
+def score_range(predictor, columns, start, stop):
+    """Write predictions for rows start:stop into columns.output; returns [(row, error)].
+
+    Like generate_results.score_chunk, a range that fails as a whole is split
+    in halves until the failing rows are isolated; they keep NaN as output.
+    """
+    try:
+        columns.output[start:stop] = predictor.predict_batch(
+            columns.days[start:stop], columns.miles[start:stop], columns.receipts[start:stop])
+        return []
+    except (TypeError, ValueError, ArithmeticError) as e:
+        if stop - start == 1:
+            return [(start, f'{type(e).__name__}: {e}')]
+        middle = (start + stop) // 2
+        return score_range(predictor, columns, start, middle) + score_range(predictor, columns, middle, stop)
+
+
+def shard_bounds(n_rows, n_shards):
+    """(start, stop) row ranges splitting n_rows into n_shards near-equal parts"""
+    edges = np.linspace(0, n_rows, min(n_shards, n_rows) + 1).astype(int)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+# Set in each pool process by _init_worker
+_columns = _predictor = None
+
+
+def _init_worker(name, n_rows):
+    global _columns, _predictor
+    from ensemble import EnsemblePredictor
+    _columns = SharedColumns.attach(name, n_rows)
+    _predictor = EnsemblePredictor(compiled=True, lazy=False)
+
+
+def _score_shard(bounds):
+    return score_range(_predictor, _columns, *bounds)
+
+
+def score_sharded(days, miles, receipts, workers=None, shards_per_worker=SHARDS_PER_WORKER):
+    """Predictions for every case (NaN where it failed) and {row: error}"""
+    workers = workers or os.cpu_count() or 1
+    columns = SharedColumns.create(days, miles, receipts)
+    try:
+        bounds = shard_bounds(columns.n_rows, workers * shards_per_worker)
+        if workers == 1:
+            from ensemble import EnsemblePredictor
+            predictor = EnsemblePredictor(compiled=True, lazy=False)
+            failures = [score_range(predictor, columns, *b) for b in bounds]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(columns.shm.name, columns.n_rows)) as pool:
+                failures = list(pool.map(_score_shard, bounds))
+        return columns.output.copy(), {row: error for shard in failures for row, error in shard}
+    finally:
+        columns.close()
+        columns.shm.unlink()
+
+
+def write_results(output_path, predictions, errors, log=sys.stderr):
+    """run.sh-formatted lines like generate_results.py; returns the number of ERROR lines"""
+    failed = 0
+    tmp_path = f'{output_path}.tmp'
+    with open(tmp_path, 'w', buffering=_WRITE_BUFFER) as out:
+        for i, result in enumerate(predictions.tolist()):
+            output = f'{result:.2f}'
+            error = errors.get(i)
+            if error is None and not OUTPUT_PATTERN.match(output):
+                error = f'Invalid output format: {output}'
+            if error is not None:
+                print(f'Error on case {i + 1}: {error}', file=log)
+                out.write('ERROR\n')
+                failed += 1
+            else:
+                out.write(output + '\n')
+    os.replace(tmp_path, output_path)
+    return failed
+
+
+def check_single_process(days, miles, receipts, predictions):
+    """Rows where the sharded predictions differ from one predict_batch pass"""
+    from ensemble import EnsemblePredictor
+
+    columns = SharedColumns.create(days, miles, receipts)
+    try:
+        score_range(EnsemblePredictor(compiled=True, lazy=False), columns, 0, columns.n_rows)
+        expected = columns.output.copy()
+    finally:
+        columns.close()
+        columns.shm.unlink()
+    same = (predictions == expected) | (np.isnan(predictions) & np.isnan(expected))
+    return np.flatnonzero(~same)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cases', nargs='?', default='private_cases.json')
+    parser.add_argument('output', nargs='?', default='private_results.txt')
+    parser.add_argument('--workers', type=int, default=None, help='pool processes (default: all cores)')
+    parser.add_argument('--shards-per-worker', type=int, default=SHARDS_PER_WORKER)
+    parser.add_argument('--check', action='store_true',
+                        help='compare with single-process scoring instead of writing results')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    days, miles, receipts, load_errors = load_columns(args.cases)
+    loaded = time.perf_counter()
+    predictions, errors = score_sharded(days, miles, receipts, args.workers, args.shards_per_worker)
+    errors.update(load_errors)
+    scored = time.perf_counter()
+    workers = args.workers or os.cpu_count() or 1
+    print(f'Scored {len(days)} cases on {workers} worker(s) in {scored - loaded:.2f}s '
+          f'({len(days) / (scored - loaded):,.0f} cases/s; reading took {loaded - start:.2f}s)', file=sys.stderr)
+
+    if args.check:
+        differ = check_single_process(days, miles, receipts, predictions)
+        if len(differ):
+            print(f'{len(differ)} predictions differ from single-process scoring, first at case {differ[0] + 1}',
+                  file=sys.stderr)
+            return 1
+        print(f'All {len(days)} predictions are identical to single-process scoring', file=sys.stderr)
+        return 0
+
+    failed = write_results(args.output, predictions, errors)
+    print(f'Wrote {len(days)} results ({failed} ERROR) to {args.output} '
+          f'in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Cold-start report: what a fresh process imports and how long it takes, per route.
+
+Each route is scored by a brand-new interpreter run with `-X importtime`. The
+report shows the process wall time, which heavy libraries were imported, and
+the slowest top-level imports:
+
+    python startup_report.py [--top 5] [--compiled]
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+# One representative case per route of EnsemblePredictor.predict
+ROUTE_CASES = [
+    ('high_intensity_strict', (1, 1100, 1782.5)),
+    ('high_intensity', (1, 900, 100)),
+    ('low_mileage_high_receipt', (5, 100, 1000)),
+    ('extreme_rule_based', (3, 30, 100)),
+    ('ml_ensemble', (3, 150, 100)),
+]
+HEAVY_MODULES = ['numpy', 'pandas', 'joblib', 'sklearn', 'lightgbm']
+
+_SNIPPET = """
+from ensemble import EnsemblePredictor
+print(f'{{EnsemblePredictor(compiled={compiled}).predict({days}, {miles}, {receipts}):.2f}}')
+"""
+
+
+def parse_importtime(stderr):
+    """Parse -X importtime output into (top-level import -> cumulative ms, all module names)"""
+    cumulative = {}
+    imported = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|', 2)
+        imported.add(name.strip())
+        # Nested imports are indented two spaces per level after the separator
+        if not name.startswith('  '):
+            cumulative[name.strip()] = int(cumulative_us) / 1000
+    return cumulative, imported
+
+
+def measure_route(days, miles, receipts, compiled=False):
+    """Run one prediction in a fresh interpreter; returns (wall_ms, parsed imports, output)"""
+    code = _SNIPPET.format(compiled=compiled, days=days, miles=miles, receipts=receipts)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-W', 'ignore', '-c', code],
+                            capture_output=True, text=True, check=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    return wall_ms, parse_importtime(result.stderr), result.stdout.strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=5, help='slowest imports to list per route')
+    parser.add_argument('--compiled', action='store_true', help='use EnsemblePredictor(compiled=True)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    interpreter_ms = (time.perf_counter() - start) * 1000
+    print(f"Bare interpreter start-up: {interpreter_ms:.0f} ms")
+    print()
+
+    for route, case in ROUTE_CASES:
+        wall_ms, (imports, imported), output = measure_route(*case, compiled=args.compiled)
+        heavy = [name for name in HEAVY_MODULES if name in imported]
+        print(f"{route:26} {wall_ms:7.0f} ms  -> {output:>8}  heavy imports: {', '.join(heavy) or 'none'}")
+        slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        for name, ms in slowest:
+            print(f"    {ms:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,20 @@
-import pandas as pd
 from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 import joblib
-import json
-from feature_eng import engineer_features
+from feature_store import load_features
 
 # Force RandomForest for better generalization with small dataset
 USE_RANDOMFOREST = True
 print("Using RandomForest for better generalization")
 
-# Load and prepare data
-with open('public_cases.json', 'r') as f:
-    data = json.load(f)
-
-# Extract input features and target
-input_data = pd.DataFrame([d['input'] for d in data])
-target_data = [d['expected_output'] for d in data]
+# Load engineered features (cached by feature_store.py; rebuilt when the data or feature_eng.py changes)
+features = load_features('public_cases.json')
+input_data = features.frame()
+target_data = features.y
 
 print(f"Loaded {len(input_data)} training cases")
-print(f"Features: {list(input_data.columns)}")
-
-# Engineer features
-input_data = engineer_features(input_data)
+print(f"Features: {features.columns[:3]}")
 print(f"After feature engineering: {list(input_data.columns)}")
 
 # Split data
@@ -1,10 +1,34 @@
+"""Train the LightGBM / RandomForest / LinearRegression ensemble.
+
+Every model family is scored with k-fold cross-validation and then refit on
+the usual train_test_split(random_state=42) training split, which is what gets
+saved. All (model, fold) fits and the final fits run at the same time across a
+process pool; RandomForest and LightGBM share the remaining cores via n_jobs.
+
+    python train_ensemble.py [--folds 5] [--workers N] [--oof-output oof_predictions.csv]
+                             [--prune-threshold 0.001] [--pruning-report features.csv]
+
+Out-of-fold predictions (one row per case: each model and the weighted blend)
+are written to --oof-output, and fit times are reported per model. A feature
+pruning report follows: columns ranked by their weighted importance in the
+final models, with duplicates and low-importance columns marked (see
+feature_registry.pruning_report).
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-import joblib
-import json
-from feature_eng import engineer_features
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import KFold, train_test_split
+
+from ensemble import MODEL_WEIGHTS
+from feature_store import load_features
 
 # Import LightGBM with fallback
 try:
@@ -13,56 +37,176 @@ try:
 except ImportError:
     HAS_LIGHTGBM = False
 
-print("Training ensemble of models...")
-
-# Load and prepare data
-with open('public_cases.json', 'r') as f:
-    data = json.load(f)
-
-# Extract input features and target
-input_data = pd.DataFrame([d['input'] for d in data])
-target_data = [d['expected_output'] for d in data]
-
-print(f"Loaded {len(input_data)} training cases")
-
-# Engineer features
-input_data = engineer_features(input_data)
-print(f"Features: {len(input_data.columns)} total")
-
-# Split data
-X_train, X_val, y_train, y_val = train_test_split(input_data, target_data, test_size=0.2, random_state=42)
-
-# Train LightGBM
-if HAS_LIGHTGBM:
-    print("Training LightGBM...")
-    lgb_model = LGBMRegressor(n_estimators=100, learning_rate=0.1, random_state=42, verbose=-1)
-    lgb_model.fit(X_train, y_train)
-    lgb_score = lgb_model.score(X_val, y_val)
-    joblib.dump(lgb_model, 'lgb_model.pkl')
-    print(f"LightGBM R² Score: {lgb_score:.4f}")
-else:
-    print("LightGBM not available")
-
-# Train RandomForest
-print("Training RandomForest...")
-rf_model = RandomForestRegressor(
-    n_estimators=50,
-    max_depth=8,
-    min_samples_split=10,
-    min_samples_leaf=5,
-    random_state=42
-)
-rf_model.fit(X_train, y_train)
-rf_score = rf_model.score(X_val, y_val)
-joblib.dump(rf_model, 'rf_model.pkl')
-print(f"RandomForest R² Score: {rf_score:.4f}")
-
-# Train Linear Regression
-print("Training Linear Regression...")
-lr_model = LinearRegression()
-lr_model.fit(X_train, y_train)
-lr_score = lr_model.score(X_val, y_val)
-joblib.dump(lr_model, 'lr_model.pkl')
-print(f"Linear Regression R² Score: {lr_score:.4f}")
-
-print("All models trained and saved!") 
\ No newline at end of file
+MODEL_FILES = {'lgb': 'lgb_model.pkl', 'rf': 'rf_model.pkl', 'lr': 'lr_model.pkl'}
+MODEL_LABELS = {'lgb': 'LightGBM', 'rf': 'RandomForest', 'lr': 'Linear Regression'}
+FINAL = 'final'  # fold id of the fit on the train_test_split training set
+
+
+def make_model(name, n_jobs=1):
+    """Unfitted model with the ensemble's hyperparameters"""
+    if name == 'lgb':
+        return LGBMRegressor(n_estimators=100, learning_rate=0.1, random_state=42, verbose=-1,
+                             n_jobs=n_jobs)
+    if name == 'rf':
+        return RandomForestRegressor(
+            n_estimators=50,
+            max_depth=8,
+            min_samples_split=10,
+            min_samples_leaf=5,
+            random_state=42,
+            n_jobs=n_jobs,
+        )
+    return LinearRegression()
+
+
+def final_split(n_cases):
+    """(train, validation) row indices of the split the saved models are fit on"""
+    return train_test_split(np.arange(n_cases), test_size=0.2, random_state=42)
+
+
+def load_training_data(path='public_cases.json'):
+    """Engineered feature frame and target array, memory-mapped from the feature store"""
+    features = load_features(path)
+    return features.frame(), np.asarray(features.y)
+
+
+# Set in each pool process by _init_worker so tasks only carry row indices
+_X = _y = None
+
+
+def _init_worker(X, y):
+    global _X, _y
+    _X, _y = X, y
+
+
+def _fit(task):
+    """Fit one (model, fold) task; returns held-out predictions or the fitted final model"""
+    name, fold, train_idx, test_idx, n_jobs = task
+    model = make_model(name, n_jobs)
+    start = time.perf_counter()
+    model.fit(_X.iloc[train_idx], _y[train_idx])
+    fit_seconds = time.perf_counter() - start
+    predictions = model.predict(_X.iloc[test_idx])
+    # The saved models predict a handful of rows at a time: no thread pools
+    model.set_params(n_jobs=None)
+    return {'name': name, 'fold': fold, 'test_idx': test_idx, 'predictions': predictions,
+            'fit_seconds': fit_seconds, 'model': model if fold == FINAL else None}
+
+
+def train(X, y, folds=5, workers=None, model_names=None):
+    """Cross-validate and fit every model family in parallel.
+
+    Returns (final models, out-of-fold predictions per model, hold-out R² per
+    model, fit seconds per model summed over all of its fits).
+    """
+    model_names = model_names or [name for name in MODEL_FILES if name != 'lgb' or HAS_LIGHTGBM]
+    workers = workers or os.cpu_count() or 1
+    # Cores left for each task's own threads once the pool is busy
+    n_jobs = max(1, (os.cpu_count() or 1) // workers)
+
+    indices = np.arange(len(y))
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=42).split(indices))
+    train_idx, val_idx = final_split(len(y))
+
+    tasks = []
+    for name in model_names:
+        tasks.append((name, FINAL, train_idx, val_idx, n_jobs))
+        tasks += [(name, fold, fit_idx, held_idx, n_jobs) for fold, (fit_idx, held_idx) in enumerate(splits)]
+    # Slowest families first so the pool drains evenly
+    order = {'rf': 0, 'lgb': 1, 'lr': 2}
+    tasks.sort(key=lambda task: order[task[0]])
+
+    models, holdout, fit_seconds = {}, {}, dict.fromkeys(model_names, 0.0)
+    oof = {name: np.full(len(y), np.nan) for name in model_names}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(X, y)) as pool:
+        for result in pool.map(_fit, tasks):
+            name = result['name']
+            fit_seconds[name] += result['fit_seconds']
+            if result['fold'] == FINAL:
+                models[name] = result['model']
+                holdout[name] = r2_score(y[result['test_idx']], result['predictions'])
+            else:
+                oof[name][result['test_idx']] = result['predictions']
+    models = {name: models[name] for name in model_names}
+    return models, oof, holdout, fit_seconds
+
+
+def blend(oof):
+    """Weighted ensemble of out-of-fold predictions, as EnsemblePredictor averages them"""
+    names = list(oof)
+    return np.average([oof[name] for name in names], axis=0,
+                      weights=[MODEL_WEIGHTS[name] for name in names])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None, help='pool processes (default: all cores)')
+    parser.add_argument('--oof-output', default='oof_predictions.csv')
+    parser.add_argument('--prune-threshold', type=float, default=0.001,
+                        help='weighted importance below which a column is a pruning candidate')
+    parser.add_argument('--pruning-report', help='also write the pruning report as CSV')
+    args = parser.parse_args(argv)
+
+    print("Training ensemble of models...")
+    X, y = load_training_data()
+    print(f"Loaded {len(X)} training cases")
+    print(f"Features: {len(X.columns)} total")
+    if not HAS_LIGHTGBM:
+        print("LightGBM not available")
+
+    start = time.perf_counter()
+    models, oof, holdout, fit_seconds = train(X, y, args.folds, args.workers)
+    wall = time.perf_counter() - start
+
+    oof['ensemble'] = blend({name: oof[name] for name in models})
+    print(f"\n{args.folds}-fold cross-validation (out-of-fold):")
+    for name, predictions in oof.items():
+        label = MODEL_LABELS.get(name, 'Weighted ensemble')
+        line = (f"  {label:18} R² {r2_score(y, predictions):.4f}   "
+                f"MAE {mean_absolute_error(y, predictions):7.2f}")
+        if name in models:
+            line += f"   hold-out R² {holdout[name]:.4f}   fit time {fit_seconds[name]:6.2f}s"
+        print(line)
+    print(f"  wall time {wall:.2f}s")
+
+    frame = pd.DataFrame({'expected_output': y, **oof})
+    frame.index.name = 'case'
+    frame.to_csv(args.oof_output)
+    print(f"Out-of-fold predictions written to {args.oof_output}")
+
+    from feature_registry import format_pruning_report, pruning_report
+
+    report = pruning_report(models, X, threshold=args.prune_threshold)
+    print("\nFeature importance (final models):")
+    print(format_pruning_report(report))
+    if args.pruning_report:
+        pd.DataFrame(report).to_csv(args.pruning_report, index=False)
+        print(f"Pruning report written to {args.pruning_report}")
+
+    for name, model in models.items():
+        joblib.dump(model, MODEL_FILES[name])
+
+    # Running least-squares statistics for incremental_update.py
+    from incremental_update import LINEAR_STATS_FILE, LinearStats
+
+    train_idx, _ = final_split(len(y))
+    LinearStats.from_data(X.to_numpy()[train_idx], y[train_idx], list(X.columns)).save(LINEAR_STATS_FILE)
+
+    # Write the single-file deployment bundle (see model_bundle.py)
+    import compiled_models
+    import model_bundle
+
+    checksum = model_bundle.write_bundle(
+        model_bundle.BUNDLE_FILE,
+        compiled_models.compile_models(models),
+        source={'trained_by': 'train_ensemble.py', 'training_data': 'public_cases.json',
+                'cv_folds': args.folds},
+    )
+    print(f"Model bundle written to {model_bundle.BUNDLE_FILE} (sha256 {checksum[:12]})")
+
+    print("All models trained and saved!")
+
+
+if __name__ == '__main__':
+    main()
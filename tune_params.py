@@ -1,216 +1,293 @@
 #!/usr/bin/env python3
+"""Vectorized search over the rule-route parameters and routing thresholds.
 
-# Test cases from our analysis - key problem cases
-test_cases = [
-    # High-intensity cases (Route 1)
-    {"days": 1, "miles": 1082, "receipts": 1809.49, "expected": 446.94, "type": "high_intensity"},
-    {"days": 1, "miles": 1002, "receipts": 2320.34, "expected": 1475.40, "type": "high_intensity"},
-    {"days": 2, "miles": 1189, "receipts": 1164, "expected": 1666.52, "type": "high_intensity"},
-    {"days": 1, "miles": 809, "receipts": 1734, "expected": 1447.25, "type": "high_intensity"},
-    
-    # Low-mileage, high-receipt cases (Route 2)
-    {"days": 12, "miles": 398, "receipts": 2481.22, "expected": 1755.18, "type": "low_mileage_high_receipt"},
-    {"days": 5, "miles": 233, "receipts": 1862.04, "expected": 1562.23, "type": "low_mileage_high_receipt"},
-    {"days": 3, "miles": 133, "receipts": 1728.50, "expected": 1373.40, "type": "low_mileage_high_receipt"},
-    {"days": 4, "miles": 198, "receipts": 2106.63, "expected": 1450.67, "type": "low_mileage_high_receipt"},
-    
-    # Normal cases (should stay good)
-    {"days": 3, "miles": 150, "receipts": 100, "expected": 369.00, "type": "normal"},
-    {"days": 1, "miles": 50, "receipts": 10, "expected": 149.00, "type": "normal"}
-]
-
-def predict_route_1a(days, miles, receipts, base_multiplier=400, mileage_rate=0.2, receipt_rate=0.1, strict_cap=500):
-    """Route 1A: High-intensity + High receipts but low expected → Strict penalty"""
-    base_reimbursement = min(base_multiplier * days, miles * mileage_rate)
-    receipt_allowance = receipts * receipt_rate
-    return min(base_reimbursement + receipt_allowance, strict_cap * days)
-
-def predict_route_1b(days, miles, receipts, base_multiplier=1000, mileage_rate=0.65, receipt_rate=0.85, receipt_cap_per_day=600):
-    """Route 1B: High-intensity + Normal receipt patterns → Expert's enhanced approach"""
-    base_reimbursement = min(base_multiplier * days, miles * mileage_rate)
-    receipt_allowance = min(receipts * receipt_rate, receipt_cap_per_day * days)
-    return base_reimbursement + receipt_allowance
-
-def predict_route_2(days, miles, receipts, base_per_day=110, receipt_rate=0.8, receipt_cap_per_day=160, mileage_rate=0.3):
-    """Route 2: Low-mileage, high-receipt → Expert's refined approach with granular controls"""
-    base_per_diem = base_per_day * days
-    
-    # Expert's refined receipt handling with more granular controls
-    if days > 10:
-        receipt_allowance = min(receipts * 0.35, 90 * days)  # Very strict for long trips
-    elif days > 7:
-        receipt_allowance = min(receipts * 0.5, 110 * days)  # Moderate for week+ trips
-    elif days > 5:
-        receipt_allowance = min(receipts * 0.6, 130 * days)  # Moderate for medium trips
-    else:
-        receipt_allowance = min(receipts * receipt_rate, receipt_cap_per_day * days)  # Generous for short trips
-        
-    mileage_reimbursement = miles * mileage_rate
-    return base_per_diem + receipt_allowance + mileage_reimbursement
-
-def calculate_error(predicted, expected):
-    """Calculate percentage error"""
-    return abs(predicted - expected) / expected * 100
-
-def test_parameters(r1a_params, r1b_params, r2_params, threshold=3.0):
-    """Test a set of parameters on all test cases with 3-tier routing"""
-    total_error = 0
-    results = []
-    
-    for case in test_cases:
-        days, miles, receipts, expected = case["days"], case["miles"], case["receipts"], case["expected"]
-        case_type = case["type"]
-        
-        # Calculate metrics for routing
-        miles_per_day = miles / days
-        receipt_to_mile = receipts / miles
-        receipt_to_expected_ratio = receipts / expected if expected > 0 else float('inf')
-        
-        # 3-Tier Routing Logic
-        if miles_per_day > 500 and receipt_to_expected_ratio > threshold:
-            predicted = predict_route_1a(days, miles, receipts, **r1a_params)
-            route = "Route 1A"
-        elif miles_per_day > 500:
-            predicted = predict_route_1b(days, miles, receipts, **r1b_params)
-            route = "Route 1B"
-        elif miles_per_day < 100 and receipt_to_mile > 5:
-            predicted = predict_route_2(days, miles, receipts, **r2_params)
-            route = "Route 2"
+Scores candidate settings for Route 1A (predict_high_intensity_strict),
+Route 1B (predict_high_intensity), Route 2 (predict_low_mileage_high_receipt)
+and the thresholds of route_cases() on the full public set with the eval.sh
+score. The ML / extreme-rule predictions for every case are computed once up
+front. A block of P candidate settings is then scored as (P, n_cases) arrays
+by broadcasting parameter columns through rule_engine, so thousands of
+combinations take seconds.
+
+    python tune_params.py grid --grid aggressive.mileage_rate=0.5:0.9:21 aggressive.receipt_rate=0.7:1.0:16
+    python tune_params.py random --samples 20000 --params aggressive low_mileage
+    python tune_params.py descent --rounds 4 --points 41
+    python tune_params.py current
+
+Parameters are named route.keyword after rule_engine's keyword arguments
+(see `python tune_params.py list`). Large searches fan out over --workers
+processes. Search scores round predictions to cents like run.sh; the final
+report re-scores the winner with evaluate.py's exact eval.sh arithmetic.
+"""
+import argparse
+import inspect
+import sys
+import time
+
+import numpy as np
+
+import rule_engine
+
+# Parameter prefix -> rule_engine function whose keyword defaults are the live values
+ROUTE_PARAMETERS = {
+    'strict': rule_engine.predict_high_intensity_strict,
+    'aggressive': rule_engine.predict_high_intensity,
+    'low_mileage': rule_engine.predict_low_mileage_high_receipt,
+    'routing': rule_engine.route_cases,
+}
+# Default search range: the current value +/- this fraction
+SEARCH_SPAN = 0.5
+# Candidate settings x cases evaluated per block, which bounds memory
+_BLOCK_ELEMENTS = 2_000_000
+
+
+def current_parameters():
+    """Every tunable parameter with its current value, as {'route.name': value}"""
+    params = {}
+    for prefix, function in ROUTE_PARAMETERS.items():
+        for name, parameter in inspect.signature(function).parameters.items():
+            if parameter.default is not inspect.Parameter.empty:
+                params[f'{prefix}.{name}'] = float(parameter.default)
+    return params
+
+
+def select_parameters(patterns):
+    """Parameter names matching full names or route prefixes (all when empty)"""
+    names = list(current_parameters())
+    if not patterns:
+        return names
+    selected = [name for name in names if name in patterns or name.split('.')[0] in patterns]
+    unknown = [p for p in patterns if not any(n == p or n.split('.')[0] == p for n in names)]
+    if unknown:
+        raise SystemExit(f"Unknown parameters: {unknown} (see `python tune_params.py list`)")
+    return selected
+
+
+def search_range(name, span=SEARCH_SPAN):
+    value = current_parameters()[name]
+    return value * (1 - span), value * (1 + span)
+
+
+def load_public_cases(path='public_cases.json'):
+    """(days, miles, receipts, expected) arrays from the feature store"""
+    from feature_store import load_features
+
+    features = load_features(path)
+    days, miles, receipts = (np.array(column) for column in features.inputs.T)
+    return days, miles, receipts, np.array(features.y)
+
+
+def normal_route_predictions(days, miles, receipts):
+    """What predict_normal() returns for every case: rules when extreme, else the ML ensemble"""
+    from ensemble import EnsemblePredictor
+
+    predictor = EnsemblePredictor()
+    normal = rule_engine.rule_based_calculation(days, miles, receipts)
+    ml = ~rule_engine.is_extreme_case(days, miles, receipts)
+    if ml.any():
+        normal[ml] = predictor._predict_ml_batch(days[ml], miles[ml], receipts[ml])
+    return normal
+
+
+class RouteEvaluator:
+    """eval.sh scores for blocks of parameter settings over a fixed case set"""
+
+    def __init__(self, days, miles, receipts, expected, normal):
+        self.days, self.miles, self.receipts = days, miles, receipts
+        self.expected_cents = np.round(expected * 100)
+        self.normal = normal
+
+    def predictions(self, params):
+        """Predictions of shape (P, n_cases) for P settings given as {name: array of P}"""
+        columns = {prefix: {} for prefix in ROUTE_PARAMETERS}
+        for name, values in params.items():
+            prefix, keyword = name.split('.', 1)
+            columns[prefix][keyword] = np.asarray(values, dtype=float).reshape(-1, 1)
+        cases = (self.days, self.miles, self.receipts)
+        routes = rule_engine.route_cases(*cases, **columns['routing'])
+        return np.select(
+            [routes == rule_engine.ROUTE_STRICT, routes == rule_engine.ROUTE_AGGRESSIVE,
+             routes == rule_engine.ROUTE_LOW_MILEAGE],
+            [rule_engine.predict_high_intensity_strict(*cases, **columns['strict']),
+             rule_engine.predict_high_intensity(*cases, **columns['aggressive']),
+             rule_engine.predict_low_mileage_high_receipt(*cases, **columns['low_mileage'])],
+            self.normal,
+        )
+
+    def scores(self, params):
+        """eval.sh score for each of the P settings (lower is better)"""
+        n_settings = max((np.size(v) for v in params.values()), default=1)
+        block = max(1, _BLOCK_ELEMENTS // len(self.days))
+        out = np.empty(n_settings)
+        for start in range(0, n_settings, block):
+            chunk = {name: np.broadcast_to(values, (n_settings,))[start:start + block]
+                     for name, values in params.items()}
+            predictions = np.atleast_2d(self.predictions(chunk))
+            # run.sh prints cents; eval.sh truncates the average error to cents
+            error_cents = np.abs(np.round(predictions * 100) - self.expected_cents)
+            exact = (error_cents == 0).sum(axis=1)
+            avg_error = np.floor(error_cents.sum(axis=1) / len(self.days)) / 100
+            out[start:start + block] = avg_error * 100 + (len(self.days) - exact) * 0.1
+        return out
+
+
+# One evaluator per pool process, built once by _init_pool
+_evaluator = None
+
+
+def _init_pool(arrays):
+    global _evaluator
+    _evaluator = RouteEvaluator(*arrays)
+
+
+def _score_block(params):
+    return _evaluator.scores(params)
+
+
+def score_settings(evaluator, params, workers=1):
+    """Scores for {name: array of P}; splits P across a process pool when workers > 1"""
+    n_settings = max((np.size(v) for v in params.values()), default=1)
+    if workers <= 1 or n_settings < 4 * workers:
+        return evaluator.scores(params)
+    from concurrent.futures import ProcessPoolExecutor
+
+    bounds = np.linspace(0, n_settings, 4 * workers + 1).astype(int)
+    blocks = [{name: np.broadcast_to(values, (n_settings,))[lo:hi] for name, values in params.items()}
+              for lo, hi in zip(bounds[:-1], bounds[1:])]
+    arrays = (evaluator.days, evaluator.miles, evaluator.receipts,
+              evaluator.expected_cents / 100, evaluator.normal)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool, initargs=(arrays,)) as pool:
+        return np.concatenate(list(pool.map(_score_block, blocks)))
+
+
+def grid_search(evaluator, grid, workers=1):
+    """Score the Cartesian product of {name: values}; returns (best params, best score, settings scored)"""
+    names = list(grid)
+    mesh = np.meshgrid(*(np.asarray(grid[name], dtype=float) for name in names), indexing='ij')
+    params = {name: axis.ravel() for name, axis in zip(names, mesh)}
+    scores = score_settings(evaluator, params, workers)
+    best = int(np.argmin(scores))
+    return {name: float(params[name][best]) for name in names}, float(scores[best]), len(scores)
+
+
+def random_search(evaluator, names, samples, workers=1, seed=0, span=SEARCH_SPAN):
+    """Score `samples` settings drawn uniformly within each parameter's search range"""
+    rng = np.random.default_rng(seed)
+    params = {name: rng.uniform(*search_range(name, span), samples) for name in names}
+    scores = score_settings(evaluator, params, workers)
+    best = int(np.argmin(scores))
+    return {name: float(params[name][best]) for name in names}, float(scores[best]), samples
+
+
+def coordinate_descent(evaluator, names, rounds=4, points=41, workers=1, span=SEARCH_SPAN):
+    """Sweep one parameter at a time around the best setting, halving the span each round"""
+    best = {name: current_parameters()[name] for name in names}
+    best_score = float(evaluator.scores({name: [value] for name, value in best.items()})[0])
+    evaluated = 1
+    for round_number in range(rounds):
+        width = span / 2 ** round_number
+        for name in names:
+            centre = best[name]
+            radius = abs(current_parameters()[name]) * width
+            candidates = np.linspace(centre - radius, centre + radius, points)
+            params = {other: [value] for other, value in best.items() if other != name}
+            params[name] = candidates
+            scores = score_settings(evaluator, params, workers)
+            evaluated += len(candidates)
+            i = int(np.argmin(scores))
+            if scores[i] < best_score:
+                best[name], best_score = float(candidates[i]), float(scores[i])
+    return best, best_score, evaluated
+
+
+def exact_eval_score(evaluator, params):
+    """eval.sh metrics for one setting, via evaluate.py's exact bc arithmetic"""
+    import evaluate
+
+    cases = evaluate.load_cases()
+    predictions = evaluator.predictions({name: [value] for name, value in params.items()})
+    outputs = [f'{p:.2f}' for p in np.ravel(predictions)]
+    return evaluate.score_outputs(cases, outputs, [None] * len(outputs))
+
+
+def _parse_grid(specs):
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        select_parameters([name])
+        if ':' in values:
+            low, high, points = values.split(':')
+            grid[name] = np.linspace(float(low), float(high), int(points))
         else:
-            # For normal cases, assume they stay the same (376.78, 144.66 from test)
-            if days == 3 and miles == 150:
-                predicted = 376.78
-            elif days == 1 and miles == 50:
-                predicted = 144.66
-            else:
-                predicted = expected  # placeholder
-            route = "Route 3"
-        
-        error = calculate_error(predicted, expected)
-        total_error += error
-        
-        results.append({
-            "case": f"{days}d,{miles}mi,${receipts:.0f}",
-            "expected": expected,
-            "predicted": predicted,
-            "error": error,
-            "route": route,
-            "type": case_type
-        })
-    
-    return total_error, results
-
-def print_results(total_error, results, params_desc):
-    """Pretty print results"""
-    print(f"\n{'='*60}")
-    print(f"TESTING: {params_desc}")
-    print(f"Total Error: {total_error:.1f}%")
-    print(f"Average Error: {total_error/len(results):.1f}%")
-    print(f"{'='*60}")
-    
-    # Group by route
-    routes = {}
-    for result in results:
-        route = result["route"]
-        if route not in routes:
-            routes[route] = []
-        routes[route].append(result)
-    
-    for route in sorted(routes.keys()):
-        print(f"\n{route} Cases:")
-        print("-" * 50)
-        for r in routes[route]:
-            status = "✅" if r["error"] < 20 else "⚠️" if r["error"] < 50 else "❌"
-            print(f"{status} {r['case']:20} → ${r['predicted']:7.0f} vs ${r['expected']:7.0f} ({r['error']:4.1f}%)")
-
-# Test enhanced parameters with expert's recommendations
-print("🔧 EXPERT'S ENHANCED PARAMETER TUNING")
-print("Testing expert's recommendations applied to our current system...")
-
-# Enhanced parameters based on expert's recommendations
-r1a_enhanced = {"base_multiplier": 350, "mileage_rate": 0.15, "receipt_rate": 0.08, "strict_cap": 450}
-r1b_enhanced = {"base_multiplier": 1000, "mileage_rate": 0.65, "receipt_rate": 0.85, "receipt_cap_per_day": 600}
-r2_enhanced = {"base_per_day": 110, "receipt_rate": 0.8, "receipt_cap_per_day": 160, "mileage_rate": 0.3}
-
-total_error_enhanced, results_enhanced = test_parameters(r1a_enhanced, r1b_enhanced, r2_enhanced)
-print_results(total_error_enhanced, results_enhanced, "EXPERT'S ENHANCED PARAMETERS")
-
-# Compare with current parameters
-r1a_current = {"base_multiplier": 350, "mileage_rate": 0.15, "receipt_rate": 0.08, "strict_cap": 450}
-r1b_current = {"base_multiplier": 900, "mileage_rate": 0.6, "receipt_rate": 0.8, "receipt_cap_per_day": 500}
-r2_current = {"base_per_day": 100, "receipt_rate": 0.75, "receipt_cap_per_day": 150, "mileage_rate": 0.25}
-
-total_error_current, results_current = test_parameters(r1a_current, r1b_current, r2_current)
-print_results(total_error_current, results_current, "CURRENT PARAMETERS (PRE-EXPERT)")
-
-# Test expert's additional recommendations
-print("\n" + "🚀 TESTING EXPERT'S ADDITIONAL REFINEMENTS" + "\n")
-
-# Option A: Even more aggressive for high-intensity underestimation
-r1a_optionA = {"base_multiplier": 350, "mileage_rate": 0.15, "receipt_rate": 0.08, "strict_cap": 450}
-r1b_optionA = {"base_multiplier": 1100, "mileage_rate": 0.7, "receipt_rate": 0.9, "receipt_cap_per_day": 650}
-r2_optionA = {"base_per_day": 115, "receipt_rate": 0.8, "receipt_cap_per_day": 160, "mileage_rate": 0.32}
-
-total_errorA, resultsA = test_parameters(r1a_optionA, r1b_optionA, r2_optionA)
-print_results(total_errorA, resultsA, "OPTION A: Very aggressive high-intensity")
-
-# Option B: Balanced enhancement with focus on receipt handling
-r1a_optionB = {"base_multiplier": 350, "mileage_rate": 0.15, "receipt_rate": 0.08, "strict_cap": 450}
-r1b_optionB = {"base_multiplier": 950, "mileage_rate": 0.62, "receipt_rate": 0.82, "receipt_cap_per_day": 550}
-r2_optionB = {"base_per_day": 105, "receipt_rate": 0.8, "receipt_cap_per_day": 160, "mileage_rate": 0.28}
-
-total_errorB, resultsB = test_parameters(r1a_optionB, r1b_optionB, r2_optionB)
-print_results(total_errorB, resultsB, "OPTION B: Balanced enhancement")
-
-# Find best enhanced option
-enhanced_options = [
-    ("CURRENT (PRE-EXPERT)", total_error_current),
-    ("EXPERT'S ENHANCED", total_error_enhanced),
-    ("OPTION A: Very aggressive", total_errorA),
-    ("OPTION B: Balanced", total_errorB)
-]
-
-best_enhanced = min(enhanced_options, key=lambda x: x[1])
-print(f"\n🏆 BEST ENHANCED PARAMETERS: {best_enhanced[0]} with {best_enhanced[1]:.1f}% total error")
-
-print(f"\n💡 EXPERT'S IMPACT ANALYSIS")
-print(f"=" * 60)
-print(f"Pre-Expert Performance:  {total_error_current:.1f}% total error")
-print(f"Expert's Enhanced:       {total_error_enhanced:.1f}% total error")
-improvement = ((total_error_current - total_error_enhanced) / total_error_current) * 100
-print(f"Improvement:             {improvement:+.1f}%")
-
-# Focus on the specific cases the expert mentioned
-print(f"\n🔍 EXPERT'S TARGET CASES ANALYSIS")
-print("=" * 60)
-
-target_cases = [
-    {"days": 1, "miles": 809, "receipts": 1734, "expected": 1447.25, "note": "Expert mentioned: 1-day, 809-mile underestimation"},
-    {"days": 12, "miles": 398, "receipts": 2481.22, "expected": 1755.18, "note": "Low-mileage, high-receipt case"},
-]
-
-for case in target_cases:
-    days, miles, receipts, expected = case["days"], case["miles"], case["receipts"], case["expected"]
-    
-    # Test with enhanced parameters
-    miles_per_day = miles / days
-    receipt_to_mile = receipts / miles
-    
-    if miles_per_day > 500:
-        pred_enhanced = predict_route_1b(days, miles, receipts, **r1b_enhanced)
-        route = "Route 1B (Enhanced)"
-    elif miles_per_day < 100 and receipt_to_mile > 5:
-        pred_enhanced = predict_route_2(days, miles, receipts, **r2_enhanced)
-        route = "Route 2 (Enhanced)"
+            grid[name] = [float(v) for v in values.split(',')]
+    return grid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=1, help='processes for large searches')
+    parser.add_argument('--span', type=float, default=SEARCH_SPAN,
+                        help='search range as a fraction of each current value')
+    sub = parser.add_subparsers(dest='mode', required=True)
+    sub.add_parser('list', help='list tunable parameters and their current values')
+    sub.add_parser('current', help='score the current parameters')
+    grid = sub.add_parser('grid', help='exhaustive grid search')
+    grid.add_argument('--grid', nargs='+', required=True, metavar='NAME=LOW:HIGH:POINTS|V1,V2,...')
+    rand = sub.add_parser('random', help='uniform random search')
+    rand.add_argument('--samples', type=int, default=10_000)
+    rand.add_argument('--seed', type=int, default=0)
+    rand.add_argument('--params', nargs='*', default=[], help='names or route prefixes (default: all)')
+    descent = sub.add_parser('descent', help='coordinate descent from the current parameters')
+    descent.add_argument('--rounds', type=int, default=4)
+    descent.add_argument('--points', type=int, default=41)
+    descent.add_argument('--params', nargs='*', default=[], help='names or route prefixes (default: all)')
+    args = parser.parse_args(argv)
+
+    current = current_parameters()
+    if args.mode == 'list':
+        for name, value in current.items():
+            print(f"{name:40} {value:g}")
+        return 0
+
+    start = time.perf_counter()
+    days, miles, receipts, expected = load_public_cases()
+    evaluator = RouteEvaluator(days, miles, receipts, expected,
+                               normal_route_predictions(days, miles, receipts))
+    setup = time.perf_counter() - start
+    current_score = float(evaluator.scores({name: [value] for name, value in current.items()})[0])
+
+    start = time.perf_counter()
+    if args.mode == 'current':
+        best, best_score, evaluated = {}, current_score, 1
+    elif args.mode == 'grid':
+        best, best_score, evaluated = grid_search(evaluator, _parse_grid(args.grid), args.workers)
+    elif args.mode == 'random':
+        best, best_score, evaluated = random_search(evaluator, select_parameters(args.params),
+                                                    args.samples, args.workers, args.seed, args.span)
+    else:
+        best, best_score, evaluated = coordinate_descent(evaluator, select_parameters(args.params),
+                                                         args.rounds, args.points, args.workers, args.span)
+    elapsed = time.perf_counter() - start
+
+    print(f"Scored {evaluated:,} settings on {len(days)} cases in {elapsed:.2f}s "
+          f"({evaluated / max(elapsed, 1e-9):,.0f}/s; setup {setup:.2f}s)")
+    print(f"Current score: {current_score:.2f}")
+    print(f"Best score:    {best_score:.2f}")
+    changed = {name: value for name, value in best.items() if not np.isclose(value, current[name])}
+    if best_score < current_score and changed:
+        print("Changed parameters:")
+        for name, value in changed.items():
+            print(f"  {name:40} {current[name]:g} -> {value:.6g}")
     else:
-        pred_enhanced = expected  # placeholder
-        route = "Route 3"
-    
-    error_enhanced = calculate_error(pred_enhanced, expected)
-    
-    print(f"\n{case['note']}")
-    print(f"Case: {days}d, {miles}mi, ${receipts:.0f} → Expected: ${expected:.0f}")
-    print(f"Enhanced Prediction: ${pred_enhanced:.0f} ({route})")
-    print(f"Error: {error_enhanced:.1f}%")
-    status = "✅ Excellent" if error_enhanced < 10 else "👍 Good" if error_enhanced < 20 else "⚠️ Needs work"
-    print(f"Status: {status}") 
\ No newline at end of file
+        print("No setting beat the current parameters")
+        best = {}
+
+    import evaluate
+    metrics = exact_eval_score(evaluator, {**current, **best})
+    print(f"\neval.sh metrics for the {'best' if best else 'current'} parameters:")
+    print(evaluate.format_report(metrics))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
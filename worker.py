@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""Long-lived prediction worker so run.sh stops paying the model-load cost per call.
+
+One process loads the EnsemblePredictor once and answers JSON-lines requests,
+either over a local Unix socket or over stdin/stdout:
+
+    python worker.py serve                  # Unix socket server
+    python worker.py stdio                  # JSON lines on stdin -> stdout
+    python worker.py client 5 250 150.75    # thin client used by run.sh
+    python worker.py stop                   # shut the socket server down
+    python worker.py check                  # client fallback when no worker can be reached
+
+Requests are one JSON object per line:
+    {"days": 5, "miles": 250, "receipts": 150.75}          -> {"result": 487.25...}
+    {"days": [...], "miles": [...], "receipts": [...]}     -> {"results": [...]}
+    {"command": "ping"} / {"command": "stats"} / {"command": "metrics"} / {"command": "shutdown"}
+Failures are reported as {"error": "..."} and never kill the worker.
+
+REIMBURSE_CACHE puts a prediction cache in front of predict() (see
+prediction_cache.py) and REIMBURSE_GRID a precomputed lookup grid (see
+lookup_grid.py); "stats" reports their hit/miss counters. REIMBURSE_FAST=1
+serves the ML route from the distilled surrogate (see distill.py).
+REIMBURSE_CASCADE=1 answers ML-route cases from cheap bounds when they are
+exact, =<dollars> also from estimates calibrated to that tolerance (see
+cascade.py); "stats" reports how often each tier answered.
+REIMBURSE_METRICS=1 enables route/stage instrumentation (see
+instrumentation.py); "metrics" returns a JSON snapshot, or Prometheus text
+with {"command": "metrics", "format": "prometheus"}. REIMBURSE_METRICS=<path>
+(relative to the checkout) also rewrites that Prometheus textfile every
+METRICS_INTERVAL seconds.
+
+predictor_from_env() is the one place these variables are read; run.sh's
+one-shot path, the client's in-process fallback and service.py use it too.
+The default socket name carries a fingerprint of the REIMBURSE_* settings,
+the model checksum and the code, so a client whose settings differ, or that
+runs after retraining or a code change, starts its own fresh worker instead
+of being answered by an old one (which exits once idle).
+
+The client only imports the standard library; the heavy ML stack is imported
+by the worker process alone.
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_IDLE_TIMEOUT = 900  # seconds without requests before the worker exits
+STARTUP_TIMEOUT = 60  # seconds the client waits for a freshly spawned worker
+METRICS_INTERVAL = 15  # seconds between Prometheus textfile writes
+
+# Environment variables that change what a predictor answers
+CONFIG_VARIABLES = ('REIMBURSE_CACHE', 'REIMBURSE_GRID', 'REIMBURSE_GRID_MODE', 'REIMBURSE_GRID_TOLERANCE',
+                    'REIMBURSE_FAST', 'REIMBURSE_CASCADE', 'REIMBURSE_METRICS')
+# Modules a worker runs besides prediction_cache.CODE_FILES
+WORKER_FILES = ('worker.py', 'prediction_cache.py', 'model_bundle.py', 'lookup_grid.py',
+                'instrumentation.py')
+
+
+def _enabled(environ, name):
+    return environ.get(name, '') not in ('', '0')
+
+
+def predictor_from_env(environ=None, **kwargs):
+    """EnsemblePredictor configured by the REIMBURSE_* variables (see the module docstring).
+
+    Optional parts are only imported when their variable is set, which keeps
+    the one-shot rule routes light. kwargs go to EnsemblePredictor.
+    """
+    environ = os.environ if environ is None else environ
+    from ensemble import EnsemblePredictor
+    predictor = EnsemblePredictor(fast=_enabled(environ, 'REIMBURSE_FAST'), **kwargs)
+    if _enabled(environ, 'REIMBURSE_CACHE'):
+        from prediction_cache import cache_from_env
+        predictor.cache = cache_from_env(environ)
+    if _enabled(environ, 'REIMBURSE_GRID'):
+        from lookup_grid import grid_from_env
+        predictor.grid = grid_from_env(environ)
+    if _enabled(environ, 'REIMBURSE_CASCADE'):
+        from cascade import cascade_from_env
+        predictor.cascade = cascade_from_env(environ)
+    if _enabled(environ, 'REIMBURSE_METRICS'):
+        from instrumentation import metrics_from_env
+        predictor.metrics = metrics_from_env(environ)
+    return predictor
+
+
+def worker_fingerprint(environ=None):
+    """Hash of what a worker's answers depend on: settings, model checksum and code"""
+    import prediction_cache
+    from ensemble import BUNDLE_FILE, SURROGATE_FILE
+
+    environ = os.environ if environ is None else environ
+    digest = hashlib.sha256()
+    for name in CONFIG_VARIABLES:
+        digest.update(f'{name}={environ.get(name, "")}\n'.encode())
+    digest.update(prediction_cache.model_fingerprint(os.path.join(REPO_DIR, BUNDLE_FILE)).encode())
+    digest.update(prediction_cache.code_fingerprint().encode())
+    # Files only read at start-up: a rewrite changes their size or mtime
+    files = list(WORKER_FILES) + [SURROGATE_FILE, environ.get('REIMBURSE_GRID', '')]
+    for name in files:
+        try:
+            stat = os.stat(os.path.join(REPO_DIR, name))
+        except OSError:
+            continue
+        digest.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+
+def default_socket_path():
+    """Per-user, per-checkout, per-configuration socket path (overridable with REIMBURSE_WORKER_SOCKET)"""
+    path = os.environ.get('REIMBURSE_WORKER_SOCKET')
+    if path:
+        return path
+    checkout = hashlib.sha1(REPO_DIR.encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(),
+                        f'travel-reimburse-{os.getuid()}-{checkout}-{worker_fingerprint()[:12]}.sock')
+
+
+def handle_request(predictor, request):
+    """Answer a single decoded request; returns the response object"""
+    command = request.get('command')
+    if command == 'ping':
+        return {'ok': True, 'pid': os.getpid()}
+    if command == 'stats':
+        return {'cache': predictor.cache.stats() if predictor.cache is not None else None,
+                'grid': predictor.grid.stats() if predictor.grid is not None else None,
+                'surrogate': predictor.surrogate_status,
+                'cascade': predictor.cascade.stats() if predictor.cascade is not None else None}
+    if command == 'metrics':
+        if predictor.metrics is None:
+            return {'error': 'metrics are disabled (set REIMBURSE_METRICS)'}
+        if request.get('format') == 'prometheus':
+            return {'prometheus': predictor.metrics.to_prometheus()}
+        return {'metrics': predictor.metrics.snapshot()}
+    if command is not None:
+        return {'error': f'unknown command: {command}'}
+
+    days, miles, receipts = request['days'], request['miles'], request['receipts']
+    if isinstance(days, list):
+        results = predictor.predict_batch(days, miles, receipts)
+        return {'results': [float(r) for r in results]}
+    return {'result': float(predictor.predict(float(days), float(miles), float(receipts)))}
+
+
+def _respond(predictor, line):
+    try:
+        request = json.loads(line)
+        response = handle_request(predictor, request)
+    except Exception as e:
+        response = {'error': f'{type(e).__name__}: {e}'}
+    return json.dumps(response) + '\n'
+
+
+def load_predictor():
+    """predictor_from_env() with the models loaded up front, as long-lived servers want it"""
+    # Models are referenced relative to the repo, whatever the caller's cwd
+    os.chdir(REPO_DIR)
+    return predictor_from_env(compiled=True, lazy=False)
+
+
+def serve_stdio(stdin=sys.stdin, stdout=sys.stdout):
+    """Serve JSON-lines requests from a pipe until EOF"""
+    predictor = load_predictor()
+    for line in stdin:
+        if not line.strip():
+            continue
+        stdout.write(_respond(predictor, line))
+        stdout.flush()
+
+
+class _WorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, predictor):
+        self.predictor = predictor
+        self.last_activity = time.monotonic()
+        super().__init__(path, _RequestHandler)
+
+
+def _is_shutdown(line):
+    try:
+        return json.loads(line).get('command') == 'shutdown'
+    except (ValueError, AttributeError):
+        return False
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.server.last_activity = time.monotonic()
+            if _is_shutdown(line):
+                self.wfile.write(b'{"ok": true}\n')
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            self.wfile.write(_respond(self.server.predictor, line).encode())
+
+
+def serve_socket(path=None, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Serve JSON-lines requests over a Unix socket until idle or told to stop"""
+    path = path or default_socket_path()
+    predictor = load_predictor()
+    if os.path.exists(path):
+        os.unlink(path)
+    server = _WorkerServer(path, predictor)
+
+    def watch_idle():
+        while True:
+            time.sleep(min(idle_timeout, 5))
+            if time.monotonic() - server.last_activity > idle_timeout:
+                server.shutdown()
+                return
+
+    if idle_timeout > 0:
+        threading.Thread(target=watch_idle, daemon=True).start()
+
+    textfile = os.environ.get('REIMBURSE_METRICS', '')
+    if predictor.metrics is not None and textfile not in ('', '0', '1'):
+        textfile = os.path.join(REPO_DIR, textfile)
+
+        def export_metrics():
+            while True:
+                predictor.metrics.write_prometheus(textfile)
+                time.sleep(METRICS_INTERVAL)
+
+        threading.Thread(target=export_metrics, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def _send(path, request, timeout=30):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(request) + '\n').encode())
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionError('worker closed the connection')
+            data += chunk
+    return json.loads(data)
+
+
+def _spawn_worker(path):
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), 'serve', '--socket', path],
+        cwd=REPO_DIR,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def request_worker(request, path=None):
+    """Send a request to the worker, starting one first if none is running"""
+    path = path or default_socket_path()
+    try:
+        return _send(path, request)
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass
+
+    # Serialize worker start-up so concurrent clients spawn only one worker
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            return _send(path, request)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if os.path.exists(path):
+                os.unlink(path)  # stale socket left by a killed worker
+            worker = _spawn_worker(path)
+
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                return _send(path, request)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if worker.poll() is not None or time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+
+def run_client(days, miles, receipts, path=None):
+    """run.sh contract: print the reimbursement for one case with two decimals"""
+    request = {'days': float(days), 'miles': float(miles), 'receipts': float(receipts)}
+    try:
+        response = request_worker(request, path)
+    except OSError:
+        # No worker could be reached: answer in-process like the one-shot run.sh
+        os.chdir(REPO_DIR)
+        response = {'result': predictor_from_env().predict(*request.values())}
+    if 'error' in response:
+        print(response['error'], file=sys.stderr)
+        return 1
+    print(f"{response['result']:.2f}")
+    return 0
+
+
+def check_fallback(cases=((5, 250, 150.75), (1, 55, 3.6), (8, 795, 1645.99))):
+    """Run the client against a socket in a missing directory, so no worker can start.
+
+    Returns the cases whose printed output differs from predict().
+    """
+    import contextlib
+    import io
+
+    missing = os.path.join(tempfile.mkdtemp(), 'missing', 'worker.sock')
+    predictor = predictor_from_env()
+    differing = []
+    for days, miles, receipts in cases:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            status = run_client(days, miles, receipts, missing)
+        expected = f"{predictor.predict(float(days), float(miles), float(receipts)):.2f}"
+        if status != 0 or out.getvalue().strip() != expected:
+            differing.append(((days, miles, receipts), out.getvalue().strip(), expected))
+    return differing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='mode', required=True)
+
+    serve = sub.add_parser('serve', help='serve requests over a Unix socket')
+    serve.add_argument('--socket', default=None)
+    serve.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                       help='exit after this many idle seconds (0 = never)')
+
+    sub.add_parser('stdio', help='serve JSON lines on stdin/stdout')
+
+    client = sub.add_parser('client', help='score one case through the worker')
+    client.add_argument('days')
+    client.add_argument('miles')
+    client.add_argument('receipts')
+    client.add_argument('--socket', default=None)
+
+    stop = sub.add_parser('stop', help='shut down a running socket worker')
+    stop.add_argument('--socket', default=None)
+
+    sub.add_parser('check', help='check the in-process fallback of the client')
+
+    args = parser.parse_args(argv)
+    if args.mode == 'serve':
+        serve_socket(args.socket, args.idle_timeout)
+    elif args.mode == 'stdio':
+        serve_stdio()
+    elif args.mode == 'client':
+        return run_client(args.days, args.miles, args.receipts, args.socket)
+    elif args.mode == 'check':
+        differing = check_fallback()
+        if differing:
+            raise SystemExit(f"Client fallback differs from predict(): {differing}")
+        print("Client fallback answers like predict() when no worker can be reached")
+    elif args.mode == 'stop':
+        try:
+            _send(args.socket or default_socket_path(), {'command': 'shutdown'})
+        except (FileNotFoundError, ConnectionRefusedError):
+            print('No worker running')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())